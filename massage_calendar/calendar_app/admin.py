@@ -1,3 +1,22 @@
 from django.contrib import admin
+from .models import Availability, WeeklyAvailability, AvailabilityException
 
-# Register your models here.
+
+@admin.register(Availability)
+class AvailabilityAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'date', 'start_time', 'end_time')
+    list_filter = ('employee',)
+    date_hierarchy = 'date'
+
+
+@admin.register(WeeklyAvailability)
+class WeeklyAvailabilityAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'weekday', 'start_time', 'end_time', 'valid_from', 'valid_to')
+    list_filter = ('employee', 'weekday')
+
+
+@admin.register(AvailabilityException)
+class AvailabilityExceptionAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'date', 'start_time', 'end_time', 'reason')
+    list_filter = ('employee',)
+    date_hierarchy = 'date'
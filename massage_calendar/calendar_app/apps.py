@@ -3,3 +3,12 @@ from django.apps import AppConfig
 class CalendarAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'calendar_app'
+
+    def ready(self):
+        from studio_massage_calendar import metrics
+        from . import cache, signals  # noqa: F401
+
+        metrics.register_collector(cache.metric_counters, {
+            'calendar_free_intervals_cache_hits_total': 'Free interval cache hits.',
+            'calendar_free_intervals_cache_misses_total': 'Free interval cache misses.',
+        })
@@ -0,0 +1,194 @@
+"""
+Set-based availability editing.
+
+Each operation changes a date range for several employees with a handful of
+bulk statements in one transaction instead of one save per row:
+
+- `block_out` adds `AvailabilityException` rows, e.g. for a vacation,
+- `limit_hours` narrows the working hours on some weekdays, e.g. every
+  Friday of a quarter, by replacing the days' one-off `Availability` rows
+  with the clipped windows (weekly rules are left untouched, since one-off
+  rows override them),
+- `copy_week` repeats the working windows of one week over the following
+  weeks as one-off rows.
+
+Deletes still send one signal per row, so changes are collected with
+`collect_days_changed` and the data derived from the range is refreshed
+once. Existing appointments are never touched; the scheduled ones that no
+longer fit the new availability are reported as conflicts for a manager to
+resolve. With `dry_run` the changes are rolled
+back after the conflicts have been computed.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Appointment, Availability, AvailabilityException
+from .signals import collect_days_changed, days_changed
+from .slots import (date_range, expand_windows, from_minutes, load_windows, to_minutes,
+                    window_rows)
+
+COPIED_REASON = 'No hours in the copied week'
+LIMITED_REASON = 'Outside the limited hours'
+
+
+def _working_windows(employee_ids, start_date, end_date):
+    """
+    Expand one-off availabilities and weekly rules without cutting out
+    exceptions, i.e. the hours an employee works when not blocked out.
+    """
+    overrides, rules, _ = window_rows(employee_ids, start_date, end_date)
+    return expand_windows(employee_ids, start_date, end_date, overrides, rules, [])
+
+
+def conflicts(employee_ids, start_date, end_date):
+    """
+    Return the scheduled appointments in the range that do not lie within
+    one availability window of their day.
+    """
+    windows = load_windows(employee_ids, start_date, end_date)
+    result = []
+    for appointment_id, employee_id, date, time, end_time, user_id in Appointment.objects.filter(
+        employee_id__in=employee_ids,
+        date__gte=start_date,
+        date__lte=end_date,
+        status='scheduled'
+    ).order_by('date', 'time', 'id').values_list('id', 'employee_id', 'date', 'time', 'end_time', 'user_id'):
+        start, end = to_minutes(time), to_minutes(end_time)
+        if not any(low <= start and end <= high for low, high in windows.get((employee_id, date), ())):
+            result.append({
+                'id': appointment_id,
+                'employee_id': employee_id,
+                'user_id': user_id,
+                'date': date,
+                'time': time,
+                'end_time': end_time,
+            })
+    return result
+
+
+def _apply(employee_ids, start_date, end_date, dry_run, change):
+    """
+    Run `change` in a transaction, refresh the data derived from the range
+    and return its counts with the conflicts it causes.
+    """
+    with transaction.atomic():
+        with collect_days_changed():
+            result = change()
+            # Bulk inserts bypass the model signals
+            days_changed(
+                (employee_id, date) for employee_id in employee_ids for date in date_range(start_date, end_date)
+            )
+        result['conflicts'] = conflicts(employee_ids, start_date, end_date)
+        result['dry_run'] = dry_run
+        if dry_run:
+            transaction.set_rollback(True)
+    return result
+
+
+def block_out(employee_ids, start_date, end_date, start_time=None, end_time=None, reason='', dry_run=False):
+    """
+    Block out the same span (the whole day without times) on every day of
+    the range. Days already blocked out for the same span or for the whole
+    day are skipped, so repeating a request changes nothing.
+    """
+    def change():
+        blocked = {
+            (employee_id, date)
+            for employee_id, date in AvailabilityException.objects.filter(
+                Q(start_time=start_time, end_time=end_time) | Q(start_time__isnull=True),
+                employee_id__in=employee_ids,
+                date__gte=start_date,
+                date__lte=end_date
+            ).values_list('employee_id', 'date')
+        }
+        created = AvailabilityException.objects.bulk_create([
+            AvailabilityException(employee_id=employee_id, date=date, start_time=start_time,
+                                  end_time=end_time, reason=reason)
+            for employee_id in employee_ids
+            for date in date_range(start_date, end_date)
+            if (employee_id, date) not in blocked
+        ])
+        return {'created': len(created), 'deleted': 0}
+
+    return _apply(employee_ids, start_date, end_date, dry_run, change)
+
+
+def limit_hours(employee_ids, start_date, end_date, weekdays, start_time, end_time, dry_run=False):
+    """
+    Limit the working hours to `start_time`-`end_time` on the given weekdays
+    (Monday is 0) of the range. Days left without hours are blocked out.
+    """
+    low, high = to_minutes(start_time), to_minutes(end_time)
+    days = {date for date in date_range(start_date, end_date) if date.weekday() in weekdays}
+
+    def change():
+        windows = _working_windows(employee_ids, start_date, end_date)
+        rows, blocks = [], []
+        for employee_id in employee_ids:
+            for date in sorted(days):
+                if (employee_id, date) not in windows:
+                    continue
+                clipped = [
+                    (max(start, low), min(end, high))
+                    for start, end in windows[(employee_id, date)]
+                    if max(start, low) < min(end, high)
+                ]
+                rows.extend(
+                    Availability(employee_id=employee_id, date=date,
+                                 start_time=from_minutes(start), end_time=from_minutes(end))
+                    for start, end in sorted(set(clipped))
+                )
+                if not clipped:
+                    blocks.append(AvailabilityException(employee_id=employee_id, date=date,
+                                                        reason=LIMITED_REASON))
+        deleted, _ = Availability.objects.filter(employee_id__in=employee_ids, date__in=days).delete()
+        # Blocks left by an earlier, narrower limit
+        AvailabilityException.objects.filter(
+            employee_id__in=employee_ids, date__in=days, reason=LIMITED_REASON
+        ).delete()
+        created = Availability.objects.bulk_create(rows)
+        AvailabilityException.objects.bulk_create(blocks)
+        return {'created': len(created) + len(blocks), 'deleted': deleted}
+
+    return _apply(employee_ids, start_date, end_date, dry_run, change)
+
+
+def copy_week(employee_ids, source_start, weeks, dry_run=False):
+    """
+    Copy the working windows of the 7 days starting at `source_start` to
+    each of the following `weeks` weeks. Target days the source week has no
+    hours on are blocked out, so the copy matches whatever the weekly rules
+    say.
+    """
+    source_end = source_start + timedelta(days=6)
+    start_date = source_start + timedelta(days=7)
+    end_date = source_start + timedelta(days=7 * (weeks + 1) - 1)
+
+    def change():
+        windows = _working_windows(employee_ids, source_start, source_end)
+        rows, blocks = [], []
+        for employee_id in employee_ids:
+            for date in date_range(start_date, end_date):
+                source = source_start + timedelta(days=(date - source_start).days % 7)
+                day = windows.get((employee_id, source))
+                if not day:
+                    blocks.append(AvailabilityException(employee_id=employee_id, date=date, reason=COPIED_REASON))
+                rows.extend(
+                    Availability(employee_id=employee_id, date=date,
+                                 start_time=from_minutes(start), end_time=from_minutes(end))
+                    for start, end in sorted(set(day or ()))
+                )
+        deleted, _ = Availability.objects.filter(
+            employee_id__in=employee_ids, date__gte=start_date, date__lte=end_date
+        ).delete()
+        # Blocks left by an earlier copy
+        AvailabilityException.objects.filter(
+            employee_id__in=employee_ids, date__gte=start_date, date__lte=end_date, reason=COPIED_REASON
+        ).delete()
+        created = Availability.objects.bulk_create(rows)
+        AvailabilityException.objects.bulk_create(blocks)
+        return {'created': len(created) + len(blocks), 'deleted': deleted}
+
+    return _apply(employee_ids, start_date, end_date, dry_run, change)
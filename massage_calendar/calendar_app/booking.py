@@ -0,0 +1,224 @@
+"""
+Transactional booking of appointments.
+
+Bookings for the same employee and day are serialized by locking that day's
+availability rows (or the weekly rules it is derived from) for the duration
+of the transaction, so two concurrent
+requests cannot both pass the overlap check in `Appointment.clean`.
+Bookings for other employees or other days are not blocked. A slot under
+another client's active `SlotHold` cannot be booked; the booking client's
+own holds on the slot are consumed by the booking.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Appointment, Availability, Employee, Service, SlotHold, WeeklyAvailability
+from .signals import appointments_booked, collect_days_changed, days_changed
+from .slots import load_windows, to_minutes
+
+
+class BatchValidationError(ValidationError):
+    """
+    Raised by `book_appointments` with `{index: [messages]}` for every
+    requested appointment that cannot be booked.
+    """
+    def __init__(self, item_errors):
+        self.item_errors = item_errors
+        super().__init__('Some appointments could not be booked')
+
+
+def lock_employee_days(pairs):
+    """
+    Lock the availability rows of several `(employee_id, date)` days until
+    the end of the current transaction.
+
+    Uses SELECT ... FOR UPDATE on the days' one-off availabilities and on the
+    weekly rules for their weekdays, where the backend supports it. Rows are
+    locked in id order so concurrent batches cannot deadlock. SQLite ignores
+    row locks, so there a no-op UPDATE is issued instead to take the write
+    lock up front rather than failing on the lock upgrade at insert time.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    availabilities = Availability.objects.filter(
+        reduce(or_, (Q(employee_id=employee_id, date=date) for employee_id, date in pairs))
+    )
+    if connection.features.has_select_for_update:
+        list(availabilities.select_for_update().order_by('id').values_list('id', flat=True))
+        weekdays = {(employee_id, date.weekday()) for employee_id, date in pairs}
+        list(WeeklyAvailability.objects.select_for_update().filter(
+            reduce(or_, (Q(employee_id=employee_id, weekday=weekday) for employee_id, weekday in weekdays))
+        ).order_by('id').values_list('id', flat=True))
+    else:
+        availabilities.update(start_time=F('start_time'))
+
+
+def lock_employee_day(employee_id, date):
+    """
+    Lock the availability rows of an employee's day until the end of the
+    current transaction.
+    """
+    lock_employee_days([(employee_id, date)])
+
+
+def check_holds(user_id, appointments):
+    """
+    Check `{index: appointment}` about to be booked by a user against the
+    slot holds on their days.
+
+    Returns the indexes overlapping another client's active hold and the ids
+    of the user's own holds overlapping any of the appointments, which the
+    booking consumes. Must run with the days locked.
+    """
+    spans = defaultdict(list)
+    for index, appointment in appointments.items():
+        spans[(appointment.employee_id, appointment.date)].append(
+            (index, appointment.time, appointment.end_time)
+        )
+    held, own = set(), set()
+    now = timezone.now()
+    for hold_id, hold_user_id, employee_id, date, start, end, expires_at in SlotHold.objects.filter(
+            reduce(or_, (Q(employee_id=employee_id, date=date) for employee_id, date in spans))
+    ).values_list('id', 'user_id', 'employee_id', 'date', 'time', 'end_time', 'expires_at'):
+        for index, other_start, other_end in spans[(employee_id, date)]:
+            if not (start < other_end and other_start < end):
+                continue
+            if hold_user_id == user_id:
+                own.add(hold_id)
+            elif expires_at > now:
+                held.add(index)
+    return held, own
+
+
+def book_appointment(**fields):
+    """
+    Validate and create an appointment atomically.
+
+    The employee's day is locked before validation, so the overlap check and
+    the insert see the same set of appointments. Raises
+    `django.core.exceptions.ValidationError` without saving anything when the
+    appointment is not valid.
+    """
+    with transaction.atomic():
+        lock_employee_day(fields['employee'].id, fields['date'])
+        appointment = Appointment(**fields)
+        # Related objects are passed in as instances, so skip re-querying them
+        appointment.full_clean(exclude=['user', 'service', 'employee'])
+        held, own = check_holds(appointment.user_id, {0: appointment})
+        if held:
+            raise ValidationError("This time slot is held by another client")
+        if own:
+            # The held span may be longer than the appointment, so the day is
+            # recomputed in full rather than updated for the booking alone
+            with collect_days_changed():
+                SlotHold.objects.filter(id__in=own).delete()
+                appointment.save()
+                days_changed({(appointment.employee_id, appointment.date)})
+        else:
+            appointment.save()
+    return appointment
+
+
+def book_appointments(user, items):
+    """
+    Validate and create several appointments of one user all-or-nothing.
+
+    `items` are dicts with `service` and `employee` ids, `date`, `time` and
+    optional `notes`. All items are validated together against the data
+    loaded in one pass (services, employees, expanded availability windows
+    and scheduled appointments of the affected employees and dates) and
+    against each other, then inserted with a single `bulk_create`. Applies
+    the same rules as `Appointment.clean` and honors slot holds like
+    `book_appointment`. Raises `BatchValidationError` without saving
+    anything when any item is invalid.
+    """
+    errors = defaultdict(list)
+    services = Service.objects.in_bulk({item['service'] for item in items})
+    employees = Employee.objects.in_bulk({item['employee'] for item in items})
+    now = timezone.now()
+
+    appointments = {}
+    for index, item in enumerate(items):
+        service = services.get(item['service'])
+        employee = employees.get(item['employee'])
+        if service is None:
+            errors[index].append('Invalid service')
+        if employee is None:
+            errors[index].append('Invalid employee')
+        if service is None or employee is None:
+            continue
+        start = datetime.combine(item['date'], item['time'])
+        end = start + timedelta(minutes=service.duration)
+        if timezone.make_aware(start) < now:
+            errors[index].append('Cannot create appointments in the past')
+        elif end.date() != start.date():
+            errors[index].append('Appointment must end on the same day')
+        else:
+            appointments[index] = Appointment(
+                user=user, service=service, employee=employee,
+                date=item['date'], time=item['time'], notes=item.get('notes'),
+                duration=service.duration, end_time=end.time()
+            )
+
+    if appointments:
+        days = {(appointment.employee_id, appointment.date) for appointment in appointments.values()}
+        first_day = min(date for _, date in days)
+        last_day = max(date for _, date in days)
+        employee_ids = {employee_id for employee_id, _ in days}
+    else:
+        days = set()
+
+    with transaction.atomic():
+        if appointments:
+            lock_employee_days(days)
+            windows = load_windows(employee_ids, first_day, last_day)
+            held, own = check_holds(user.id, appointments)
+            busy = defaultdict(list)
+            for employee_id, date, start, end in Appointment.objects.filter(
+                    employee_id__in=employee_ids,
+                    date__gte=first_day,
+                    date__lte=last_day,
+                    status='scheduled'
+            ).values_list('employee_id', 'date', 'time', 'end_time'):
+                busy[(employee_id, date)].append((to_minutes(start), to_minutes(end)))
+
+            # Requested appointments already accepted, per day, with their index
+            requested = defaultdict(list)
+            for index, appointment in appointments.items():
+                key = (appointment.employee_id, appointment.date)
+                start, end = to_minutes(appointment.time), to_minutes(appointment.end_time)
+                if not any(window_start <= start and end <= window_end
+                           for window_start, window_end in windows.get(key, ())):
+                    errors[index].append('Employee is not available for the entire service duration')
+                elif any(start < busy_end and busy_start < end for busy_start, busy_end in busy[key]):
+                    errors[index].append('This time slot conflicts with an existing appointment')
+                elif index in held:
+                    errors[index].append('This time slot is held by another client')
+                else:
+                    for other, other_start, other_end in requested[key]:
+                        if start < other_end and other_start < end:
+                            errors[index].append(
+                                f'This time slot conflicts with appointment {other} of this request'
+                            )
+                            break
+                    else:
+                        requested[key].append((index, start, end))
+
+        if errors:
+            raise BatchValidationError(dict(sorted(errors.items())))
+        created = Appointment.objects.bulk_create([appointments[index] for index in sorted(appointments)])
+        # bulk_create bypasses the post_save signals that keep derived data in sync
+        if appointments and own:
+            SlotHold.objects.filter(id__in=own).delete()
+            days_changed(days)
+        else:
+            appointments_booked(created)
+    return created
@@ -0,0 +1,150 @@
+"""
+Cache for computed per-employee, per-day free intervals.
+
+Entries are stored in Django's cache framework under a key built from the
+employee id and the date. They are invalidated by the signal handlers in
+`calendar_app.signals` whenever an availability or appointment for that day
+changes, and once more when the write commits, so a cached entry is always
+safe to serve until it expires.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+KEY_PREFIX = 'calendar:free'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache():
+    return caches[getattr(settings, 'CALENDAR_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'CALENDAR_FREE_INTERVALS_TIMEOUT', 3600)
+
+
+def day_key(employee_id, date):
+    """
+    Build the cache key for an employee's free intervals on a given day.
+    """
+    return f'{KEY_PREFIX}:{employee_id}:{date.isoformat()}'
+
+
+def _record(hits, misses):
+    with _stats_lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+
+
+def get_day(employee_id, date):
+    """
+    Return the cached free intervals for a day, or None on a miss.
+    """
+    value = _cache().get(day_key(employee_id, date))
+    if value is None:
+        _record(0, 1)
+    else:
+        _record(1, 0)
+    return value
+
+
+def set_day(employee_id, date, free_intervals):
+    """
+    Store the free intervals computed for a day.
+    """
+    _cache().set(day_key(employee_id, date), free_intervals, _timeout())
+
+
+def get_days(pairs):
+    """
+    Return `{(employee_id, date): free_intervals}` for the cached pairs.
+    Pairs missing from the result have to be computed by the caller.
+    """
+    keys = {day_key(employee_id, date): (employee_id, date) for employee_id, date in pairs}
+    found = _cache().get_many(list(keys))
+    _record(len(found), len(keys) - len(found))
+    return {keys[key]: value for key, value in found.items()}
+
+
+def set_days(values):
+    """
+    Store several `{(employee_id, date): free_intervals}` entries at once.
+    """
+    _cache().set_many(
+        {day_key(employee_id, date): value for (employee_id, date), value in values.items()},
+        _timeout()
+    )
+
+
+async def aget_days(pairs):
+    """
+    Async version of `get_days`.
+    """
+    keys = {day_key(employee_id, date): (employee_id, date) for employee_id, date in pairs}
+    found = await _cache().aget_many(list(keys))
+    _record(len(found), len(keys) - len(found))
+    return {keys[key]: value for key, value in found.items()}
+
+
+async def aset_days(values):
+    """
+    Async version of `set_days`.
+    """
+    await _cache().aset_many(
+        {day_key(employee_id, date): value for (employee_id, date), value in values.items()},
+        _timeout()
+    )
+
+
+def invalidate_days(pairs):
+    """
+    Drop the cached free intervals for the given `(employee_id, date)` pairs.
+
+    Inside a transaction the entries are dropped again once it commits: a
+    request reading the days in between still sees the rows committed before
+    the write and may have cached them.
+    """
+    keys = [day_key(employee_id, date) for employee_id, date in pairs if date is not None]
+    if keys:
+        _cache().delete_many(keys)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+def stats():
+    """
+    Return the hit/miss counters of the current process.
+    """
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def metric_counters():
+    """
+    Return the hit/miss counters in the form expected by
+    `studio_massage_calendar.metrics.register_collector`.
+    """
+    with _stats_lock:
+        return {
+            ('calendar_free_intervals_cache_hits_total', ()): _stats['hits'],
+            ('calendar_free_intervals_cache_misses_total', ()): _stats['misses'],
+        }
+
+
+def reset_stats():
+    """
+    Reset the hit/miss counters of the current process.
+    """
+    with _stats_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
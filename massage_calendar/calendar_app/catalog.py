@@ -0,0 +1,73 @@
+"""
+Pre-rendered service and employee catalog.
+
+The catalog changes a few times a month but is read on every page load, so
+each variant of it is rendered to JSON bytes once and stored in the cache
+under the current catalog version. The version is a token shared by all
+processes (see `studio_massage_calendar.versions`) and replaced by the signal
+handlers in `calendar_app.signals` after every change to a service, an
+employee or the services an employee offers, so every process serves the new
+catalog within SHARED_VERSION_SYNC_INTERVAL seconds. The ETag is derived from
+the version alone, so a matching If-None-Match is answered without rendering
+anything or touching the database.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from studio_massage_calendar import versions
+
+VERSION_KEY = 'calendar:catalog:version'
+KEY_PREFIX = 'calendar:catalog'
+
+
+def _cache():
+    return caches[getattr(settings, 'CALENDAR_CACHE_ALIAS', 'default')]
+
+
+def get_version():
+    """
+    Return the current catalog version.
+    """
+    return versions.get(VERSION_KEY)
+
+
+def bump_version():
+    """
+    Start a new catalog version once the current transaction commits, so no
+    request can render uncommitted data under the new version.
+    """
+    transaction.on_commit(lambda: versions.replace(VERSION_KEY))
+
+
+def make_etag(version, variant):
+    return '"%s"' % hashlib.sha256(f'{version}:{variant}'.encode()).hexdigest()[:32]
+
+
+def catalog_response(request, variant, build):
+    """
+    Serve one catalog variant. `build` returns the data to render and is
+    only called when the variant is not cached for the current version.
+    """
+    version = get_version()
+    etag = make_etag(version, variant)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f"private, max-age={getattr(settings, 'CATALOG_MAX_AGE', 0)}, must-revalidate",
+    }
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        return HttpResponseNotModified(headers=headers)
+
+    key = f'{KEY_PREFIX}:{version}:{variant}'
+    body = _cache().get(key)
+    if body is None:
+        body = JSONRenderer().render(build())
+        _cache().set(key, body, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 24 * 60 * 60))
+    return HttpResponse(body, content_type='application/json', headers=headers)
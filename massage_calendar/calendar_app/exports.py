@@ -0,0 +1,65 @@
+"""
+Streaming exports of appointments.
+
+Rows are read with `iterator(chunk_size=...)` as plain tuples and written out
+as they arrive, so memory use stays flat regardless of how many appointments
+are exported.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = (
+    ('id', 'id'),
+    ('date', 'date'),
+    ('time', 'time'),
+    ('end_time', 'end_time'),
+    ('status', 'status'),
+    ('service', 'service_id'),
+    ('service_name', 'service__name'),
+    ('employee', 'employee_id'),
+    ('employee_name', 'employee__name'),
+    ('user', 'user_id'),
+    ('user_name', 'user__username'),
+    ('notes', 'notes'),
+)
+
+
+def _rows(queryset):
+    return queryset.order_by('date', 'time', 'id').values_list(
+        *(lookup for _, lookup in EXPORT_FIELDS)
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """
+    File-like object handing back whatever is written to it, so csv.writer
+    can produce lines for a generator.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset):
+    """
+    Yield the appointments of `queryset` as CSV lines, header first.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in EXPORT_FIELDS])
+    for row in _rows(queryset):
+        yield writer.writerow(row)
+
+
+def stream_json(queryset):
+    """
+    Yield the appointments of `queryset` as chunks of one JSON array.
+    """
+    names = [name for name, _ in EXPORT_FIELDS]
+    separator = '['
+    for row in _rows(queryset):
+        yield separator + json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
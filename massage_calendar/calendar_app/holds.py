@@ -0,0 +1,96 @@
+"""
+Short-lived slot holds.
+
+A client checking out places a `SlotHold` on a slot, which removes the slot
+from everyone else's searches and lets only that client book it until the
+hold expires after `SLOT_HOLD_SECONDS`. Holds are part of the busy time the
+slot engine loads, so placing or releasing one refreshes the derived data
+of its day like any other write (see `calendar_app.signals.days_changed`).
+
+Bookings and newly computed days ignore expired holds, but days cached or
+stored while a hold was active keep its slot out of searches until the
+`sweep_holds` command deletes the hold and refreshes them. The command must
+run about every minute (from cron, or with `--interval 60`).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .booking import check_holds, lock_employee_day, lock_employee_days
+from .models import Appointment, SlotHold
+from .signals import days_changed
+
+
+def place_hold(user_id, service, employee, date, time):
+    """
+    Hold a slot for a client.
+
+    The slot is validated like a booking (see `Appointment.clean`) with the
+    employee's day locked, and must not overlap another client's active
+    hold. Holds of the same client overlapping the slot are replaced, so
+    holding a slot again extends the hold. Raises
+    `django.core.exceptions.ValidationError` when the slot cannot be held.
+    """
+    with transaction.atomic():
+        lock_employee_day(employee.id, date)
+        appointment = Appointment(user_id=user_id, service=service, employee=employee, date=date, time=time)
+        appointment.clean()
+        held, own = check_holds(user_id, {0: appointment})
+        if held:
+            raise ValidationError("This time slot is held by another client")
+        max_holds = getattr(settings, 'SLOT_HOLD_MAX_PER_USER', 3)
+        if SlotHold.objects.active().filter(user_id=user_id).exclude(id__in=own).count() >= max_holds:
+            raise ValidationError(f"No more than {max_holds} slots can be held at once")
+        if own:
+            SlotHold.objects.filter(id__in=own).delete()
+        hold = SlotHold.objects.create(
+            user_id=user_id, service=service, employee=employee, date=date, time=time,
+            end_time=appointment.end_time,
+            expires_at=timezone.now() + timedelta(seconds=getattr(settings, 'SLOT_HOLD_SECONDS', 300))
+        )
+        days_changed({(employee.id, date)})
+    return hold
+
+
+def release_hold(user_id, hold_id):
+    """
+    Release a client's hold before it expires. Returns False if the client
+    has no such hold.
+    """
+    with transaction.atomic():
+        day = SlotHold.objects.filter(id=hold_id, user_id=user_id).values_list('employee_id', 'date').first()
+        if day is None:
+            return False
+        lock_employee_day(*day)
+        SlotHold.objects.filter(id=hold_id).delete()
+        days_changed({day})
+    return True
+
+
+def sweep(now=None, batch_size=500):
+    """
+    Delete the holds that expired by `now` and refresh the days they were
+    on, `batch_size` holds per transaction. Returns the number deleted.
+
+    When nothing has expired this is one lookup on the `expires_at` index.
+    """
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            rows = list(SlotHold.objects.filter(expires_at__lte=now).order_by('expires_at').values_list(
+                'id', 'employee_id', 'date'
+            )[:batch_size])
+            if not rows:
+                break
+            days = {(employee_id, date) for _, employee_id, date in rows}
+            lock_employee_days(days)
+            SlotHold.objects.filter(id__in=[hold_id for hold_id, _, _ in rows]).delete()
+            days_changed(days)
+        deleted += len(rows)
+        if len(rows) < batch_size:
+            break
+    return deleted
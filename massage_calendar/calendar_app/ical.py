@@ -0,0 +1,135 @@
+"""
+iCalendar feeds of the appointments of one employee or one client.
+
+Calendar apps poll a feed URL every few minutes and cannot send a bearer
+token, so every feed URL carries a signature of the feed it opens (see
+`feed_signature`). A feed covers appointments from ICAL_FEED_PAST_DAYS ago
+onwards, cancelled ones included so clients drop them. Its ETag and
+Last-Modified come from one aggregate query over those rows (latest
+`updated_at` and row count, the count catching deletions), so an unchanged
+feed is answered with a 304 after that single query. Changed feeds are
+streamed from `iterator()` without building the whole calendar in memory.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .models import Appointment
+
+FEED_SALT = 'calendar_app.ical'
+FEED_CHUNK_SIZE = 2000
+CALENDAR_PRODID = '-//Studio Massage Calendar//Appointments//EN'
+EVENT_STATUS = {
+    'scheduled': 'CONFIRMED',
+    'completed': 'CONFIRMED',
+    'no_show': 'CONFIRMED',
+    'cancelled': 'CANCELLED',
+}
+
+
+def feed_signature(kind, object_id):
+    """
+    Return the signature authorizing the `kind` ('employee' or 'user') feed
+    of the given object.
+    """
+    return signing.Signer(salt=FEED_SALT).signature(f'{kind}:{object_id}')
+
+
+def valid_signature(kind, object_id, signature):
+    return bool(signature) and constant_time_compare(signature, feed_signature(kind, object_id))
+
+
+def feed_queryset(**filters):
+    """
+    Appointments shown in a feed, e.g. `feed_queryset(employee_id=1)`.
+    """
+    first_date = timezone.localdate() - timedelta(days=getattr(settings, 'ICAL_FEED_PAST_DAYS', 30))
+    return Appointment.objects.filter(date__gte=first_date, **filters)
+
+
+def feed_state(queryset, variant):
+    """
+    Return the `(etag, last_modified)` of a feed with one aggregate query.
+    `last_modified` is None for an empty feed.
+    """
+    state = queryset.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    last_modified = state['last_modified']
+    # The date is part of the tag because the feed window moves every day
+    value = f"{variant}:{timezone.localdate()}:{state['count']}:{last_modified and last_modified.isoformat()}"
+    etag = '"%s"' % hashlib.sha256(value.encode()).hexdigest()[:32]
+    return etag, last_modified
+
+
+def _escape(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """
+    Fold a content line to at most 75 octets per line, as RFC 5545 requires.
+    """
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _description(username, notes):
+    return f'Client: {username}' + ('\n' + notes if notes else '')
+
+
+def _utc(moment):
+    return moment.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _local(date, time):
+    return _utc(timezone.make_aware(datetime.combine(date, time)))
+
+
+def stream_feed(queryset, name, host):
+    """
+    Yield the appointments of `queryset` as an iCalendar document, one event
+    at a time.
+    """
+    yield (
+        'BEGIN:VCALENDAR\r\n'
+        'VERSION:2.0\r\n'
+        f'PRODID:{CALENDAR_PRODID}\r\n'
+        'CALSCALE:GREGORIAN\r\n'
+        'METHOD:PUBLISH\r\n'
+    ) + _fold(f'X-WR-CALNAME:{_escape(name)}')
+    rows = queryset.order_by('date', 'time', 'id').values_list(
+        'id', 'date', 'time', 'end_time', 'status', 'updated_at', 'notes',
+        'service__name', 'employee__name', 'user__username'
+    ).iterator(chunk_size=FEED_CHUNK_SIZE)
+    for (appointment_id, date, time, end_time, status, updated_at, notes,
+         service_name, employee_name, username) in rows:
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:appointment-{appointment_id}@{host}',
+            f'DTSTAMP:{_utc(updated_at)}',
+            f'LAST-MODIFIED:{_utc(updated_at)}',
+            f'DTSTART:{_local(date, time)}',
+            f'DTEND:{_local(date, end_time)}',
+            f'SUMMARY:{_escape(service_name)} - {_escape(employee_name)}',
+            f'DESCRIPTION:{_escape(_description(username, notes))}',
+            f'STATUS:{EVENT_STATUS.get(status, "CONFIRMED")}',
+            'END:VEVENT',
+        ]
+        yield ''.join(_fold(line) for line in lines)
+    yield 'END:VCALENDAR\r\n'
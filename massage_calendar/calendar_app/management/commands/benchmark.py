@@ -0,0 +1,221 @@
+import json
+import logging
+import math
+import random
+import time as timer
+import tracemalloc
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from users.models import CustomUser
+from users.tokens import ClaimsRefreshToken
+from ...models import Employee, Appointment
+from ...slots import from_minutes, get_range_free_intervals, slots_from_free_intervals
+
+SCENARIOS = ('available_slots', 'appointments', 'appointments_manager',
+             'create_appointment', 'generate_availabilities')
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    ordered = sorted(values)
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Time the hot endpoints through the Django test client against the current '
+            'database (see seed_studio) and report latency percentiles, query counts '
+            'and peak memory as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Timed runs per scenario')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f'Comma-separated scenarios (default: all of {", ".join(SCENARIOS)})')
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Clear the cache before every request')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for request parameters')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        self.rng = random.Random(options['seed'])
+        self.cold_cache = options['cold_cache']
+        self.employees = list(
+            Employee.objects.filter(active=True).prefetch_related('services')
+        )
+        self.employees = [employee for employee in self.employees if employee.services.all()]
+        self.client_user = CustomUser.objects.filter(
+            appointment__isnull=False
+        ).exclude(groups__name__iexact='Managers').first()
+        self.manager = CustomUser.objects.filter(groups__name__iexact='Managers').first()
+        if not self.employees or not self.client_user or not self.manager:
+            raise CommandError('No benchmark data found, run seed_studio first')
+
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'cold_cache': self.cold_cache,
+                'employees': len(self.employees),
+                'appointments': Appointment.objects.count(),
+                'created': timer.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'results': {},
+        }
+        if 'create_appointment' in scenarios:
+            self.free_slots = self._find_free_slots()
+
+        # Expected 4xx responses would otherwise be logged for every request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for name in scenarios:
+                    report['results'][name] = self._run(getattr(self, f'_scenario_{name}'), options['iterations'])
+        finally:
+            request_logger.setLevel(level)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Benchmark report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def _run(self, scenario, iterations):
+        """
+        Time `iterations` runs of a scenario, then run it once more under
+        tracemalloc to measure peak memory without skewing the timings.
+        """
+        latencies = []
+        queries = []
+        statuses = set()
+        for _ in range(iterations):
+            if self.cold_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = timer.perf_counter()
+                statuses.add(scenario())
+                latencies.append((timer.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+
+        tracemalloc.start()
+        scenario()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 3),
+                'p95': round(percentile(latencies, 0.95), 3),
+                'p99': round(percentile(latencies, 0.99), 3),
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'max': round(max(latencies), 3),
+            },
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 2),
+                'max': max(queries),
+            },
+            'peak_memory_kb': round(peak / 1024, 1),
+            'status_codes': sorted(statuses),
+        }
+
+    def _client(self, user):
+        token = ClaimsRefreshToken.for_user(user).access_token
+        return Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def _random_day(self):
+        return date.today() + timedelta(days=self.rng.randint(1, 14))
+
+    def _scenario_available_slots(self):
+        employee = self.rng.choice(self.employees)
+        response = self._client(self.client_user).get(reverse('available-slots'), {
+            'date': self._random_day().isoformat(),
+            'employee_id': employee.id,
+            'service_id': self.rng.choice(employee.services.all()).id,
+        })
+        return response.status_code
+
+    def _scenario_appointments(self):
+        return self._client(self.client_user).get(reverse('appointments')).status_code
+
+    def _scenario_appointments_manager(self):
+        return self._client(self.manager).get(reverse('appointments')).status_code
+
+    def _find_free_slots(self):
+        """
+        Collect bookable (employee, service, date, time) combinations for the
+        next two weeks, so the booking scenario measures successful bookings.
+        """
+        start = date.today() + timedelta(days=1)
+        free_intervals = get_range_free_intervals(
+            [employee.id for employee in self.employees], start, start + timedelta(days=13)
+        )
+        free_slots = []
+        for employee in self.employees:
+            for service in employee.services.all():
+                for (employee_id, day), intervals in free_intervals.items():
+                    if employee_id == employee.id:
+                        free_slots.extend(
+                            (employee.id, service.id, day, from_minutes(minute))
+                            for minute in slots_from_free_intervals(intervals, service.duration)
+                        )
+        if not free_slots:
+            raise CommandError('No free slots left to book, seed with a lower --density')
+        return free_slots
+
+    def _scenario_create_appointment(self):
+        """
+        Book a random free slot and roll the booking back, so repeated runs
+        see the same data.
+        """
+        employee_id, service_id, day, start = self.rng.choice(self.free_slots)
+        try:
+            with transaction.atomic():
+                response = self._client(self.client_user).post(reverse('create-appointment'), {
+                    'service': service_id,
+                    'employee': employee_id,
+                    'date': day.isoformat(),
+                    'time': start.strftime('%H:%M'),
+                })
+                raise Rollback
+        except Rollback:
+            pass
+        return response.status_code
+
+    def _scenario_generate_availabilities(self):
+        """
+        Run the generator over a fresh 30-day window far in the future and
+        roll it back. This is a management command, so it is timed through
+        call_command rather than the test client.
+        """
+        start = date.today() + timedelta(days=self.rng.randint(400, 800))
+        try:
+            with transaction.atomic():
+                call_command('generate_availabilities', start=start, end=start + timedelta(days=30),
+                             stdout=StringIO())
+                raise Rollback
+        except Rollback:
+            pass
+        return 0
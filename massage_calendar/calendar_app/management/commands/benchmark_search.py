@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import random
+import time as timer
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from users.models import CustomUser
+from users.tokens import ClaimsRefreshToken
+from ...models import Service
+from .benchmark import percentile
+
+ENDPOINTS = {
+    'sync': 'available-slots-search',
+    'async': 'available-slots-search-async',
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare the sync and async slot search endpoints under concurrent load. '
+            'Requests go through the ASGI handler in-process, as they would behind '
+            'uvicorn, against the current database (see seed_studio).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+        parser.add_argument('--days', type=int, default=7, help='Days searched per request')
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Clear the cache before every request')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for request parameters')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        service = Service.objects.filter(active=True).annotate(
+            employee_count=Count('employees')
+        ).order_by('-employee_count').first()
+        user = CustomUser.objects.filter(is_active=True).first()
+        if service is None or not service.employee_count or user is None:
+            raise CommandError('No benchmark data found, run seed_studio first')
+
+        rng = random.Random(options['seed'])
+        params = [
+            {
+                'service_id': service.id,
+                'start_date': start.isoformat(),
+                'end_date': (start + timedelta(days=options['days'] - 1)).isoformat(),
+            }
+            for start in (date.today() + timedelta(days=rng.randint(1, 14))
+                          for _ in range(options['requests']))
+        ]
+        token = str(ClaimsRefreshToken.for_user(user).access_token)
+
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'days': options['days'],
+                'cold_cache': options['cold_cache'],
+                'employees': service.employee_count,
+                'created': timer.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'results': {},
+        }
+
+        # Expected 4xx responses would otherwise be logged for every request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for name, url_name in ENDPOINTS.items():
+                    cache.clear()
+                    report['results'][name] = asyncio.run(
+                        self._load(reverse(url_name), params, token, options)
+                    )
+        finally:
+            request_logger.setLevel(level)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Benchmark report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    async def _load(self, url, params, token, options):
+        """
+        Send every request with at most `concurrency` in flight and collect
+        latencies, status codes and partial results.
+        """
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {token}'}
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        statuses = set()
+        partial = 0
+
+        async def send(query):
+            nonlocal partial
+            async with semaphore:
+                if options['cold_cache']:
+                    await cache.aclear()
+                started = timer.perf_counter()
+                response = await client.get(url, query, headers=headers)
+                latencies.append((timer.perf_counter() - started) * 1000)
+            statuses.add(response.status_code)
+            if response.status_code == 200 and response.json().get('partial'):
+                partial += 1
+
+        started = timer.perf_counter()
+        await asyncio.gather(*(send(query) for query in params))
+        elapsed = timer.perf_counter() - started
+
+        return {
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 3),
+                'p95': round(percentile(latencies, 0.95), 3),
+                'p99': round(percentile(latencies, 0.99), 3),
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'max': round(max(latencies), 3),
+            },
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'partial_responses': partial,
+            'status_codes': sorted(statuses),
+        }
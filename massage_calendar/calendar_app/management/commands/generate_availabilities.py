@@ -1,44 +1,138 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import datetime, timedelta, date, time
+import time as timer
+from argparse import ArgumentTypeError
+from datetime import datetime, timedelta, date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
 from ...models import Employee, Availability
+from ...signals import days_changed
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ArgumentTypeError(f'Invalid date "{value}", expected YYYY-MM-DD')
+
+
+def parse_hours(value):
+    """
+    Parse a "HH:MM-HH:MM" range into a (start_time, end_time) pair.
+    """
+    try:
+        start, end = (datetime.strptime(part, '%H:%M').time() for part in value.split('-'))
+    except ValueError:
+        raise ArgumentTypeError(f'Invalid hours "{value}", expected HH:MM-HH:MM')
+    if start >= end:
+        raise ArgumentTypeError(f'Invalid hours "{value}", end must be after start')
+    return start, end
+
+
+def parse_weekdays(value):
+    """
+    Parse weekdays given as "0,2,4" or "0-5" (Monday is 0) into a set.
+    """
+    weekdays = set()
+    try:
+        for part in value.split(','):
+            if '-' in part:
+                first, last = part.split('-')
+                weekdays.update(range(int(first), int(last) + 1))
+            else:
+                weekdays.add(int(part))
+    except ValueError:
+        raise ArgumentTypeError(f'Invalid weekdays "{value}"')
+    if not weekdays <= set(range(7)):
+        raise ArgumentTypeError('Weekdays must be between 0 (Monday) and 6 (Sunday)')
+    return weekdays
+
+
+def parse_employee_hours(value):
+    """
+    Parse "ID=HH:MM-HH:MM" into an (employee_id, (start_time, end_time)) pair.
+    """
+    employee_id, _, hours = value.partition('=')
+    if not employee_id.isdigit():
+        raise ArgumentTypeError(f'Invalid employee hours "{value}", expected ID=HH:MM-HH:MM')
+    return int(employee_id), parse_hours(hours)
+
 
 class Command(BaseCommand):
-    help = 'Generate availabilities for all employees'
+    help = ('Generate one-off availabilities for all employees. Rows override the '
+            'weekly availability rules for their date.')
 
     def add_arguments(self, parser):
-        parser.add_argument('days', type=int, help='Number of days to generate availabilities')
+        parser.add_argument('days', type=int, nargs='?', default=30,
+                            help='Number of days to generate availabilities')
+        parser.add_argument('--start', type=parse_date,
+                            help='First date to generate (YYYY-MM-DD, default: today)')
+        parser.add_argument('--end', type=parse_date,
+                            help='Last date to generate (YYYY-MM-DD, default: start + days)')
+        parser.add_argument('--weekdays', type=parse_weekdays, default='0-5',
+                            help='Working weekdays, Monday is 0 (default: 0-5)')
+        parser.add_argument('--hours', type=parse_hours, default='09:00-17:00',
+                            help='Default working hours (default: 09:00-17:00)')
+        parser.add_argument('--employee-hours', type=parse_employee_hours, action='append', default=[],
+                            metavar='ID=HH:MM-HH:MM',
+                            help='Working hours for a single employee, can be repeated')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows inserted per bulk_create statement and refreshed together')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the rows that would be inserted without writing them')
 
     def handle(self, *args, **options):
-        days = options['days']
-
-        # Get all active employees
-        employees = Employee.objects.filter(active=True)
-
-        start_date = date.today()
-        end_date = start_date + timedelta(days=days)
-
-        # Generate availabilities
-        for employee in employees:
-            current_date = start_date
-            while current_date <= end_date:
-                # Skip Sundays (weekday() returns 6 for Sunday)
-                if current_date.weekday() != 6:
-                    # Check if availability already exists
-                    existing_availability = Availability.objects.filter(
-                        employee=employee,
-                        date=current_date
-                    ).exists()
-
-                    if not existing_availability:
-                        Availability.objects.create(
-                            employee=employee,
-                            date=current_date,
-                            start_time=time(9, 0),  # 9:00 AM
-                            end_time=time(17, 0)  # 5:00 PM
-                        )
-
-                # Move to next day
-                current_date += timedelta(days=1)
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully generated availabilities for {days} days'))
\ No newline at end of file
+        started = timer.monotonic()
+
+        start_date = options['start'] or date.today()
+        end_date = options['end'] or start_date + timedelta(days=options['days'])
+        if end_date < start_date:
+            raise CommandError('End date must not be before start date')
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive')
+
+        employee_hours = dict(options['employee_hours'])
+
+        dates = [
+            start_date + timedelta(days=offset)
+            for offset in range((end_date - start_date).days + 1)
+            if (start_date + timedelta(days=offset)).weekday() in options['weekdays']
+        ]
+        employee_ids = list(Employee.objects.filter(active=True).values_list('id', flat=True))
+
+        with transaction.atomic():
+            # One query for every (employee, date) pair that already has availability
+            existing = set(
+                Availability.objects.filter(
+                    employee_id__in=employee_ids,
+                    date__gte=start_date,
+                    date__lte=end_date
+                ).values_list('employee_id', 'date').distinct()
+            )
+
+            missing = [
+                Availability(
+                    employee_id=employee_id,
+                    date=day,
+                    start_time=employee_hours.get(employee_id, options['hours'])[0],
+                    end_time=employee_hours.get(employee_id, options['hours'])[1]
+                )
+                # Day by day, so every batch refreshes a short span of dates
+                for day in dates
+                for employee_id in employee_ids
+                if (employee_id, day) not in existing
+            ]
+
+            if not options['dry_run']:
+                for offset in range(0, len(missing), options['batch_size']):
+                    batch = missing[offset:offset + options['batch_size']]
+                    Availability.objects.bulk_create(batch)
+                    # bulk_create bypasses the post_save signals that keep derived data in sync
+                    days_changed((row.employee_id, row.date) for row in batch)
+
+        elapsed = timer.monotonic() - started
+        action = 'Would insert' if options['dry_run'] else 'Inserted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {len(missing)} availabilities for {len(employee_ids)} employees '
+            f'from {start_date} to {end_date} in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from studio_massage_calendar.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = ('Print a signed token that makes the profiling middleware profile a request '
+            'sent with the "X-Profile-Token: <token>" header.')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            self.stderr.write(self.style.WARNING('PROFILING_ENABLED is off, the token will be ignored'))
+        self.stdout.write(make_token())
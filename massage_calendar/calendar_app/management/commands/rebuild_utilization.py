@@ -0,0 +1,61 @@
+import time as timer
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+
+from ... import utilization
+from ...models import Appointment, Availability, Employee
+from ...slots import date_range
+from .generate_availabilities import parse_date
+
+
+class Command(BaseCommand):
+    help = ('Recompute the daily utilization summaries of a date range, e.g. after '
+            'a backfill or an import that bypassed the model signals. By default the '
+            'range runs from the first appointment or availability to 90 days ahead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='First day (YYYY-MM-DD)')
+        parser.add_argument('--end', type=parse_date, help='Last day (YYYY-MM-DD)')
+        parser.add_argument('--employee', type=int, action='append', dest='employees',
+                            help='Only this employee id (repeatable)')
+        parser.add_argument('--chunk-days', type=int, default=31,
+                            help='Days recomputed per transaction')
+
+    def handle(self, *args, **options):
+        started = timer.monotonic()
+        employees = Employee.objects.all()
+        if options['employees']:
+            employees = employees.filter(id__in=options['employees'])
+        employee_ids = list(employees.values_list('id', flat=True))
+        if not employee_ids:
+            raise CommandError('No employees found')
+
+        start = options['start']
+        if start is None:
+            firsts = [
+                Appointment.objects.aggregate(first=Min('date'))['first'],
+                Availability.objects.aggregate(first=Min('date'))['first'],
+            ]
+            start = min((first for first in firsts if first), default=date.today())
+        end = options['end'] or date.today() + timedelta(days=90)
+        if end < start:
+            raise CommandError('End date must not be before start date')
+        if options['chunk_days'] < 1:
+            raise CommandError('Chunk days must be positive')
+
+        days = list(date_range(start, end))
+        for offset in range(0, len(days), options['chunk_days']):
+            chunk = days[offset:offset + options['chunk_days']]
+            with transaction.atomic():
+                utilization.refresh_days(
+                    (employee_id, day) for employee_id in employee_ids for day in chunk
+                )
+            self.stdout.write(f'{chunk[0]} to {chunk[-1]} done')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(days) * len(employee_ids)} summaries for {len(employee_ids)} employees '
+            f'from {start} to {end} in {timer.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,163 @@
+import random
+import time as timer
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.models import CustomUser
+from ... import catalog
+from ...models import Service, Employee, Availability, Appointment, WeeklyAvailability
+from ...signals import collect_days_changed, days_changed
+
+DURATIONS = (30, 45, 60, 90)
+DAY_START = 9 * 60
+DAY_END = 17 * 60
+SLOT_STEP = 30
+
+
+def minutes_to_time(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+class Command(BaseCommand):
+    help = ('Seed a synthetic studio (services, employees, availabilities, clients and '
+            'appointments) for benchmarking. Intended for a local database, e.g. with '
+            'DJANGO_SQLITE_PATH=bench.sqlite3.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=8, help='Number of services')
+        parser.add_argument('--employees', type=int, default=20, help='Number of employees')
+        parser.add_argument('--days', type=int, default=30, help='Booking horizon in days, starting today')
+        parser.add_argument('--history-days', type=int, default=0,
+                            help='Days of past (completed) appointments before today')
+        parser.add_argument('--density', type=float, default=0.6,
+                            help='Target fraction of available time that is booked (0-1)')
+        parser.add_argument('--clients', type=int, default=200, help='Number of client accounts')
+        parser.add_argument('--weekly-rules', action='store_true',
+                            help='Use weekly availability rules instead of one row per day')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for reproducible data')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows inserted per bulk_create statement')
+        parser.add_argument('--flush', action='store_true',
+                            help='Delete existing calendar data and seeded clients first')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['density'] <= 1:
+            raise CommandError('Density must be between 0 and 1')
+        started = timer.monotonic()
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        today = date.today()
+        first_day = today - timedelta(days=options['history_days'])
+        days = [
+            first_day + timedelta(days=offset)
+            for offset in range(options['history_days'] + options['days'])
+            if (first_day + timedelta(days=offset)).weekday() != 6
+        ]
+
+        with transaction.atomic():
+            if options['flush']:
+                with collect_days_changed():
+                    Appointment.objects.all().delete()
+                    Availability.objects.all().delete()
+                    WeeklyAvailability.objects.all().delete()
+                    Employee.objects.all().delete()
+                    Service.objects.all().delete()
+                    CustomUser.objects.filter(username__startswith='bench_').delete()
+
+            services = Service.objects.bulk_create([
+                Service(
+                    name=f'Service {i + 1}',
+                    description='Synthetic benchmark service',
+                    duration=rng.choice(DURATIONS)
+                )
+                for i in range(options['services'])
+            ])
+            employees = Employee.objects.bulk_create([
+                Employee(name=f'Therapist {i + 1}', specialization='Synthetic')
+                for i in range(options['employees'])
+            ])
+            offered = {}
+            links = []
+            for employee in employees:
+                offered[employee.id] = rng.sample(services, k=rng.randint(1, min(4, len(services))))
+                links.extend(
+                    Employee.services.through(employee_id=employee.id, service_id=service.id)
+                    for service in offered[employee.id]
+                )
+            Employee.services.through.objects.bulk_create(links, batch_size=batch_size)
+
+            if options['weekly_rules']:
+                WeeklyAvailability.objects.bulk_create([
+                    WeeklyAvailability(
+                        employee=employee, weekday=weekday, valid_from=first_day,
+                        start_time=minutes_to_time(DAY_START), end_time=minutes_to_time(DAY_END)
+                    )
+                    for employee in employees
+                    for weekday in range(6)
+                ], batch_size=batch_size)
+            else:
+                Availability.objects.bulk_create([
+                    Availability(
+                        employee=employee, date=day,
+                        start_time=minutes_to_time(DAY_START), end_time=minutes_to_time(DAY_END)
+                    )
+                    for employee in employees
+                    for day in days
+                ], batch_size=batch_size)
+
+            # Continue numbering when seeding on top of an earlier run
+            first_client = CustomUser.objects.filter(username__startswith='bench_client_').count()
+            clients = CustomUser.objects.bulk_create([
+                CustomUser(username=f'bench_client_{i}', email=f'bench_client_{i}@example.com',
+                           password='!')
+                for i in range(first_client, first_client + options['clients'])
+            ], batch_size=batch_size)
+            manager, _ = CustomUser.objects.get_or_create(
+                username='bench_manager', defaults={'email': 'bench_manager@example.com', 'password': '!'}
+            )
+            managers, _ = Group.objects.get_or_create(name='Managers')
+            manager.groups.add(managers)
+
+            appointments = []
+            for employee in employees:
+                for day in days:
+                    appointments.extend(self._book_day(rng, employee, day, offered[employee.id],
+                                                       clients, options['density'], today))
+            Appointment.objects.bulk_create(appointments, batch_size=batch_size)
+
+        # Bulk inserts do not send the signals that keep derived data in sync
+        days_changed((employee.id, day) for employee in employees for day in days)
+        catalog.bump_version()
+
+        elapsed = timer.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(services)} services, {len(employees)} employees, {len(clients)} clients, '
+            f'{len(days)} working days and {len(appointments)} appointments in {elapsed:.2f}s'
+        ))
+
+    def _book_day(self, rng, employee, day, services, clients, density, today):
+        """
+        Walk through the working day and book appointments until roughly
+        `density` of it is taken.
+        """
+        appointments = []
+        current = DAY_START
+        while current < DAY_END:
+            service = rng.choice(services)
+            if current + service.duration <= DAY_END and rng.random() < density:
+                start = minutes_to_time(current)
+                appointments.append(Appointment(
+                    user=rng.choice(clients), service=service, employee=employee,
+                    date=day, time=start, duration=service.duration,
+                    end_time=(datetime.combine(day, start) + timedelta(minutes=service.duration)).time(),
+                    status='completed' if day < today else 'scheduled'
+                ))
+                current += service.duration
+                # Round up to the next slot boundary
+                current += -(current - DAY_START) % SLOT_STEP
+            else:
+                current += SLOT_STEP
+        return appointments
@@ -0,0 +1,31 @@
+import time as timer
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import holds
+
+
+class Command(BaseCommand):
+    help = ('Delete expired slot holds and refresh the days they were on, so their '
+            'slots show up in searches again. Run it every minute, e.g. from cron, '
+            'or keep it running with --interval.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Holds deleted per transaction')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Sweep again every this many seconds instead of exiting')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive')
+        if options['interval'] < 0:
+            raise CommandError('Interval must not be negative')
+
+        while True:
+            deleted = holds.sweep(batch_size=options['batch_size'])
+            if deleted or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired holds'))
+            if not options['interval']:
+                break
+            timer.sleep(options['interval'])
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='duration',
+            field=models.PositiveIntegerField(editable=False, help_text='Duration in minutes', null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='end_time',
+            field=models.TimeField(editable=False, null=True),
+        ),
+    ]
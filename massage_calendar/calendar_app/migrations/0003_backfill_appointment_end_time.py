@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from django.db import migrations
+
+
+def backfill_end_time(apps, schema_editor):
+    """
+    Copy the current service duration into existing appointments and derive
+    their end time.
+    """
+    Appointment = apps.get_model('calendar_app', 'Appointment')
+    appointments = Appointment.objects.filter(duration__isnull=True).select_related('service')
+    batch = []
+    for appointment in appointments.iterator(chunk_size=2000):
+        appointment.duration = appointment.service.duration
+        appointment.end_time = (
+                datetime.combine(appointment.date, appointment.time) +
+                timedelta(minutes=appointment.duration)
+        ).time()
+        batch.append(appointment)
+        if len(batch) >= 2000:
+            Appointment.objects.bulk_update(batch, ['duration', 'end_time'])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ['duration', 'end_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0002_appointment_duration_end_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_end_time, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0003_backfill_appointment_end_time'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='duration',
+            field=models.PositiveIntegerField(editable=False, help_text='Duration in minutes'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='end_time',
+            field=models.TimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['employee', 'date', 'status', 'time', 'end_time'], name='appointment_overlap_idx'),
+        ),
+    ]
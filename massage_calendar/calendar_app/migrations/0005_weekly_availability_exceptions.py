@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0004_appointment_overlap_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=100)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_exceptions', to='calendar_app.employee')),
+            ],
+            options={
+                'ordering': ['date', 'start_time'],
+                'indexes': [models.Index(fields=['employee', 'date'], name='availability_exception_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('valid_from', models.DateField()),
+                ('valid_to', models.DateField(blank=True, help_text='Leave empty for an open-ended rule', null=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_availabilities', to='calendar_app.employee')),
+            ],
+            options={
+                'verbose_name_plural': 'Weekly availabilities',
+                'ordering': ['employee', 'weekday', 'start_time'],
+                'indexes': [models.Index(fields=['employee', 'weekday'], name='weekly_availability_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_availabilities(apps, schema_editor):
+    """
+    Keep the oldest row of every duplicated (employee, date, start, end)
+    window so the unique constraint can be added.
+    """
+    Availability = apps.get_model('calendar_app', 'Availability')
+    keep = Availability.objects.values(
+        'employee_id', 'date', 'start_time', 'end_time'
+    ).annotate(keep_id=Min('id')).values('keep_id')
+    Availability.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0005_weekly_availability_exceptions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['user', 'date', 'time'], name='appointment_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'time'], name='appointment_date_time_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_availabilities, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='availability',
+            constraint=models.UniqueConstraint(fields=('employee', 'date', 'start_time', 'end_time'), name='unique_availability_window'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('free', models.BinaryField(help_text='Cells inside an availability window and not booked')),
+                ('starts', models.BinaryField(help_text='Cells where a slot may start')),
+                ('edges', models.BinaryField(help_text='Cells where an availability window starts')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_occupancies', to='calendar_app.employee')),
+            ],
+            options={
+                'verbose_name_plural': 'Day occupancies',
+                'constraints': [models.UniqueConstraint(fields=('employee', 'date'), name='unique_day_occupancy')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+def drop_day_occupancies(apps, schema_editor):
+    """
+    Stored bitmaps have no summary yet; they are recomputed on first read.
+    """
+    apps.get_model('calendar_app', 'DayOccupancy').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0007_day_occupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dayoccupancy',
+            name='longest_free',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Longest free run inside one window, in minutes'),
+        ),
+        migrations.RunPython(drop_day_occupancies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0008_dayoccupancy_longest_free'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUtilization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('available_minutes', models.PositiveIntegerField(default=0)),
+                ('booked_minutes', models.PositiveIntegerField(default=0)),
+                ('scheduled', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('no_show', models.PositiveIntegerField(default=0)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_utilization', to='calendar_app.employee')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily utilization',
+                'indexes': [models.Index(fields=['date'], name='utilization_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyutilization',
+            constraint=models.UniqueConstraint(fields=('employee', 'date'), name='unique_daily_utilization'),
+        ),
+    ]
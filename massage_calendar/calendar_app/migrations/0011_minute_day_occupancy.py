@@ -0,0 +1,22 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:20
+
+from django.db import migrations
+
+
+def drop_day_occupancies(apps, schema_editor):
+    """
+    Stored bitmaps have one bit per 5 minutes; they are recomputed with one
+    bit per minute on first read.
+    """
+    apps.get_model('calendar_app', 'DayOccupancy').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_app', '0010_slot_hold'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_day_occupancies, migrations.RunPython.noop),
+    ]
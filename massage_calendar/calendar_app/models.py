@@ -32,9 +32,88 @@ class Employee(models.Model):
         return self.name
 
 
+class WeeklyAvailability(models.Model):
+    """
+    Represents an employee's recurring working hours on a given weekday.
+    Rules are expanded on demand for the requested dates instead of being
+    materialized as `Availability` rows.
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='weekly_availabilities')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    valid_from = models.DateField()
+    valid_to = models.DateField(blank=True, null=True, help_text="Leave empty for an open-ended rule")
+
+    class Meta:
+        ordering = ['employee', 'weekday', 'start_time']
+        verbose_name_plural = "Weekly availabilities"
+        indexes = [
+            models.Index(fields=['employee', 'weekday'], name='weekly_availability_idx'),
+        ]
+
+    def clean(self):
+        """
+        Validates the weekly availability instance:
+        - Ensures start_time is before end_time.
+        - Ensures valid_to is not before valid_from.
+        """
+        if self.start_time >= self.end_time:
+            raise ValidationError("End time must be after start time")
+        if self.valid_to and self.valid_to < self.valid_from:
+            raise ValidationError("Rule must not end before it starts")
+
+    def __str__(self):
+        return f"{self.employee.name} - {self.get_weekday_display()}"
+
+
+class AvailabilityException(models.Model):
+    """
+    Represents time an employee is unavailable on a specific date (vacation,
+    sick leave), taking precedence over both weekly rules and one-off
+    availabilities. Leaving the times empty blocks out the whole day.
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='availability_exceptions')
+    date = models.DateField()
+    start_time = models.TimeField(blank=True, null=True)
+    end_time = models.TimeField(blank=True, null=True)
+    reason = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ['date', 'start_time']
+        indexes = [
+            models.Index(fields=['employee', 'date'], name='availability_exception_idx'),
+        ]
+
+    def clean(self):
+        """
+        Validates the exception instance:
+        - Requires both times or neither.
+        - Ensures start_time is before end_time.
+        """
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValidationError("Provide both start and end time, or neither for a whole day")
+        if self.start_time is not None and self.start_time >= self.end_time:
+            raise ValidationError("End time must be after start time")
+
+    def __str__(self):
+        return f"{self.employee.name} - {self.date} (unavailable)"
+
+
 class Availability(models.Model):
     """
     Represents an employee's availability for a specific date and time.
+    When present for a date, these rows override the employee's weekly rules.
     """
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     date = models.DateField()
@@ -44,6 +123,13 @@ class Availability(models.Model):
     class Meta:
         ordering = ['date', 'start_time']
         verbose_name_plural = "Availabilities"
+        constraints = [
+            # Its index also serves the (employee, date) lookups of the slot engine
+            models.UniqueConstraint(
+                fields=['employee', 'date', 'start_time', 'end_time'],
+                name='unique_availability_window'
+            ),
+        ]
 
     def clean(self):
         """
@@ -60,6 +146,77 @@ class Availability(models.Model):
         return f"{self.employee.name} - {self.date}"
 
 
+class DayOccupancy(models.Model):
+    """
+    Occupancy of an employee's day as bitmaps with one bit per minute,
+    derived from availability and appointments and kept up to date on
+    writes (see `calendar_app.occupancy`).
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='day_occupancies')
+    date = models.DateField()
+    free = models.BinaryField(help_text="Cells inside an availability window and not booked")
+    starts = models.BinaryField(help_text="Cells where a slot may start")
+    edges = models.BinaryField(help_text="Cells where an availability window starts")
+    # Lets searches skip days that cannot fit a service without reading the bitmaps
+    longest_free = models.PositiveSmallIntegerField(
+        default=0, help_text="Longest free run inside one window, in minutes"
+    )
+
+    class Meta:
+        verbose_name_plural = "Day occupancies"
+        constraints = [
+            # Its index also serves the (employee, date range) reads of the search
+            models.UniqueConstraint(fields=['employee', 'date'], name='unique_day_occupancy'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.date}"
+
+
+class DailyUtilization(models.Model):
+    """
+    Booked versus available minutes and appointment outcomes of an
+    employee's day, kept up to date on writes for reporting (see
+    `calendar_app.utilization`).
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='daily_utilization')
+    date = models.DateField()
+    available_minutes = models.PositiveIntegerField(default=0)
+    # Minutes of scheduled, completed and no-show appointments
+    booked_minutes = models.PositiveIntegerField(default=0)
+    scheduled = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    no_show = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Daily utilization"
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'date'], name='unique_daily_utilization'),
+        ]
+        indexes = [
+            # Serves reports over all employees for a date range
+            models.Index(fields=['date'], name='utilization_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.date}"
+
+
+class AppointmentQuerySet(models.QuerySet):
+    def overlapping(self, employee, date, start_time, end_time):
+        """
+        Scheduled appointments of an employee overlapping the given span.
+        """
+        return self.filter(
+            employee=employee,
+            date=date,
+            status='scheduled',
+            time__lt=end_time,
+            end_time__gt=start_time
+        )
+
+
 class Appointment(models.Model):
     """
     Represents a booked appointment for a service.
@@ -80,17 +237,60 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     notes = models.TextField(blank=True, null=True)
+    # Snapshot of the service duration at booking time, so later changes to
+    # the service do not change the length of existing bookings.
+    duration = models.PositiveIntegerField(editable=False, help_text="Duration in minutes")
+    end_time = models.TimeField(editable=False)
+
+    objects = AppointmentQuerySet.as_manager()
 
     class Meta:
         ordering = ['date', 'time']
+        indexes = [
+            # Serves the "start < new_end AND end > new_start" overlap check
+            # and the (employee, date, status) lookups of the slot engine
+            models.Index(
+                fields=['employee', 'date', 'status', 'time', 'end_time'],
+                name='appointment_overlap_idx'
+            ),
+            # Serves a client's own appointment list in keyset order
+            models.Index(fields=['user', 'date', 'time'], name='appointment_user_date_idx'),
+            # Serves the manager appointment list in keyset order
+            models.Index(fields=['date', 'time'], name='appointment_date_time_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The service the stored duration was copied from
+        instance._span_service_id = instance.__dict__.get('service_id')
+        return instance
+
+    def set_span(self):
+        """
+        Copies the service duration on first use, or when the appointment is
+        moved to another service, and derives the end time from the start
+        time and the stored duration.
+        """
+        span_service_id = getattr(self, '_span_service_id', None)
+        if self.duration is None or (span_service_id is not None and span_service_id != self.service_id):
+            self.duration = self.service.duration
+            self._span_service_id = self.service_id
+        self.end_time = (
+                timezone.datetime.combine(self.date, self.time) +
+                timedelta(minutes=self.duration)
+        ).time()
 
     def clean(self):
         """
         Validates the appointment instance:
         - Disallows booking in the past
+        - Ensures the appointment ends on the same day
         - Ensures the employee is available at the specified time
         - Checks for overlapping appointments
         """
+        self.set_span()
+
         # Combine date and time for the appointment
         appointment_datetime = timezone.make_aware(
             timezone.datetime.combine(self.date, self.time)
@@ -100,42 +300,65 @@ class Appointment(models.Model):
         if appointment_datetime < timezone.now():
             raise ValidationError("Cannot create appointments in the past")
 
-        # Check if employee is available
-        availability = Availability.objects.filter(
-            employee=self.employee,
-            date=self.date,
-            start_time__lte=self.time,
-            end_time__gte=(
-                    timezone.datetime.combine(self.date, self.time) +
-                    timedelta(minutes=self.service.duration)
-            ).time()
-        )
-        if not availability.exists():
+        if self.end_time <= self.time:
+            raise ValidationError("Appointment must end on the same day")
+
+        # Check if employee is available (one-off rows, weekly rules and exceptions)
+        from .slots import load_windows, to_minutes
+        windows = load_windows([self.employee_id], self.date, self.date).get((self.employee_id, self.date), [])
+        if not any(
+                start <= to_minutes(self.time) and to_minutes(self.end_time) <= end
+                for start, end in windows
+        ):
             raise ValidationError("Employee is not available for the entire service duration")
 
         # Check for overlapping appointments
-        conflicting_appointments = Appointment.objects.filter(
-            employee=self.employee,
-            date=self.date,
-            status='scheduled'
-        ).exclude(id=self.id)
-
-        for existing_appt in conflicting_appointments:
-            # Make existing appointment datetime aware
-            existing_appt_datetime = timezone.make_aware(
-                timezone.datetime.combine(existing_appt.date, existing_appt.time)
-            )
-
-            # Calculate end times
-            existing_end_datetime = existing_appt_datetime + timedelta(minutes=existing_appt.service.duration)
-            new_appt_end_datetime = appointment_datetime + timedelta(minutes=self.service.duration)
-
-            # Check for time slot conflicts
-            if (
-                    (existing_appt_datetime < appointment_datetime < existing_end_datetime) or
-                    (appointment_datetime < existing_appt_datetime < new_appt_end_datetime)
-            ):
-                raise ValidationError("This time slot conflicts with an existing appointment")
+        if Appointment.objects.overlapping(
+                self.employee, self.date, self.time, self.end_time
+        ).exclude(id=self.id).exists():
+            raise ValidationError("This time slot conflicts with an existing appointment")
+
+    def save(self, *args, **kwargs):
+        self.set_span()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.service.name} on {self.date} at {self.time}"
+
+
+class SlotHoldQuerySet(models.QuerySet):
+    def active(self, now=None):
+        """
+        Holds that have not expired yet.
+        """
+        return self.filter(expires_at__gt=now or timezone.now())
+
+
+class SlotHold(models.Model):
+    """
+    A short-lived claim of a client on a slot while they finish checking out.
+
+    Holds count as busy time for everyone else until they are booked,
+    released or expire. Data derived while a hold was active keeps it busy
+    until the `sweep_holds` command deletes it, so the command must run about
+    every minute.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='slot_holds')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE)
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='slot_holds')
+    date = models.DateField()
+    time = models.TimeField()
+    end_time = models.TimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = SlotHoldQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves the busy lookups of the slot engine and the booking check
+            models.Index(fields=['employee', 'date'], name='slot_hold_employee_date_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.service.name} on {self.date} at {self.time}"
\ No newline at end of file
+        return f"{self.user_id} - {self.employee_id} on {self.date} at {self.time}"
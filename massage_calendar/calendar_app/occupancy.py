@@ -0,0 +1,381 @@
+"""
+Day occupancy bitmaps for vectorized slot search.
+
+Every employee's day is stored as three bitmaps of one bit per minute
+(`DayOccupancy`):
+
+- `free`: the minute lies inside an availability window and is not booked,
+- `starts`: a slot may start at the minute (every `SLOT_STEP_MINUTES` from
+  the start of its window),
+- `edges`: an availability window starts at the minute, so no slot may run
+  across it.
+
+Each row also keeps `longest_free`, the longest free run inside one window,
+so searches can skip days that cannot fit a service without reading their
+bitmaps. Bitmaps hold exactly the minutes of the interval representation, so
+both offer the same slots. Rows are recomputed for the affected days inside
+the transaction of every write (see `calendar_app.signals.days_changed`), or
+updated in place for new bookings, which only take free minutes away (see
+`book`), and computed on first read for days nobody has written to, e.g.
+days covered by weekly rules. Finding the slots of a service is then a
+sliding-window test over a matrix holding every searched employee and day at
+once.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import DayOccupancy
+from .slots import MINUTES_PER_DAY, SLOT_STEP_MINUTES, date_range, load_pairs
+
+CELLS = MINUTES_PER_DAY
+
+
+def build_planes(windows, busy, step=SLOT_STEP_MINUTES):
+    """
+    Build the `(free, starts, edges)` boolean arrays of a day from its
+    windows and busy intervals in minutes.
+    """
+    free = np.zeros(CELLS, dtype=bool)
+    starts = np.zeros(CELLS, dtype=bool)
+    edges = np.zeros(CELLS, dtype=bool)
+    for start, end in windows:
+        if start >= end:
+            continue
+        free[start:end] = True
+        edges[start] = True
+        starts[start:end:step] = True
+    for start, end in busy:
+        free[start:end] = False
+    return free, starts, edges
+
+
+def longest_free_run(free, edges):
+    """
+    Return the longest run of free minutes that stays inside one window.
+    """
+    if not free.any():
+        return 0
+    # Every busy minute and every window start begins a new run
+    runs = np.cumsum(~free | edges)
+    return int(np.bincount(runs, weights=free).max())
+
+
+def pack(plane):
+    return np.packbits(plane).tobytes()
+
+
+def unpack(values):
+    """
+    Unpack a list of stored bitmaps into an `(n, CELLS)` boolean matrix.
+    """
+    packed = np.frombuffer(b''.join(bytes(value) for value in values), dtype=np.uint8)
+    return np.unpackbits(packed.reshape(len(values), -1), axis=1)[:, :CELLS].astype(bool)
+
+
+def _rows(pairs, loaded):
+    rows = []
+    for employee_id, date in pairs:
+        windows, busy = loaded.get((employee_id, date), ([], []))
+        free, starts, edges = build_planes(windows, busy)
+        rows.append(DayOccupancy(
+            employee_id=employee_id, date=date,
+            free=pack(free), starts=pack(starts), edges=pack(edges),
+            longest_free=longest_free_run(free, edges)
+        ))
+    return rows
+
+
+def lock_days(pairs):
+    """
+    Lock the rows of the given `(employee_id, date)` days until the end of
+    the current transaction, creating empty ones for days without a row, so
+    that `refresh_days` and `book` on the same day take turns. Must be
+    called before the windows and appointments of the days are loaded.
+    """
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return
+    # Empty rows are filled in by the caller before the transaction ends
+    DayOccupancy.objects.bulk_create(
+        [DayOccupancy(employee_id=employee_id, date=date, free=b'', starts=b'', edges=b'')
+         for employee_id, date in pairs],
+        ignore_conflicts=True
+    )
+    list(DayOccupancy.objects.select_for_update().filter(
+        reduce(or_, (Q(employee_id=employee_id, date=date) for employee_id, date in pairs))
+    ).order_by('employee_id', 'date').values_list('id', flat=True))
+
+
+def refresh_days(pairs, loaded=None):
+    """
+    Recompute and store the bitmaps of the given `(employee_id, date)` days.
+    `loaded` is the result of `load_pairs(pairs)` when the caller has it,
+    loaded after locking the days with `lock_days`.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    with transaction.atomic(savepoint=False):
+        if loaded is None:
+            lock_days(pairs)
+            loaded = load_pairs(pairs)
+        DayOccupancy.objects.bulk_create(
+            _rows(pairs, loaded),
+            update_conflicts=True,
+            unique_fields=['employee', 'date'],
+            update_fields=['free', 'starts', 'edges', 'longest_free']
+        )
+
+
+def book(spans):
+    """
+    Take the `(employee_id, date, start, end)` minute spans of new bookings
+    out of the stored bitmaps of their days, without recomputing the days.
+    Returns the days that have no stored row yet.
+
+    The rows are locked while they are updated, so a concurrent
+    `refresh_days` of the same day either sees the booking or is overwritten
+    by it, never the other way round.
+    """
+    days = defaultdict(list)
+    for employee_id, date, start, end in spans:
+        days[(employee_id, date)].append((start, end))
+    if not days:
+        return set()
+    with transaction.atomic(savepoint=False):
+        rows = list(DayOccupancy.objects.select_for_update().filter(
+            reduce(or_, (Q(employee_id=employee_id, date=date) for employee_id, date in days))
+        ).order_by('employee_id', 'date').only('employee_id', 'date', 'free', 'edges'))
+        for row in rows:
+            free = unpack([row.free])[0]
+            for start, end in days[(row.employee_id, row.date)]:
+                free[start:end] = False
+            row.free = pack(free)
+            row.longest_free = longest_free_run(free, unpack([row.edges])[0])
+        if rows:
+            DayOccupancy.objects.bulk_update(rows, ['free', 'longest_free'])
+    return set(days) - {(row.employee_id, row.date) for row in rows}
+
+
+def get_days(employee_ids, start_date, end_date):
+    """
+    Return `{(employee_id, date): (free, starts, edges)}` with the stored
+    bitmaps of every day in the range, computing missing days on the way.
+    """
+    days = {
+        (employee_id, date): (free, starts, edges)
+        for employee_id, date, free, starts, edges in DayOccupancy.objects.filter(
+            employee_id__in=employee_ids,
+            date__gte=start_date,
+            date__lte=end_date
+        ).values_list('employee_id', 'date', 'free', 'starts', 'edges')
+    }
+    missing = [
+        (employee_id, date)
+        for employee_id in employee_ids
+        for date in date_range(start_date, end_date)
+        if (employee_id, date) not in days
+    ]
+    days.update(_compute_days(missing))
+    return days
+
+
+def _compute_days(pairs):
+    """
+    Compute and store the bitmaps of days that have no row yet and return
+    them like `get_days`.
+    """
+    if not pairs:
+        return {}
+    rows = _rows(pairs, load_pairs(pairs))
+    # Never overwrite rows a concurrent write has just refreshed
+    DayOccupancy.objects.bulk_create(rows, ignore_conflicts=True)
+    return {(row.employee_id, row.date): (row.free, row.starts, row.edges) for row in rows}
+
+
+def slot_matrix(free, starts, edges, duration):
+    """
+    Return a boolean matrix marking the minutes where a slot of `duration`
+    minutes can start: a candidate start, followed by enough free minutes,
+    with no other window starting inside the slot.
+    """
+    result = np.zeros(free.shape, dtype=bool)
+    if not 0 < duration <= CELLS:
+        return result
+    width = CELLS - duration + 1
+    free_sum = np.zeros((free.shape[0], CELLS + 1), dtype=np.int32)
+    np.cumsum(free, axis=1, out=free_sum[:, 1:])
+    edge_sum = np.zeros((edges.shape[0], CELLS + 1), dtype=np.int32)
+    np.cumsum(edges, axis=1, out=edge_sum[:, 1:])
+    fits = free_sum[:, duration:] - free_sum[:, :width] == duration
+    crosses = edge_sum[:, duration:] - edge_sum[:, 1:width + 1] > 0
+    result[:, :width] = starts[:, :width] & fits & ~crosses
+    return result
+
+
+def _slot_starts(days, duration):
+    """
+    Return the `(date, minute, employee_id)` slots of the given
+    `{(employee_id, date): (free, starts, edges)}` bitmaps.
+    """
+    keys = list(days)
+    slots = slot_matrix(
+        unpack([days[key][0] for key in keys]),
+        unpack([days[key][1] for key in keys]),
+        unpack([days[key][2] for key in keys]),
+        duration
+    )
+    rows, cells = np.nonzero(slots)
+    return [
+        (keys[row][1], cell, keys[row][0])
+        for row, cell in zip(rows.tolist(), cells.tolist())
+    ]
+
+
+def next_available(employee_ids, after_date, after_minute, duration, limit, horizon_days,
+                   first_chunk_days=7):
+    """
+    Return up to `limit` `(date, minute, employee_id)` slots of `duration`
+    minutes, earliest first, starting at `after_minute` on `after_date` and
+    looking at most `horizon_days` ahead.
+
+    Days are scanned in chunks that double in length, so the number of
+    queries grows with the logarithm of the distance to the first free slots
+    rather than with the number of days. For each chunk only the
+    `longest_free` summary is read first; the bitmaps are then read for just
+    the days where the service can fit, so fully booked days cost nothing
+    beyond their summary. Days without a stored row are computed on the way.
+    """
+    last_date = after_date + timedelta(days=horizon_days - 1)
+    found = []
+    start_date = after_date
+    chunk_days = first_chunk_days
+    while start_date <= last_date and len(found) < limit:
+        end_date = min(start_date + timedelta(days=chunk_days - 1), last_date)
+        summary = {
+            (employee_id, date): longest_free
+            for employee_id, date, longest_free in DayOccupancy.objects.filter(
+                employee_id__in=employee_ids,
+                date__gte=start_date,
+                date__lte=end_date
+            ).values_list('employee_id', 'date', 'longest_free')
+        }
+
+        days = {}
+        missing = [
+            (employee_id, date)
+            for employee_id in employee_ids
+            for date in date_range(start_date, end_date)
+            if (employee_id, date) not in summary
+        ]
+        if missing:
+            rows = _rows(missing, load_pairs(missing))
+            # Never overwrite rows a concurrent write has just refreshed
+            DayOccupancy.objects.bulk_create(rows, ignore_conflicts=True)
+            days.update({
+                (row.employee_id, row.date): (row.free, row.starts, row.edges)
+                for row in rows if row.longest_free >= duration
+            })
+        if any(longest_free >= duration for longest_free in summary.values()):
+            days.update({
+                (employee_id, date): (free, starts, edges)
+                for employee_id, date, free, starts, edges in DayOccupancy.objects.filter(
+                    employee_id__in=employee_ids,
+                    date__gte=start_date,
+                    date__lte=end_date,
+                    longest_free__gte=duration
+                ).values_list('employee_id', 'date', 'free', 'starts', 'edges')
+                if (employee_id, date) in summary
+            })
+
+        if days:
+            found.extend(
+                slot for slot in _slot_starts(days, duration)
+                if slot[0] > after_date or slot[1] >= after_minute
+            )
+            found.sort()
+        start_date = end_date + timedelta(days=1)
+        chunk_days *= 2
+    return found[:limit]
+
+
+def search_slots(employee_ids, start_date, end_date, duration):
+    """
+    Return `{(employee_id, date): [slot start minutes]}` for every day in the
+    range on which an employee has availability, even if nothing fits.
+    """
+    return _found_slots(get_days(employee_ids, start_date, end_date), duration)
+
+
+async def asearch_slots(employee_ids, start_date, end_date, duration, deadline):
+    """
+    Async variant of `search_slots` that stops starting work at `deadline`,
+    a `time.monotonic()` value. Returns the found slots and the ids of the
+    employees left out.
+
+    The stored bitmaps of all employees are read with one async query.
+    Missing days are computed for ASYNC_SEARCH_BATCH_SIZE employees at a time,
+    and no batch starts after the deadline, so nothing keeps running once
+    the response is sent. Employees whose days were not computed in time are
+    left out.
+    """
+    days = {
+        (employee_id, date): (free, starts, edges)
+        async for employee_id, date, free, starts, edges in DayOccupancy.objects.filter(
+            employee_id__in=employee_ids,
+            date__gte=start_date,
+            date__lte=end_date
+        ).values_list('employee_id', 'date', 'free', 'starts', 'edges')
+    }
+    missing = defaultdict(list)
+    for employee_id in employee_ids:
+        for date in date_range(start_date, end_date):
+            if (employee_id, date) not in days:
+                missing[employee_id].append((employee_id, date))
+
+    pending = list(missing)
+    batch_size = getattr(settings, 'ASYNC_SEARCH_BATCH_SIZE', 8)
+    while pending and time.monotonic() < deadline:
+        batch, pending = pending[:batch_size], pending[batch_size:]
+        days.update(await sync_to_async(_compute_days)(
+            [pair for employee_id in batch for pair in missing[employee_id]]
+        ))
+    left_out = set(pending)
+    found = _found_slots({key: day for key, day in days.items() if key[0] not in left_out}, duration)
+    return found, pending
+
+
+def _found_slots(days, duration):
+    """
+    Return the slot start minutes of `duration` in the given
+    `{(employee_id, date): (free, starts, edges)}` bitmaps, for every day
+    with availability.
+    """
+    if not days:
+        return {}
+    keys = list(days)
+    edges = unpack([days[key][2] for key in keys])
+    available = edges.any(axis=1)
+    keys = [key for key, has_window in zip(keys, available) if has_window]
+    if not keys:
+        return {}
+    slots = slot_matrix(
+        unpack([days[key][0] for key in keys]),
+        unpack([days[key][1] for key in keys]),
+        edges[available],
+        duration
+    )
+    rows, cells = np.nonzero(slots)
+    result = {key: [] for key in keys}
+    for row, cell in zip(rows.tolist(), cells.tolist()):
+        result[keys[row]].append(cell)
+    return result
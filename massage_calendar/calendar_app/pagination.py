@@ -0,0 +1,63 @@
+"""
+Keyset (cursor) pagination over appointments ordered by (date, time, id).
+
+Unlike OFFSET pagination, every page is fetched with an indexed range
+condition that starts right after the last row of the previous page, so the
+cost of a page does not grow with the size of the table.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+ORDERING = ('date', 'time', 'id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(appointment):
+    """
+    Build an opaque cursor pointing right after the given appointment.
+    """
+    value = f"{appointment.date.isoformat()}|{appointment.time.strftime('%H:%M:%S.%f')}|{appointment.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor into a (date, time, id) tuple.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_str, time_str, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return (
+            datetime.strptime(date_str, '%Y-%m-%d').date(),
+            datetime.strptime(time_str, '%H:%M:%S.%f').time(),
+            int(pk),
+        )
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def paginate(queryset, cursor, page_size):
+    """
+    Return one page of `queryset` starting after `cursor` (or at the start
+    when it is None) and the cursor of the next page, or None on the last
+    page.
+    """
+    queryset = queryset.order_by(*ORDERING)
+    if cursor:
+        date, time, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(date__gt=date) |
+            Q(date=date, time__gt=time) |
+            Q(date=date, time=time, id__gt=pk)
+        )
+    # Fetch one extra row to know whether there is a next page
+    rows = list(queryset[:page_size + 1])
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
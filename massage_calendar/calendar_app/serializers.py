@@ -1,5 +1,9 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Service, Employee, Availability, Appointment
+from .models import Service, Employee, Availability, Appointment, SlotHold
 
 
 class ServiceSerializer(serializers.ModelSerializer):
@@ -48,4 +52,105 @@ class AppointmentSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'service', 'service_name', 'employee',
                   'employee_name', 'date', 'time', 'status', 'notes',
                   'user_name']
-        read_only_fields = ['status', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['status', 'created_at', 'updated_at']
+
+
+class BatchAppointmentSerializer(serializers.Serializer):
+    """
+    Serializer for one item of a batch booking.
+    Related objects are passed as plain ids and resolved for the whole batch at once.
+    """
+    service = serializers.IntegerField()
+    employee = serializers.IntegerField()
+    date = serializers.DateField()
+    time = serializers.TimeField()
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class SlotHoldSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the SlotHold model.
+    Holds always belong to the authenticated user, so the user is not part of the input.
+    """
+    class Meta:
+        model = SlotHold
+        fields = ['id', 'service', 'employee', 'date', 'time', 'end_time', 'expires_at']
+        read_only_fields = ['end_time', 'expires_at']
+
+
+class AvailabilityEditSerializer(serializers.Serializer):
+    """
+    Base serializer for the set-based availability operations.
+    Validates the employees affected and the optional dry run flag.
+    """
+    employee_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate_employee_ids(self, value):
+        value = sorted(set(value))
+        if Employee.objects.filter(id__in=value).count() != len(value):
+            raise serializers.ValidationError("Invalid employee")
+        return value
+
+    def validate_range(self, start_date, end_date):
+        """
+        Ensure the edited range is not in the past and within the allowed length.
+        """
+        max_days = getattr(settings, 'AVAILABILITY_EDIT_MAX_DAYS', 366)
+        if start_date < timezone.localdate():
+            raise serializers.ValidationError("Cannot change availability for past dates")
+        if end_date < start_date or (end_date - start_date).days >= max_days:
+            raise serializers.ValidationError(f"Date range must be between 1 and {max_days} days")
+
+
+class BlockOutSerializer(AvailabilityEditSerializer):
+    """
+    Serializer for blocking out a span (or whole days) over a date range.
+    """
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    start_time = serializers.TimeField(required=False, allow_null=True)
+    end_time = serializers.TimeField(required=False, allow_null=True)
+    reason = serializers.CharField(required=False, allow_blank=True, max_length=100, default='')
+
+    def validate(self, data):
+        self.validate_range(data['start_date'], data['end_date'])
+        start_time, end_time = data.get('start_time'), data.get('end_time')
+        if (start_time is None) != (end_time is None):
+            raise serializers.ValidationError("Provide both start and end time, or neither for whole days")
+        if start_time is not None and start_time >= end_time:
+            raise serializers.ValidationError("End time must be after start time")
+        return data
+
+
+class LimitHoursSerializer(AvailabilityEditSerializer):
+    """
+    Serializer for limiting the working hours on some weekdays of a date range.
+    """
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6), allow_empty=False
+    )
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+
+    def validate(self, data):
+        self.validate_range(data['start_date'], data['end_date'])
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError("End time must be after start time")
+        data['weekdays'] = set(data['weekdays'])
+        return data
+
+
+class CopyWeekSerializer(AvailabilityEditSerializer):
+    """
+    Serializer for copying one week's working hours to the following weeks.
+    """
+    source_start = serializers.DateField()
+    weeks = serializers.IntegerField(min_value=1)
+
+    def validate(self, data):
+        first_target = data['source_start'] + timedelta(days=7)
+        self.validate_range(first_target, first_target + timedelta(days=7 * data['weeks'] - 1))
+        return data
@@ -0,0 +1,202 @@
+"""
+Signal handlers keeping derived calendar data in sync with the models.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, catalog, occupancy, utilization
+from .models import (Appointment, Availability, AvailabilityException, Employee, Service,
+                     WeeklyAvailability)
+from .slots import load_pairs, to_minutes
+
+
+_collecting = threading.local()
+
+
+def refresh_days(pairs):
+    """
+    Recompute the occupancy bitmaps and utilization summaries of the given
+    days from one load of their windows and appointments, taken after
+    locking the days against concurrent bookings.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    with transaction.atomic(savepoint=False):
+        occupancy.lock_days(pairs)
+        loaded = load_pairs(pairs)
+        occupancy.refresh_days(pairs, loaded)
+        utilization.refresh_days(pairs, loaded)
+
+
+def days_changed(pairs, refresh=True):
+    """
+    Bring everything derived from the given `(employee_id, date)` days up to
+    date after a write: drop their cached free intervals and recompute their
+    occupancy bitmaps and utilization summaries. Bulk writes that bypass the model signals (e.g.
+    `bulk_create`) must call this themselves.
+    """
+    pairs = {(employee_id, date) for employee_id, date in pairs if None not in (employee_id, date)}
+    collected = getattr(_collecting, 'days', None)
+    if collected is not None:
+        collected.update(pairs)
+        return
+    cache.invalidate_days(pairs)
+    if refresh:
+        refresh_days(pairs)
+
+
+def appointments_booked(appointments):
+    """
+    Bring the data derived from the days of new scheduled appointments up to
+    date. A booking only takes free time away, so its span is cut out of the
+    stored bitmaps and added to the stored summaries instead of recomputing
+    its day; days without stored rows are computed in full. Bulk inserts
+    must call this themselves.
+    """
+    appointments = list(appointments)
+    pairs = {(appointment.employee_id, appointment.date) for appointment in appointments}
+    collected = getattr(_collecting, 'days', None)
+    if collected is not None:
+        collected.update(pairs)
+        return
+    cache.invalidate_days(pairs)
+    missing = occupancy.book(
+        (appointment.employee_id, appointment.date, to_minutes(appointment.time), to_minutes(appointment.end_time))
+        for appointment in appointments
+    )
+    refresh_days(missing | utilization.book(appointments))
+
+
+@contextmanager
+def collect_days_changed():
+    """
+    Collect the days changed inside the block (e.g. by deleting many rows,
+    which sends one signal per row) and update them once on exit. Days of
+    employees deleted in the block are only dropped from the cache.
+    """
+    if getattr(_collecting, 'days', None) is not None:
+        yield
+        return
+    _collecting.days = set()
+    try:
+        yield
+    finally:
+        days, _collecting.days = _collecting.days, None
+    existing = set(Employee.objects.filter(
+        id__in={employee_id for employee_id, _ in days}
+    ).values_list('id', flat=True))
+    cache.invalidate_days(days)
+    refresh_days(pair for pair in days if pair[0] in existing)
+
+
+def _cascaded_from_employee(origin):
+    """
+    Whether a deletion was started by deleting employees, whose derived rows
+    are cascaded away with them and must not be recreated.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is Employee
+
+
+def rule_days(employee_id, weekday, valid_from, valid_to):
+    """
+    Return the `(employee_id, date)` pairs a weekly rule applies to within
+    the booking horizon. Past days are left to expire from the cache.
+    """
+    if None in (employee_id, weekday, valid_from):
+        return []
+    today = timezone.localdate()
+    start = max(valid_from, today)
+    end = today + timedelta(days=getattr(settings, 'CALENDAR_BOOKING_HORIZON_DAYS', 365))
+    if valid_to is not None:
+        end = min(end, valid_to)
+    day = start + timedelta(days=(weekday - start.weekday()) % 7)
+    days = []
+    while day <= end:
+        days.append((employee_id, day))
+        day += timedelta(weeks=1)
+    return days
+
+
+@receiver(post_init, sender=Availability)
+@receiver(post_init, sender=AvailabilityException)
+@receiver(post_init, sender=Appointment)
+def remember_day(sender, instance, **kwargs):
+    """
+    Remember the (employee, date) an instance was loaded with, so that moving
+    it to another day also invalidates the day it was moved away from.
+    """
+    # Read from __dict__ so deferred fields are not loaded here
+    instance._calendar_day = (instance.__dict__.get('employee_id'), instance.__dict__.get('date'))
+
+
+@receiver(post_save, sender=Availability)
+@receiver(post_save, sender=AvailabilityException)
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Availability)
+@receiver(post_delete, sender=AvailabilityException)
+@receiver(post_delete, sender=Appointment)
+def invalidate_day(sender, instance, origin=None, created=False, **kwargs):
+    """
+    Update the data derived from the affected day(s). Status changes (e.g.
+    an appointment being cancelled) go through post_save as well.
+    """
+    if created and sender is Appointment and instance.status == 'scheduled':
+        appointments_booked([instance])
+    else:
+        days = {(instance.employee_id, instance.date), instance._calendar_day}
+        days_changed(days, refresh=not _cascaded_from_employee(origin))
+    instance._calendar_day = (instance.employee_id, instance.date)
+
+
+@receiver(post_init, sender=WeeklyAvailability)
+def remember_rule(sender, instance, **kwargs):
+    """
+    Remember the span a weekly rule was loaded with, so that editing it also
+    invalidates the days it no longer applies to.
+    """
+    instance._calendar_rule = tuple(
+        instance.__dict__.get(field) for field in ('employee_id', 'weekday', 'valid_from', 'valid_to')
+    )
+
+
+@receiver(post_save, sender=WeeklyAvailability)
+@receiver(post_delete, sender=WeeklyAvailability)
+def invalidate_rule_days(sender, instance, origin=None, **kwargs):
+    """
+    Update the data derived from every upcoming day a weekly rule applied to
+    before the change or applies to after it.
+    """
+    current = (instance.employee_id, instance.weekday, instance.valid_from, instance.valid_to)
+    days = set(rule_days(*current)) | set(rule_days(*instance._calendar_rule))
+    days_changed(days, refresh=not _cascaded_from_employee(origin))
+    instance._calendar_rule = current
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=Employee)
+def invalidate_catalog(sender, **kwargs):
+    """
+    Start a new catalog version whenever a service or an employee changes.
+    """
+    catalog.bump_version()
+
+
+@receiver(m2m_changed, sender=Employee.services.through)
+def invalidate_catalog_services(sender, action, **kwargs):
+    """
+    Start a new catalog version when the services an employee offers change.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        catalog.bump_version()
@@ -0,0 +1,354 @@
+"""
+Slot computation for employee availability.
+
+Times are handled as minutes since midnight so that availability windows and
+booked appointments can be merged as plain integer intervals. Availability
+windows are expanded from one-off rows, weekly rules and exceptions for just
+the requested dates, the busy intervals are subtracted from them and bookable
+slots are emitted from the remaining free intervals. Free intervals are cached per employee and
+day (see `calendar_app.cache`), so only the cheap slot emission runs on a hit.
+"""
+from collections import defaultdict
+from datetime import time, timedelta
+
+from django.db.models import Q
+
+from . import cache
+from .models import Availability, AvailabilityException, Appointment, SlotHold, WeeklyAvailability
+
+# Distance between two consecutive candidate slots, in minutes.
+SLOT_STEP_MINUTES = 30
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minutes(value):
+    """
+    Convert a `datetime.time` into minutes since midnight.
+    """
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes):
+    """
+    Convert minutes since midnight back into a `datetime.time`.
+    """
+    return time(minutes // 60, minutes % 60)
+
+
+def merge_intervals(intervals):
+    """
+    Sort intervals and merge the ones that overlap or touch.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def subtract_intervals(window, busy):
+    """
+    Return the free parts of `window` once the sorted, merged `busy`
+    intervals are removed from it.
+    """
+    window_start, window_end = window
+    free = []
+    cursor = window_start
+    for busy_start, busy_end in busy:
+        if busy_end <= cursor:
+            continue
+        if busy_start >= window_end:
+            break
+        if busy_start > cursor:
+            free.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if cursor < window_end:
+        free.append((cursor, window_end))
+    return free
+
+
+def build_free_intervals(windows, busy):
+    """
+    Build the free-interval list for a day.
+
+    Returns a list of `(window_start, free_intervals)` pairs, one per
+    availability window, so that slots can stay aligned to the start of the
+    window they belong to.
+    """
+    busy = merge_intervals(busy)
+    return [
+        (window[0], subtract_intervals(window, busy))
+        for window in sorted(windows)
+    ]
+
+
+def slots_from_free_intervals(day, duration, step=SLOT_STEP_MINUTES):
+    """
+    Emit the start minute of every slot that fits `duration` minutes.
+
+    Candidate starts are placed every `step` minutes from the start of each
+    availability window; a candidate is kept only if the whole service fits
+    inside one free interval.
+    """
+    slots = []
+    for window_start, free_intervals in day:
+        for free_start, free_end in free_intervals:
+            offset = (free_start - window_start) % step
+            current = free_start if offset == 0 else free_start + step - offset
+            while current + duration <= free_end:
+                slots.append(current)
+                current += step
+    return sorted(set(slots))
+
+
+def date_range(start_date, end_date):
+    """
+    Yield every date from start_date to end_date (inclusive).
+    """
+    for offset in range((end_date - start_date).days + 1):
+        yield start_date + timedelta(days=offset)
+
+
+def window_rows(employee_ids, start_date, end_date):
+    """
+    Return the availability, weekly rule and exception querysets that
+    `expand_windows` consumes.
+    """
+    overrides = Availability.objects.filter(
+        employee_id__in=employee_ids,
+        date__gte=start_date,
+        date__lte=end_date
+    ).values_list('employee_id', 'date', 'start_time', 'end_time')
+    rules = WeeklyAvailability.objects.filter(
+        Q(valid_to__isnull=True) | Q(valid_to__gte=start_date),
+        employee_id__in=employee_ids,
+        valid_from__lte=end_date
+    ).values_list('employee_id', 'weekday', 'start_time', 'end_time', 'valid_from', 'valid_to')
+    blocks = AvailabilityException.objects.filter(
+        employee_id__in=employee_ids,
+        date__gte=start_date,
+        date__lte=end_date
+    ).values_list('employee_id', 'date', 'start_time', 'end_time')
+    return overrides, rules, blocks
+
+
+def _appointment_rows(employee_ids, start_date, end_date):
+    """
+    Return the busy spans of scheduled appointments and active slot holds in
+    one query. Days cached or stored while a hold was active keep it busy
+    until `sweep_holds` deletes it and refreshes them, so the sweep interval
+    bounds how long an expired hold can hide its slot.
+    """
+    appointments = Appointment.objects.filter(
+        employee_id__in=employee_ids,
+        date__gte=start_date,
+        date__lte=end_date,
+        status='scheduled'
+    ).order_by().values_list('employee_id', 'date', 'time', 'end_time')
+    holds = SlotHold.objects.active().filter(
+        employee_id__in=employee_ids,
+        date__gte=start_date,
+        date__lte=end_date
+    ).values_list('employee_id', 'date', 'time', 'end_time')
+    return appointments.union(holds, all=True)
+
+
+def expand_windows(employee_ids, start_date, end_date, override_rows, rule_rows, block_rows):
+    """
+    Expand the rows returned by `window_rows` into
+    `{(employee_id, date): windows}` for every day with at least one window.
+    """
+    overrides = defaultdict(list)
+    for employee_id, date, start, end in override_rows:
+        overrides[(employee_id, date)].append((to_minutes(start), to_minutes(end)))
+
+    rules = defaultdict(list)
+    for employee_id, weekday, start, end, valid_from, valid_to in rule_rows:
+        rules[(employee_id, weekday)].append((valid_from, valid_to, to_minutes(start), to_minutes(end)))
+
+    blocks = defaultdict(list)
+    for employee_id, date, start, end in block_rows:
+        # A block without times covers the whole day
+        blocks[(employee_id, date)].append(
+            (0, MINUTES_PER_DAY) if start is None else (to_minutes(start), to_minutes(end))
+        )
+
+    windows = {}
+    for employee_id in employee_ids:
+        for date in date_range(start_date, end_date):
+            key = (employee_id, date)
+            if key in overrides:
+                day = overrides[key]
+            else:
+                day = [
+                    (start, end)
+                    for valid_from, valid_to, start, end in rules.get((employee_id, date.weekday()), ())
+                    if valid_from <= date and (valid_to is None or date <= valid_to)
+                ]
+            if day and key in blocks:
+                blocked = merge_intervals(blocks[key])
+                day = [free for window in sorted(day) for free in subtract_intervals(window, blocked)]
+            if day:
+                windows[key] = day
+    return windows
+
+
+def attach_busy(windows, appointment_rows):
+    """
+    Pair the expanded windows with the busy intervals of the appointment
+    rows returned by `_appointment_rows`.
+    """
+    days = {key: (day, []) for key, day in windows.items()}
+    for employee_id, date, start, end in appointment_rows:
+        # Appointments on days without availability cannot affect any slot
+        if (employee_id, date) in days:
+            days[(employee_id, date)][1].append((to_minutes(start), to_minutes(end)))
+    return days
+
+
+def load_windows(employee_ids, start_date, end_date):
+    """
+    Expand the availability windows of several employees over a date range.
+
+    One-off `Availability` rows for a date take precedence over the weekly
+    rules valid on that date; `AvailabilityException` rows are then cut out
+    of whatever windows remain. Uses one query per model regardless of the
+    length of the range. Returns `{(employee_id, date): windows}` for every
+    day with at least one window.
+    """
+    return expand_windows(employee_ids, start_date, end_date, *window_rows(employee_ids, start_date, end_date))
+
+
+def load_range(employee_ids, start_date, end_date):
+    """
+    Load availability windows and busy intervals for several employees over
+    a date range (inclusive).
+
+    Uses a constant number of queries regardless of the number of employees
+    or days. Returns a dict keyed by `(employee_id, date)` holding
+    `(windows, busy)` for every day on which the employee has availability.
+    """
+    return attach_busy(
+        load_windows(employee_ids, start_date, end_date),
+        _appointment_rows(employee_ids, start_date, end_date)
+    )
+
+
+async def aload_range(employee_ids, start_date, end_date):
+    """
+    Async version of `load_range` using the async ORM.
+    """
+    overrides, rules, blocks = window_rows(employee_ids, start_date, end_date)
+    windows = expand_windows(
+        employee_ids, start_date, end_date,
+        [row async for row in overrides],
+        [row async for row in rules],
+        [row async for row in blocks]
+    )
+    return attach_busy(windows, [row async for row in _appointment_rows(employee_ids, start_date, end_date)])
+
+
+def load_pairs(pairs):
+    """
+    `load_range` over the span of the given `(employee_id, date)` pairs.
+    """
+    return load_range(
+        {employee_id for employee_id, _ in pairs},
+        min(date for _, date in pairs),
+        max(date for _, date in pairs)
+    )
+
+
+def load_day(employee_id, date):
+    """
+    Load availability windows and busy intervals for one employee and day.
+    """
+    return load_range([employee_id], date, date).get((employee_id, date), ([], []))
+
+
+def _range_pairs(employee_ids, start_date, end_date):
+    return [
+        (employee_id, date)
+        for employee_id in employee_ids
+        for date in date_range(start_date, end_date)
+    ]
+
+
+def _missing_span(missing):
+    """
+    Return the employees and the date span `load_range` has to load for the
+    pairs that were not cached.
+    """
+    return (
+        {employee_id for employee_id, _ in missing},
+        min(date for _, date in missing),
+        max(date for _, date in missing)
+    )
+
+
+def _compute_missing(missing, loaded):
+    computed = {}
+    for pair in missing:
+        windows, busy = loaded.get(pair, ([], []))
+        computed[pair] = build_free_intervals(windows, busy)
+    return computed
+
+
+def get_range_free_intervals(employee_ids, start_date, end_date):
+    """
+    Return `{(employee_id, date): free_intervals}` for every day in the
+    range on which one of the employees has availability.
+
+    Cached days are served from the cache; the remaining ones are loaded
+    together with `load_range` and written back to the cache.
+    """
+    pairs = _range_pairs(employee_ids, start_date, end_date)
+    result = cache.get_days(pairs)
+    missing = [pair for pair in pairs if pair not in result]
+    if missing:
+        computed = _compute_missing(missing, load_range(*_missing_span(missing)))
+        cache.set_days(computed)
+        result.update(computed)
+    return {pair: day for pair, day in result.items() if day}
+
+
+async def aget_range_free_intervals(employee_ids, start_date, end_date):
+    """
+    Async version of `get_range_free_intervals`.
+    """
+    pairs = _range_pairs(employee_ids, start_date, end_date)
+    result = await cache.aget_days(pairs)
+    missing = [pair for pair in pairs if pair not in result]
+    if missing:
+        computed = _compute_missing(missing, await aload_range(*_missing_span(missing)))
+        await cache.aset_days(computed)
+        result.update(computed)
+    return {pair: day for pair, day in result.items() if day}
+
+
+def get_day_free_intervals(employee_id, date):
+    """
+    Return the free-interval list for an employee on a given day.
+    An empty list means the employee has no availability that day.
+    """
+    day = cache.get_day(employee_id, date)
+    if day is None:
+        windows, busy = load_day(employee_id, date)
+        day = build_free_intervals(windows, busy)
+        cache.set_day(employee_id, date, day)
+    return day
+
+
+def compute_available_slots(employee_id, date, duration):
+    """
+    Return the bookable slot start times for an employee, day and service
+    duration, or None when the employee has no availability that day.
+    """
+    day = get_day_free_intervals(employee_id, date)
+    if not day:
+        return None
+    return [from_minutes(minute) for minute in slots_from_free_intervals(day, duration)]
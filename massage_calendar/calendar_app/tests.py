@@ -1,3 +1,1014 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import date, time, timedelta
+from io import StringIO
+from unittest import SkipTest, mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from studio_massage_calendar import versions
+from users import roles
+from users.models import CustomUser
+from users.tokens import ClaimsRefreshToken
+from . import cache as calendar_cache, catalog, ical, occupancy, utilization
+from .booking import book_appointment
+from .signals import days_changed
+from .models import (Service, Employee, Availability, AvailabilityException, Appointment, DailyUtilization,
+                     DayOccupancy, SlotHold, WeeklyAvailability)
+from .slots import (build_free_intervals, expand_windows, get_day_free_intervals, load_pairs, load_windows,
+                    merge_intervals, slots_from_free_intervals, subtract_intervals)
+
+
+class IntervalTests(SimpleTestCase):
+    """
+    Edge cases of the interval arithmetic the slot engine is built on.
+    """
+
+    def test_merge_joins_overlapping_touching_and_contained_intervals(self):
+        self.assertEqual(merge_intervals([]), [])
+        self.assertEqual(merge_intervals([(600, 660), (540, 600), (550, 560), (700, 720), (650, 690)]),
+                         [(540, 690), (700, 720)])
+        self.assertEqual(merge_intervals([(540, 600), (601, 660)]), [(540, 600), (601, 660)])
+
+    def test_subtract_keeps_the_free_parts_of_the_window(self):
+        window = (540, 1020)
+        self.assertEqual(subtract_intervals(window, []), [window])
+        # Busy time outside or touching the window changes nothing
+        self.assertEqual(subtract_intervals(window, [(480, 540), (1020, 1080)]), [window])
+        self.assertEqual(subtract_intervals(window, [(480, 600), (960, 1080)]), [(600, 960)])
+        self.assertEqual(subtract_intervals(window, [(600, 660), (660, 720), (900, 960)]),
+                         [(540, 600), (720, 900), (960, 1020)])
+        self.assertEqual(subtract_intervals(window, [(500, 1100)]), [])
+
+    def test_free_intervals_merge_busy_time_first(self):
+        self.assertEqual(
+            build_free_intervals([(780, 1020), (540, 720)], [(660, 700), (600, 680), (780, 800)]),
+            [(540, [(540, 600), (700, 720)]), (780, [(800, 1020)])]
+        )
+
+    def test_slots_stay_aligned_to_the_window_start(self):
+        # The window starts at 9:15, so slots start at :15 and :45 after busy time too
+        day = build_free_intervals([(555, 780)], [(600, 650)])
+        self.assertEqual(slots_from_free_intervals(day, 45), [555, 675, 705, 735])
+        # A service exactly as long as the free interval fits, a longer one does not
+        self.assertEqual(slots_from_free_intervals([(540, [(540, 600)])], 60), [540])
+        self.assertEqual(slots_from_free_intervals([(540, [(540, 600)])], 61), [])
+
+
+class ExpandWindowsTests(TestCase):
+    """
+    Checks how one-off availabilities, weekly rules and exceptions combine
+    into the windows of each day.
+    """
+    monday = date(2030, 1, 7)
+
+    def days(self, offset):
+        return self.monday + timedelta(days=offset)
+
+    def test_rules_apply_on_their_weekday_within_their_validity(self):
+        rules = [
+            (1, 0, time(9, 0), time(17, 0), self.days(7), self.days(14)),
+            (1, 2, time(8, 0), time(12, 0), self.monday, None),
+        ]
+        windows = expand_windows([1], self.monday, self.days(27), [], rules, [])
+        self.assertEqual(sorted(windows), [
+            (1, self.days(2)), (1, self.days(7)), (1, self.days(9)), (1, self.days(14)),
+            (1, self.days(16)), (1, self.days(23)),
+        ])
+        self.assertEqual(windows[(1, self.days(7))], [(540, 1020)])
+        self.assertEqual(windows[(1, self.days(9))], [(480, 720)])
+
+    def test_one_off_rows_replace_the_rules_of_their_day(self):
+        rules = [(1, 0, time(9, 0), time(17, 0), self.monday, None)]
+        overrides = [(1, self.monday, time(12, 0), time(14, 0)), (1, self.days(1), time(10, 0), time(11, 0))]
+        windows = expand_windows([1, 2], self.monday, self.days(7), overrides, rules, [])
+        self.assertEqual(windows, {
+            (1, self.monday): [(720, 840)],
+            (1, self.days(1)): [(600, 660)],
+            (1, self.days(7)): [(540, 1020)],
+        })
+
+    def test_exceptions_are_cut_out_of_rules_and_one_off_rows(self):
+        rules = [(1, 0, time(9, 0), time(17, 0), self.monday, None)]
+        overrides = [(1, self.days(1), time(9, 0), time(12, 0)), (1, self.days(1), time(13, 0), time(15, 0))]
+        blocks = [
+            (1, self.monday, time(11, 0), time(12, 0)),
+            (1, self.monday, time(11, 30), time(13, 0)),
+            (1, self.days(1), time(11, 0), time(14, 0)),
+            (1, self.days(2), None, None),
+            (1, self.days(7), None, None),
+        ]
+        windows = expand_windows([1], self.monday, self.days(7), overrides, rules, blocks)
+        self.assertEqual(windows, {
+            (1, self.monday): [(540, 660), (780, 1020)],
+            (1, self.days(1)): [(540, 660), (840, 900)],
+        })
+
+    def test_load_windows_reads_the_same_rows(self):
+        employee = Employee.objects.create(name='Anna')
+        WeeklyAvailability.objects.create(employee=employee, weekday=0, start_time=time(9, 0),
+                                          end_time=time(17, 0), valid_from=self.monday, valid_to=self.days(7))
+        WeeklyAvailability.objects.create(employee=employee, weekday=0, start_time=time(9, 0),
+                                          end_time=time(10, 0), valid_from=self.days(14))
+        Availability.objects.create(employee=employee, date=self.days(7), start_time=time(12, 0),
+                                    end_time=time(16, 0))
+        AvailabilityException.objects.create(employee=employee, date=self.monday, start_time=time(12, 0),
+                                             end_time=time(13, 0))
+        self.assertEqual(load_windows([employee.id], self.monday, self.days(14)), {
+            (employee.id, self.monday): [(540, 720), (780, 1020)],
+            (employee.id, self.days(7)): [(720, 960)],
+            (employee.id, self.days(14)): [(540, 600)],
+        })
+
+
+class FreeIntervalCacheTests(TestCase):
+    """
+    Checks that cached free intervals never outlive the write that changed
+    their day.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_days_are_dropped_again_on_commit(self):
+        day = (1, date.today() + timedelta(days=7))
+        with self.captureOnCommitCallbacks(execute=True):
+            calendar_cache.invalidate_days([day])
+            self.assertIsNone(calendar_cache.get_day(*day))
+            # A concurrent request caches the rows committed before the write
+            calendar_cache.set_day(*day, [(540, [(540, 1020)])])
+        self.assertIsNone(calendar_cache.get_day(*day))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """
+    Fires simultaneous bookings from several threads and checks that the
+    employee never ends up double-booked.
+    """
+    workers = 8
+
+    @classmethod
+    def setUpClass(cls):
+        # Checked here rather than at import, once the test database is set up
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise SkipTest("Concurrent bookings need a database shared between threads")
+        super().setUpClass()
+
+    def setUp(self):
+        self.service = Service.objects.create(name='Massage', description='', duration=60)
+        self.employee = Employee.objects.create(name='Anna')
+        self.other_employee = Employee.objects.create(name='Ewa')
+        self.date = date.today() + timedelta(days=7)
+        for employee in (self.employee, self.other_employee):
+            Availability.objects.create(
+                employee=employee,
+                date=self.date,
+                start_time=time(9, 0),
+                end_time=time(17, 0)
+            )
+        self.users = [
+            CustomUser.objects.create(username=f'client{i}', email=f'client{i}@example.com')
+            for i in range(self.workers)
+        ]
+
+    def _rush(self, bookings):
+        """
+        Run every booking in its own thread, released at the same time.
+        Returns the number of successful and rejected bookings.
+        """
+        barrier = threading.Barrier(len(bookings))
+        outcomes = []
+
+        def book(fields):
+            try:
+                barrier.wait()
+                book_appointment(**fields)
+                outcomes.append('booked')
+            except ValidationError:
+                outcomes.append('rejected')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=book, args=(fields,)) for fields in bookings]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes.count('booked'), outcomes.count('rejected')
+
+    def test_same_slot_is_booked_once(self):
+        booked, rejected = self._rush([
+            dict(user=user, service=self.service, employee=self.employee,
+                 date=self.date, time=time(10, 0))
+            for user in self.users
+        ])
+
+        self.assertEqual(booked, 1)
+        self.assertEqual(rejected, self.workers - 1)
+        self.assertEqual(
+            Appointment.objects.filter(employee=self.employee, status='scheduled').count(), 1
+        )
+
+    def test_overlapping_slots_are_booked_once(self):
+        booked, rejected = self._rush([
+            dict(user=user, service=self.service, employee=self.employee,
+                 date=self.date, time=time(10, 15 * (i % 4)))
+            for i, user in enumerate(self.users)
+        ])
+
+        self.assertEqual(booked, 1)
+        self.assertEqual(rejected, self.workers - 1)
+
+    def test_other_employees_are_not_blocked(self):
+        booked, rejected = self._rush([
+            dict(user=user, service=self.service,
+                 employee=self.employee if i % 2 else self.other_employee,
+                 date=self.date, time=time(10, 0))
+            for i, user in enumerate(self.users)
+        ])
+
+        self.assertEqual(booked, 2)
+        self.assertEqual(rejected, self.workers - 2)
+
+    def test_invalid_booking_leaves_no_row(self):
+        with self.assertRaises(ValidationError):
+            book_appointment(user=self.users[0], service=self.service, employee=self.employee,
+                             date=self.date, time=time(16, 30))
+
+        self.assertFalse(Appointment.objects.exists())
+
+
+class AppointmentSpanTests(TestCase):
+    """
+    Checks the duration and end time stored with every appointment.
+    """
+
+    def setUp(self):
+        self.massage = Service.objects.create(name='Massage', description='', duration=60)
+        self.employee = Employee.objects.create(name='Anna')
+        self.user = CustomUser.objects.create(username='client', email='client@example.com')
+        self.appointment = Appointment.objects.create(
+            user=self.user, service=self.massage, employee=self.employee,
+            date=date.today() + timedelta(days=7), time=time(10, 0)
+        )
+
+    def test_duration_is_kept_when_the_service_changes_its_duration(self):
+        self.massage.duration = 90
+        self.massage.save()
+        appointment = Appointment.objects.get(id=self.appointment.id)
+        appointment.notes = 'Bring a towel'
+        appointment.save()
+        self.assertEqual((appointment.duration, appointment.end_time), (60, time(11, 0)))
+
+    def test_duration_is_copied_again_when_moved_to_another_service(self):
+        appointment = Appointment.objects.get(id=self.appointment.id)
+        appointment.service = Service.objects.create(name='Long massage', description='', duration=90)
+        appointment.save()
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.duration, appointment.end_time), (90, time(11, 30)))
+
+
+class GenerateAvailabilitiesTests(TestCase):
+    """
+    Checks the bulk availability generator and the data derived from it.
+    """
+
+    def test_every_generated_day_is_refreshed(self):
+        employees = [Employee.objects.create(name=f'Therapist {i}') for i in range(2)]
+        start = date.today() + timedelta(days=7)
+        call_command('generate_availabilities', '--start', start.isoformat(), '--end',
+                     (start + timedelta(days=6)).isoformat(), '--weekdays', '0-6', '--batch-size', '3',
+                     stdout=StringIO())
+        self.assertEqual(Availability.objects.count(), 14)
+        self.assertEqual(
+            set(DayOccupancy.objects.filter(longest_free=8 * 60).values_list('employee_id', 'date')),
+            {(employee.id, start + timedelta(days=offset)) for employee in employees for offset in range(7)}
+        )
+
+    def test_batch_size_must_be_positive(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_availabilities', batch_size=0, stdout=StringIO())
+
+
+class AsyncSlotSearchTests(TestCase):
+    """
+    Checks the async slot search endpoint against the sync one.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name='Massage', description='', duration=60)
+        cls.date = date.today() + timedelta(days=7)
+        cls.user = CustomUser.objects.create(username='client', email='client@example.com')
+        cls.employees = [Employee.objects.create(name=f'Therapist {i}') for i in range(3)]
+        for index, employee in enumerate(cls.employees):
+            employee.services.add(cls.service)
+            Availability.objects.create(employee=employee, date=cls.date,
+                                        start_time=time(9, 0), end_time=time(12 + index, 0))
+        Appointment.objects.create(user=cls.user, service=cls.service, employee=cls.employees[0],
+                                   date=cls.date, time=time(10, 0))
+
+    def setUp(self):
+        cache.clear()
+        self.headers = {'Authorization': f'Bearer {ClaimsRefreshToken.for_user(self.user).access_token}'}
+        self.params = {'service_id': self.service.id, 'start_date': self.date.isoformat(),
+                       'end_date': (self.date + timedelta(days=1)).isoformat()}
+
+    def search_async(self, **params):
+        return async_to_sync(self.async_client.get)(
+            reverse('available-slots-search-async'), {**self.params, **params}, headers=self.headers
+        )
+
+    def test_results_match_the_sync_search(self):
+        expected = self.client.get(reverse('available-slots-search'), self.params, headers=self.headers).json()
+        response = self.search_async()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertFalse(data['partial'])
+        self.assertEqual(data['pending_employee_ids'], [])
+        self.assertEqual(
+            sorted(data['results'], key=lambda result: result['employee_id']),
+            sorted(expected['results'], key=lambda result: result['employee_id'])
+        )
+        self.assertEqual(data['results'][0]['slots'][self.date.isoformat()][:2], ['09:00', '11:00'])
+
+    @override_settings(ASYNC_SEARCH_DEADLINE=0)
+    def test_employees_past_the_deadline_are_reported_as_pending(self):
+        stored = DayOccupancy.objects.count()
+        data = self.search_async().json()
+        self.assertTrue(data['partial'])
+        self.assertEqual(data['results'], [])
+        self.assertEqual(sorted(data['pending_employee_ids']), [employee.id for employee in self.employees])
+        self.assertEqual(DayOccupancy.objects.count(), stored)
+
+    def test_stored_days_are_returned_past_the_deadline(self):
+        expected = self.client.get(reverse('available-slots-search'), self.params, headers=self.headers).json()
+        with override_settings(ASYNC_SEARCH_DEADLINE=0):
+            data = self.search_async().json()
+        self.assertFalse(data['partial'])
+        self.assertEqual(
+            sorted(data['results'], key=lambda result: result['employee_id']),
+            sorted(expected['results'], key=lambda result: result['employee_id'])
+        )
+
+    @override_settings(ASYNC_SEARCH_BATCH_SIZE=2)
+    def test_missing_days_are_computed_in_batches(self):
+        with mock.patch.object(occupancy, '_compute_days', wraps=occupancy._compute_days) as compute:
+            data = self.search_async().json()
+        self.assertFalse(data['partial'])
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(DayOccupancy.objects.count(), 6)
+
+    def test_requests_need_a_valid_token(self):
+        response = async_to_sync(self.async_client.get)(reverse('available-slots-search-async'), self.params)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.search_async(end_date='invalid').status_code, 400)
+
+
+class OccupancySearchTests(TestCase):
+    """The bitmap search must agree with the interval engine to the minute."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name='Massage', description='', duration=47)
+        cls.date = date.today() + timedelta(days=7)
+        cls.user = CustomUser.objects.create(username='client', email='client@example.com')
+        cls.employees = [Employee.objects.create(name=f'Therapist {i}') for i in range(2)]
+        first, second = cls.employees
+        # Off-grid window edges, an adjacent window and an off-grid booking
+        Availability.objects.create(employee=first, date=cls.date, start_time=time(9, 7), end_time=time(12, 53))
+        Availability.objects.create(employee=first, date=cls.date, start_time=time(12, 53), end_time=time(14, 0))
+        Availability.objects.create(employee=first, date=cls.date, start_time=time(15, 0), end_time=time(17, 31))
+        Appointment.objects.create(user=cls.user, service=cls.service, employee=first,
+                                   date=cls.date, time=time(10, 13))
+        # A weekly rule with a blocked-out part on the first day
+        WeeklyAvailability.objects.create(employee=second, weekday=cls.date.weekday(),
+                                          start_time=time(8, 0), end_time=time(16, 0), valid_from=cls.date)
+        AvailabilityException.objects.create(employee=second, date=cls.date,
+                                             start_time=time(11, 11), end_time=time(12, 2))
+
+    def setUp(self):
+        cache.clear()
+        self.ids = [employee.id for employee in self.employees]
+        self.days = [self.date + timedelta(days=offset) for offset in range(8)]
+
+    def assert_search_matches_intervals(self):
+        for duration in (30, 47, 60, 95):
+            found = occupancy.search_slots(self.ids, self.days[0], self.days[-1], duration)
+            for employee_id in self.ids:
+                for day in self.days:
+                    free = get_day_free_intervals(employee_id, day)
+                    expected = slots_from_free_intervals(free, duration) if free else None
+                    self.assertEqual(found.get((employee_id, day)), expected, (employee_id, day, duration))
+
+    def test_search_matches_the_interval_engine(self):
+        self.assert_search_matches_intervals()
+
+    def test_next_available_matches_the_interval_engine(self):
+        found = occupancy.next_available(self.ids, self.date, 0, 47, 100, 8)
+        expected = sorted(
+            (day, minute, employee_id)
+            for employee_id in self.ids for day in self.days
+            for minute in slots_from_free_intervals(get_day_free_intervals(employee_id, day), 47)
+        )
+        self.assertEqual(found, expected)
+
+    def test_booking_updates_rows_like_a_full_refresh(self):
+        self.assert_search_matches_intervals()
+        book_appointment(user=self.user, service=self.service, employee=self.employees[0],
+                         date=self.date, time=time(15, 22))
+        self.assert_search_matches_intervals()
+
+        pair = (self.employees[0].id, self.date)
+        stored = DayOccupancy.objects.get(employee_id=pair[0], date=pair[1])
+        expected = occupancy._rows([pair], load_pairs([pair]))[0]
+        for field in ('free', 'starts', 'edges'):
+            self.assertEqual(bytes(getattr(stored, field)), getattr(expected, field), field)
+        self.assertEqual(stored.longest_free, expected.longest_free)
+        stored = DailyUtilization.objects.get(employee_id=pair[0], date=pair[1])
+        expected = utilization._rows([pair], load_pairs([pair]))[0]
+        for field in utilization.FIELDS:
+            self.assertEqual(getattr(stored, field), getattr(expected, field), field)
+
+    def test_days_are_locked_before_they_are_loaded(self):
+        calls = mock.Mock()
+        pair = (self.employees[1].id, self.days[1])
+        with mock.patch.object(occupancy, 'lock_days', wraps=occupancy.lock_days) as lock, \
+                mock.patch('calendar_app.signals.load_pairs', wraps=load_pairs) as load:
+            calls.attach_mock(lock, 'lock_days')
+            calls.attach_mock(load, 'load_pairs')
+            days_changed([pair])
+        self.assertEqual([call[0] for call in calls.mock_calls], ['lock_days', 'load_pairs'])
+        # The empty row created to hold the lock is filled in
+        stored = DayOccupancy.objects.get(employee_id=pair[0], date=pair[1])
+        self.assertEqual(bytes(stored.free), occupancy._rows([pair], load_pairs([pair]))[0].free)
+
+
+class CalendarDataMixin:
+    """
+    Three employees with a week of availability and three appointments on
+    the first day, for tests of the API on a populated calendar.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name='Massage', description='', duration=60)
+        cls.employees = [Employee.objects.create(name=f'Therapist {i}') for i in range(3)]
+        cls.date = date.today() + timedelta(days=7)
+        cls.client_user = CustomUser.objects.create(username='client', email='client@example.com')
+        cls.manager = CustomUser.objects.create(username='manager', email='manager@example.com')
+        cls.manager.groups.add(Group.objects.create(name='Managers'))
+        for employee in cls.employees:
+            employee.services.add(cls.service)
+            for offset in range(7):
+                Availability.objects.create(
+                    employee=employee,
+                    date=cls.date + timedelta(days=offset),
+                    start_time=time(9, 0),
+                    end_time=time(17, 0)
+                )
+            for hour in (9, 11, 14):
+                Appointment.objects.create(
+                    user=cls.client_user, service=cls.service, employee=employee,
+                    date=cls.date, time=time(hour, 0)
+                )
+
+    def setUp(self):
+        cache.clear()
+        # The shared versions are read once per sync interval, not per request
+        versions.get(roles.GENERATION_KEY)
+        versions.get(catalog.VERSION_KEY)
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class HotPathQueryTests(CalendarDataMixin, TestCase):
+    """
+    Pins the number of queries of the hot views and checks that their main
+    filters are served by the composite indexes, so regressions show up in
+    the test run rather than in production.
+    """
+
+    def test_available_slots_query_count(self):
+        params = {
+            'date': self.date.isoformat(),
+            'employee_id': self.employees[0].id,
+            'service_id': self.service.id,
+        }
+        # Employee and service lookups, then availabilities, weekly rules,
+        # exceptions and appointments with slot holds for the day
+        with self.assertNumQueries(6):
+            response = self.api.get(reverse('available-slots'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('09:00', response.data)
+
+        # The day's free intervals are cached now
+        with self.assertNumQueries(2):
+            self.api.get(reverse('available-slots'), params)
+
+    def test_slot_search_query_count_is_independent_of_range(self):
+        for days in (1, 7):
+            params = {
+                'service_id': self.service.id,
+                'start_date': self.date.isoformat(),
+                'end_date': (self.date + timedelta(days=days - 1)).isoformat(),
+            }
+            DayOccupancy.objects.all().delete()
+            # Service, employees and occupancy rows, then availabilities,
+            # weekly rules, exceptions and appointments for the missing days
+            # and the insert of their bitmaps
+            with self.assertNumQueries(8):
+                response = self.api.get(reverse('available-slots-search'), params)
+            self.assertEqual(len(response.data['results']), len(self.employees))
+            self.assertEqual(len(response.data['results'][0]['slots']), days)
+            self.assertNotIn('09:00', response.data['results'][0]['slots'][self.date.isoformat()])
+
+            # The bitmaps are stored now
+            with self.assertNumQueries(3):
+                self.assertEqual(self.api.get(reverse('available-slots-search'), params).data, response.data)
+
+    def test_appointments_query_count(self):
+        # Manager check and one page of appointments with related rows joined
+        with self.assertNumQueries(2):
+            response = self.api.get(reverse('appointments'))
+        self.assertEqual(len(response.data), 9)
+
+        self.api.force_authenticate(self.manager)
+        with self.assertNumQueries(2):
+            response = self.api.get(reverse('appointments'), {'page_size': 5})
+        self.assertEqual(len(response.data), 5)
+
+    def test_create_appointment_query_count(self):
+        # Serializer lookups, savepoint, day lock (two SELECT ... FOR UPDATE
+        # where supported), expanded windows, overlap check, slot holds,
+        # insert, the booking cut out of the day's occupancy bitmaps and
+        # added to its utilization summary (a read and an update each),
+        # release
+        expected = 17 if connection.features.has_select_for_update else 16
+        with self.assertNumQueries(expected):
+            response = self.api.post(reverse('create-appointment'), {
+                'service': self.service.id,
+                'employee': self.employees[0].id,
+                'date': self.date.isoformat(),
+                'time': '15:00',
+            })
+        self.assertEqual(response.status_code, 201)
+
+    def assertUsesIndex(self, queryset, *index_names):
+        """
+        Assert that the query plan of `queryset` uses one of the given indexes.
+        """
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # The test tables are tiny, make sequential scans unattractive
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f"None of {index_names} used by:\n{plan}"
+        )
+
+    @skipIf(connection.vendor not in ('sqlite', 'postgresql'), "Query plan format is backend specific")
+    def test_hot_filters_use_composite_indexes(self):
+        employee = self.employees[0]
+        self.assertUsesIndex(
+            Availability.objects.filter(employee=employee, date=self.date),
+            'unique_availability_window',
+            # SQLite creates unique constraints as automatic indexes
+            'sqlite_autoindex_calendar_app_availability'
+        )
+        self.assertUsesIndex(
+            Appointment.objects.filter(employee=employee, date=self.date, status='scheduled'),
+            'appointment_overlap_idx'
+        )
+        self.assertUsesIndex(
+            Appointment.objects.overlapping(employee, self.date, time(10, 0), time(11, 0)),
+            'appointment_overlap_idx'
+        )
+        self.assertUsesIndex(
+            Appointment.objects.filter(user=self.client_user, date__gte=self.date).order_by('date', 'time'),
+            'appointment_user_date_idx'
+        )
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class UtilizationTests(CalendarDataMixin, TestCase):
+    """
+    Checks the daily utilization summaries and the report built from them.
+    """
+
+    def test_utilization_report_reads_daily_summaries(self):
+        self.api.force_authenticate(self.manager)
+        params = {'start_date': self.date.isoformat(), 'end_date': (self.date + timedelta(days=6)).isoformat()}
+        self.assertEqual(self.api.get(reverse('utilization-report'), params).status_code, 200)
+
+        # Employees, then one row per employee and day (roles are cached)
+        with self.assertNumQueries(2):
+            response = self.api.get(reverse('utilization-report'), params)
+        self.assertEqual(len(response.data['employees'][0]['days']), 7)
+        self.assertEqual(response.data['totals']['available_minutes'], 3 * 7 * 480)
+        self.assertEqual(response.data['totals']['booked_minutes'], 9 * 60)
+
+        appointment = Appointment.objects.filter(employee=self.employees[0]).first()
+        appointment.status = 'cancelled'
+        appointment.save()
+        response = self.api.get(reverse('utilization-report'), params)
+        self.assertEqual(response.data['totals']['booked_minutes'], 8 * 60)
+        self.assertEqual(response.data['totals']['cancellation_rate'], round(1 / 9, 4))
+
+        self.api.force_authenticate(self.client_user)
+        self.assertEqual(self.api.get(reverse('utilization-report'), params).status_code, 403)
+
+    def test_bookings_are_added_to_the_stored_counts(self):
+        pair = (self.employees[0].id, self.date)
+        utilization.get_days([pair[0]], self.date, self.date)
+        # Another booking of the day is counted after the summary was read
+        DailyUtilization.objects.filter(employee_id=pair[0], date=pair[1]).update(scheduled=F('scheduled') + 1)
+        appointment = Appointment(employee_id=pair[0], date=pair[1], duration=45)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(utilization.book([appointment, appointment]), set())
+        self.assertIn('"scheduled" +', queries[-1]['sql'])
+        stored = DailyUtilization.objects.get(employee_id=pair[0], date=pair[1])
+        self.assertEqual((stored.scheduled, stored.booked_minutes), (3 + 1 + 2, 3 * 60 + 2 * 45))
+
+        missing = (self.employees[0].id, self.date + timedelta(days=30))
+        self.assertEqual(utilization.book([Appointment(employee_id=missing[0], date=missing[1], duration=60)]),
+                         {missing})
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class AvailabilityEditTests(CalendarDataMixin, TestCase):
+    """
+    Checks the set-based availability editing and block-out endpoints.
+    """
+
+    def test_availability_edits_are_set_based_and_report_conflicts(self):
+        self.api.force_authenticate(self.manager)
+        ids = [employee.id for employee in self.employees]
+        body = {'employee_ids': ids, 'start_date': self.date.isoformat(),
+                'end_date': (self.date + timedelta(days=6)).isoformat(), 'dry_run': True}
+        response = self.api.post(reverse('availability-block-out'), body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 21)
+        self.assertEqual(len(response.data['conflicts']), 9)
+        self.assertFalse(AvailabilityException.objects.exists())
+
+        # Same statements for a week or a month of days
+        body.update({'weekdays': [self.date.weekday()], 'start_time': '12:00', 'end_time': '17:00', 'dry_run': False})
+        with CaptureQueriesContext(connection) as week:
+            response = self.api.post(reverse('availability-limit-hours'), body, format='json')
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([conflict['time'] for conflict in response.data['conflicts']], [time(9, 0)] * 3 + [time(11, 0)] * 3)
+        body['end_date'] = (self.date + timedelta(days=27)).isoformat()
+        with CaptureQueriesContext(connection) as month:
+            self.api.post(reverse('availability-limit-hours'), body, format='json')
+        self.assertEqual(len(week), len(month))
+
+    def test_block_out_can_be_repeated(self):
+        self.api.force_authenticate(self.manager)
+        body = {'employee_ids': [self.employees[0].id], 'start_date': self.date.isoformat(),
+                'end_date': (self.date + timedelta(days=2)).isoformat(),
+                'start_time': '12:00', 'end_time': '13:00'}
+        self.assertEqual(self.api.post(reverse('availability-block-out'), body, format='json').data['created'], 3)
+        self.assertEqual(self.api.post(reverse('availability-block-out'), body, format='json').data['created'], 0)
+
+        # A whole-day block covers any span, but a span does not cover the day
+        AvailabilityException.objects.create(employee=self.employees[0], date=self.date + timedelta(days=3))
+        body.update({'end_date': (self.date + timedelta(days=3)).isoformat(), 'start_time': '15:00',
+                     'end_time': '16:00'})
+        self.assertEqual(self.api.post(reverse('availability-block-out'), body, format='json').data['created'], 3)
+        del body['start_time'], body['end_time']
+        self.assertEqual(self.api.post(reverse('availability-block-out'), body, format='json').data['created'], 3)
+        self.assertEqual(AvailabilityException.objects.count(), 10)
+
+
+class SlotSearchTests(CalendarDataMixin, TestCase):
+    """
+    Checks the multi-employee, multi-day slot search against the single-day
+    slots endpoint.
+    """
+
+    def search(self, **params):
+        return self.api.get(reverse('available-slots-search'), {
+            'service_id': self.service.id, 'start_date': self.date.isoformat(),
+            'end_date': (self.date + timedelta(days=2)).isoformat(), **params,
+        })
+
+    def test_results_cover_every_employee_and_day(self):
+        response = self.search()
+        self.assertEqual(response.status_code, 200)
+        results = {result['employee_id']: result for result in response.data['results']}
+        self.assertEqual(set(results), {employee.id for employee in self.employees})
+        for employee in self.employees:
+            self.assertEqual(results[employee.id]['employee_name'], employee.name)
+            for offset in range(3):
+                day = (self.date + timedelta(days=offset)).isoformat()
+                expected = self.api.get(reverse('available-slots'), {
+                    'date': day, 'employee_id': employee.id, 'service_id': self.service.id,
+                }).data
+                self.assertEqual(results[employee.id]['slots'][day], expected, (employee.id, day))
+        self.assertNotIn('09:00', results[self.employees[0].id]['slots'][self.date.isoformat()])
+        self.assertIn('09:00', results[self.employees[0].id]['slots'][(self.date + timedelta(days=1)).isoformat()])
+
+    def test_only_listed_active_employees_offering_the_service_are_searched(self):
+        Employee.objects.filter(pk=self.employees[2].pk).update(active=False)
+        other = Employee.objects.create(name='Physiotherapist')
+        Availability.objects.create(employee=other, date=self.date, start_time=time(9, 0), end_time=time(17, 0))
+        ids = [employee.id for employee in self.employees[1:]] + [other.id]
+        response = self.search(employee_ids=','.join(map(str, ids)))
+        self.assertEqual([result['employee_id'] for result in response.data['results']], [self.employees[1].id])
+
+        # Days without availability are left out
+        response = self.search(start_date=(self.date - timedelta(days=1)).isoformat())
+        self.assertNotIn((self.date - timedelta(days=1)).isoformat(), response.data['results'][0]['slots'])
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.search(end_date=(self.date - timedelta(days=1)).isoformat()).status_code, 400)
+        self.assertEqual(self.search(end_date=(self.date + timedelta(days=31)).isoformat()).status_code, 400)
+        self.assertEqual(self.search(employee_ids='1,x').status_code, 400)
+        self.assertEqual(self.search(service_id=0).status_code, 400)
+
+
+class AppointmentListTests(CalendarDataMixin, TestCase):
+    """
+    Checks the keyset pagination and the streaming exports of the
+    appointment list.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.api.force_authenticate(self.manager)
+        self.expected = list(Appointment.objects.order_by('date', 'time', 'id').values_list('id', flat=True))
+
+    def test_cursor_pages_follow_each_other(self):
+        seen = []
+        url, params = reverse('appointments'), {'page_size': 4}
+        while url:
+            response = self.api.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.append([appointment['id'] for appointment in response.data])
+            link = response.get('Link')
+            url, params = (link[1:link.index('>')], None) if link else (None, None)
+            if link:
+                self.assertTrue(link.startswith('<http://testserver/'))
+                self.assertTrue(link.endswith('>; rel="next"'))
+                self.assertIn('page_size=4', link)
+        self.assertEqual([len(page) for page in seen], [4, 4, 1])
+        self.assertEqual(sum(seen, []), self.expected)
+
+        # A booking added before the cursor does not shift the next page
+        response = self.api.get(reverse('appointments'), {'page_size': 4})
+        Appointment.objects.create(user=self.client_user, service=self.service, employee=self.employees[0],
+                                   date=self.date, time=time(8, 0))
+        link = response['Link']
+        response = self.api.get(link[1:link.index('>')])
+        self.assertEqual([appointment['id'] for appointment in response.data], self.expected[4:8])
+
+    def test_invalid_cursors_and_page_sizes_are_rejected(self):
+        self.assertEqual(self.api.get(reverse('appointments'), {'cursor': 'bogus'}).status_code, 400)
+        self.assertEqual(self.api.get(reverse('appointments'), {'page_size': 0}).status_code, 400)
+
+    def test_csv_export_streams_every_appointment(self):
+        response = self.api.get(reverse('appointments'), {'export': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="appointments.csv"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,time,end_time,status,service,service_name,employee,employee_name,'
+                                   'user,user_name,notes')
+        rows = [line.split(',') for line in lines[1:]]
+        self.assertEqual([int(row[0]) for row in rows], self.expected)
+        first = Appointment.objects.get(pk=self.expected[0])
+        self.assertEqual(rows[0][1:5], [self.date.isoformat(), '09:00:00', '10:00:00', 'scheduled'])
+        self.assertEqual(rows[0][8], first.employee.name)
+        self.assertEqual(rows[0][10], 'client')
+
+    def test_json_export_streams_every_appointment(self):
+        response = self.api.get(reverse('appointments'), {'export': 'json', 'date': self.date.isoformat()})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([appointment['id'] for appointment in data], self.expected)
+        self.assertEqual(data[0]['service_name'], 'Massage')
+        self.assertEqual(data[0]['time'], '09:00:00')
+
+        response = self.api.get(reverse('appointments'), {'export': 'json', 'date': '2000-01-01'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+    def test_unknown_export_formats_are_rejected(self):
+        response = self.api.get(reverse('appointments'), {'export': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Unsupported export format'})
+
+    def test_clients_only_see_their_own_appointments(self):
+        other = CustomUser.objects.create(username='other', email='other@example.com')
+        self.api.force_authenticate(other)
+        self.assertEqual(self.api.get(reverse('appointments')).data, [])
+        response = self.api.get(reverse('appointments'), {'export': 'csv'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 1)
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class CatalogTests(CalendarDataMixin, TestCase):
+    """
+    Checks the cached, ETag-versioned catalog endpoints.
+    """
+
+    def test_catalog_is_cached_and_revalidated_by_etag(self):
+        # Employees, then the nested services of all of them at once
+        with self.assertNumQueries(2):
+            response = self.api.get(reverse('employees'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), len(self.employees))
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.api.get(reverse('employees'))
+        self.assertEqual(response['ETag'], etag)
+        with self.assertNumQueries(0):
+            response = self.api.get(reverse('employees'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.filter(pk=self.service.pk).get().save()
+        response = self.api.get(reverse('employees'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_catalog_changes_in_other_processes_are_seen(self):
+        etag = self.api.get(reverse('employees'))['ETag']
+        # Another process renames a service and starts a new version
+        Service.objects.filter(pk=self.service.pk).update(name='Deep tissue')
+        versions.shared_cache().set(catalog.VERSION_KEY, 'other', None)
+        self.assertEqual(self.api.get(reverse('employees'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with override_settings(SHARED_VERSION_SYNC_INTERVAL=0):
+            response = self.api.get(reverse('employees'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['services'][0]['name'], 'Deep tissue')
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class BatchBookingTests(CalendarDataMixin, TestCase):
+    """
+    Checks the transactional batch booking endpoint.
+    """
+
+    def test_batch_booking_is_set_based_and_all_or_nothing(self):
+        items = [
+            {'service': self.service.id, 'employee': employee.id,
+             'date': (self.date + timedelta(days=offset)).isoformat(), 'time': '15:00'}
+            for employee in self.employees for offset in (1, 2)
+        ]
+        # Services, employees, savepoint, day locks, windows (three queries),
+        # appointments, slot holds, insert, occupancy bitmaps and utilization
+        # summaries of the days (a read and an update each), release,
+        # whatever the number of items
+        expected = 16 if connection.features.has_select_for_update else 15
+        with self.assertNumQueries(expected):
+            response = self.api.post(reverse('create-appointments-batch'), {'appointments': items},
+                                     format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), len(items))
+
+        count = Appointment.objects.count()
+        response = self.api.post(reverse('create-appointments-batch'), {'appointments': [
+            {'service': self.service.id, 'employee': self.employees[0].id,
+             'date': self.date.isoformat(), 'time': '12:00'},
+            {'service': self.service.id, 'employee': self.employees[0].id,
+             'date': self.date.isoformat(), 'time': '12:30'},
+            {'service': self.service.id, 'employee': self.employees[0].id,
+             'date': self.date.isoformat(), 'time': '09:30'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([item['index'] for item in response.data['items']], [1, 2])
+        self.assertEqual(Appointment.objects.count(), count)
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class NextAvailableTests(CalendarDataMixin, TestCase):
+    """
+    Checks the next available appointment search.
+    """
+
+    def test_next_available_scans_summaries_first(self):
+        # Service and employees, then the chunk's summaries and the bitmaps
+        # of the days where the service fits
+        with self.assertNumQueries(4):
+            response = self.api.get(reverse('available-slots-next'), {
+                'service_id': self.service.id,
+                'after': f'{self.date.isoformat()}T09:00',
+                'limit': 2,
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(slot['employee_id'], slot['date'], slot['time']) for slot in response.data['results']],
+            [(employee.id, self.date.isoformat(), '10:00') for employee in self.employees[:2]]
+        )
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class TokenAuthenticationTests(CalendarDataMixin, TestCase):
+    """
+    Checks the cached token principal and logout through the API.
+    """
+
+    def test_token_authentication_takes_no_queries(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.manager).access_token}')
+        api.get(reverse('appointments'))
+
+        # The user and the manager role come from the token claims
+        with self.assertNumQueries(1):
+            response = api.get(reverse('appointments'))
+        self.assertEqual(len(response.data), 9)
+
+        response = api.post(reverse('user-logout'))
+        self.assertEqual(response.status_code, 200)
+        response = api.get(reverse('appointments'))
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class CalendarFeedTests(CalendarDataMixin, TestCase):
+    """
+    Checks the signed iCalendar feeds and their conditional GET.
+    """
+
+    def test_calendar_feed_is_revalidated_with_one_query(self):
+        employee = self.employees[0]
+        url = reverse('employee-calendar-feed', args=[employee.id])
+        token = ical.feed_signature('employee', employee.id)
+        self.assertEqual(self.client.get(url, {'token': 'forged'}).status_code, 403)
+
+        response = self.client.get(url, {'token': token})
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 3)
+        etag = response['ETag']
+
+        # The feed state is one aggregate query
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'token': token}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Appointment.objects.filter(employee=employee).first().delete()
+        response = self.client.get(url, {'token': token}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class SlotHoldTests(CalendarDataMixin, TestCase):
+    """
+    Checks that slot holds hide their slots until booked, released or swept.
+    """
+
+    def test_slot_holds_hide_slots_until_booked_or_swept(self):
+        other = CustomUser.objects.create(username='other', email='other@example.com')
+        params = {'date': self.date.isoformat(), 'employee_id': self.employees[0].id,
+                  'service_id': self.service.id}
+        body = {'service': self.service.id, 'employee': self.employees[0].id,
+                'date': self.date.isoformat(), 'time': '15:00'}
+        response = self.api.post(reverse('create-slot-hold'), body)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('15:00', self.api.get(reverse('available-slots'), params).data)
+
+        # Nobody else can hold or book the slot, the holder's booking consumes the hold
+        self.api.force_authenticate(other)
+        self.assertEqual(self.api.post(reverse('create-slot-hold'), body).status_code, 400)
+        self.assertEqual(self.api.post(reverse('create-appointment'), body).status_code, 400)
+        self.assertEqual(self.api.delete(reverse('release-slot-hold', args=[response.data['id']])).status_code, 404)
+        self.api.force_authenticate(self.client_user)
+        self.assertEqual(self.api.post(reverse('create-appointment'), body).status_code, 201)
+        self.assertFalse(SlotHold.objects.exists())
+
+        # Expired holds stop blocking bookings and newly computed days at
+        # once, and days stored while they were active once swept
+        self.api.force_authenticate(other)
+        body['time'] = '16:00'
+        search = {'service_id': self.service.id, 'employee_ids': str(self.employees[0].id),
+                  'start_date': self.date.isoformat(), 'end_date': self.date.isoformat()}
+
+        def searched():
+            return self.api.get(reverse('available-slots-search'), search).data['results'][0]['slots'][self.date.isoformat()]
+
+        self.assertEqual(self.api.post(reverse('create-slot-hold'), body).status_code, 201)
+        self.assertNotIn('16:00', searched())
+        SlotHold.objects.update(expires_at=timezone.now())
+        self.assertIn('16:00', self.api.get(reverse('available-slots'), params).data)
+        self.assertNotIn('16:00', searched())
+        call_command('sweep_holds', stdout=StringIO())
+        self.assertIn('16:00', searched())
@@ -5,6 +5,21 @@ urlpatterns = [
     path('services/', views.get_services, name='services'),
     path('employees/', views.get_employees, name='employees'),
     path('available-slots/', views.get_available_slots, name='available-slots'),
+    path('available-slots/search/', views.search_available_slots, name='available-slots-search'),
+    path('available-slots/search/async/', views.search_available_slots_async,
+         name='available-slots-search-async'),
+    path('available-slots/next/', views.next_available_slots, name='available-slots-next'),
+    path('availability/block-out/', views.block_out_availability, name='availability-block-out'),
+    path('availability/limit-hours/', views.limit_availability_hours, name='availability-limit-hours'),
+    path('availability/copy-week/', views.copy_availability_week, name='availability-copy-week'),
+    path('cache-stats/', views.get_cache_stats, name='cache-stats'),
+    path('reports/utilization/', views.get_utilization_report, name='utilization-report'),
     path('appointments/', views.get_appointments, name='appointments'),
     path('appointments/create/', views.create_appointment, name='create-appointment'),
+    path('appointments/batch/', views.create_appointments_batch, name='create-appointments-batch'),
+    path('appointments/holds/', views.create_slot_hold, name='create-slot-hold'),
+    path('appointments/holds/<int:hold_id>/', views.release_slot_hold, name='release-slot-hold'),
+    path('feeds/', views.get_calendar_feeds, name='calendar-feeds'),
+    path('feeds/employees/<int:employee_id>.ics', views.employee_calendar_feed, name='employee-calendar-feed'),
+    path('feeds/users/<int:user_id>.ics', views.user_calendar_feed, name='user-calendar-feed'),
 ]
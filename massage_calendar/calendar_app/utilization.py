@@ -0,0 +1,140 @@
+"""
+Daily utilization summaries for reporting.
+
+`DailyUtilization` holds, per employee and day, the available minutes (the
+expanded availability windows), the minutes booked by scheduled, completed
+and no-show appointments, and the number of appointments in each status.
+Rows are recomputed for the affected days inside the transaction of every
+write (see `calendar_app.signals.days_changed`) from that day's rows only,
+or just incremented for new bookings (see `book`), and computed on first read for days nobody has written to, so reports read
+one row per employee and day however many appointments there are. The
+`rebuild_utilization` command recomputes a whole range, e.g. after a
+backfill.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+
+from .models import Appointment, DailyUtilization
+from .slots import date_range, load_pairs, merge_intervals
+
+STATUS_FIELDS = ('scheduled', 'completed', 'cancelled', 'no_show')
+BOOKED_STATUSES = ('scheduled', 'completed', 'no_show')
+FIELDS = ('available_minutes', 'booked_minutes') + STATUS_FIELDS
+
+
+def _rows(pairs, loaded):
+    employee_ids = {employee_id for employee_id, _ in pairs}
+    dates = {date for _, date in pairs}
+    outcomes = defaultdict(lambda: {'booked_minutes': 0, **dict.fromkeys(STATUS_FIELDS, 0)})
+    for employee_id, date, status, count, minutes in Appointment.objects.filter(
+        employee_id__in=employee_ids,
+        date__gte=min(dates),
+        date__lte=max(dates)
+    ).values_list('employee_id', 'date', 'status').annotate(
+        count=Count('id'), minutes=Sum('duration')
+    ).order_by():
+        day = outcomes[(employee_id, date)]
+        if status in STATUS_FIELDS:
+            day[status] += count
+        if status in BOOKED_STATUSES:
+            day['booked_minutes'] += minutes or 0
+
+    rows = []
+    for employee_id, date in pairs:
+        windows, _ = loaded.get((employee_id, date), ([], []))
+        rows.append(DailyUtilization(
+            employee_id=employee_id, date=date,
+            available_minutes=sum(end - start for start, end in merge_intervals(windows)),
+            **outcomes[(employee_id, date)]
+        ))
+    return rows
+
+
+def refresh_days(pairs, loaded=None):
+    """
+    Recompute and store the summaries of the given `(employee_id, date)`
+    days. `loaded` is the result of `load_pairs(pairs)` when the caller has it.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    DailyUtilization.objects.bulk_create(
+        _rows(pairs, load_pairs(pairs) if loaded is None else loaded),
+        update_conflicts=True,
+        unique_fields=['employee', 'date'],
+        update_fields=list(FIELDS)
+    )
+
+
+def book(appointments):
+    """
+    Count new scheduled appointments in the stored summaries of their days,
+    without recomputing the days. Returns the days that have no stored
+    summary yet.
+    """
+    added = defaultdict(lambda: [0, 0])
+    for appointment in appointments:
+        day = added[(appointment.employee_id, appointment.date)]
+        day[0] += 1
+        day[1] += appointment.duration
+    if not added:
+        return set()
+    days = reduce(or_, (Q(employee_id=employee_id, date=date) for employee_id, date in added))
+    stored = set(DailyUtilization.objects.filter(days).values_list('employee_id', 'date'))
+    if stored:
+        # Added in the database, so concurrent bookings of a day all count
+        DailyUtilization.objects.filter(days).update(**{
+            field: F(field) + Case(
+                *(When(employee_id=employee_id, date=date, then=Value(added[(employee_id, date)][index]))
+                  for employee_id, date in stored),
+                default=Value(0)
+            )
+            for index, field in enumerate(('scheduled', 'booked_minutes'))
+        })
+    return set(added) - stored
+
+
+def get_days(employee_ids, start_date, end_date):
+    """
+    Return the `DailyUtilization` rows of every employee and day in the
+    range, computing missing days on the way.
+    """
+    rows = {
+        (row.employee_id, row.date): row
+        for row in DailyUtilization.objects.filter(
+            employee_id__in=employee_ids,
+            date__gte=start_date,
+            date__lte=end_date
+        )
+    }
+    missing = [
+        (employee_id, date)
+        for employee_id in employee_ids
+        for date in date_range(start_date, end_date)
+        if (employee_id, date) not in rows
+    ]
+    if missing:
+        computed = _rows(missing, load_pairs(missing))
+        # Never overwrite rows a concurrent write has just refreshed
+        DailyUtilization.objects.bulk_create(computed, ignore_conflicts=True)
+        rows.update({(row.employee_id, row.date): row for row in computed})
+    return [rows[key] for key in sorted(rows, key=lambda key: (key[1], key[0]))]
+
+
+def totals(rows):
+    """
+    Sum summary rows and derive the utilization, no-show and cancellation
+    rates (None when undefined).
+    """
+    total = {field: sum(getattr(row, field) for row in rows) for field in FIELDS}
+    appointments = sum(total[field] for field in STATUS_FIELDS)
+    attended = total['completed'] + total['no_show']
+    total['utilization'] = (
+        round(total['booked_minutes'] / total['available_minutes'], 4) if total['available_minutes'] else None
+    )
+    total['no_show_rate'] = round(total['no_show'] / attended, 4) if attended else None
+    total['cancellation_rate'] = round(total['cancelled'] / appointments, 4) if appointments else None
+    return total
@@ -1,40 +1,77 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db.models import Q, F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils import timezone
+from django.views.decorators.http import require_safe
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from datetime import datetime, timedelta
+import time
+from collections import defaultdict
+from datetime import datetime
+from users.authentication import ClaimsJWTAuthentication, get_user_instance
+from users.permissions import IsManager
+from . import availability, cache, holds, ical, occupancy, utilization
+from .booking import BatchValidationError, book_appointment, book_appointments
+from .catalog import catalog_response
+from .exports import stream_csv, stream_json
 from .models import Service, Employee, Availability, Appointment
+from .pagination import paginate
 from .serializers import (ServiceSerializer, EmployeeSerializer,
-                          AvailabilitySerializer, AppointmentSerializer)
+                          AvailabilitySerializer, AppointmentSerializer, BatchAppointmentSerializer,
+                          BlockOutSerializer, CopyWeekSerializer, LimitHoursSerializer, SlotHoldSerializer)
+from .slots import compute_available_slots, date_range, from_minutes
+
+# Longest date range accepted by the availability search endpoint.
+MAX_SEARCH_DAYS = 31
 
 
 @api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
 def get_services(request):
     """
     Retrieve all active services.
     """
-    services = Service.objects.filter(active=True)
-    serializer = ServiceSerializer(services, many=True)
-    return Response(serializer.data)
+    def build():
+        services = Service.objects.filter(active=True)
+        return ServiceSerializer(services, many=True).data
+
+    return catalog_response(request, 'services', build)
 
 
 @api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
 def get_employees(request):
     """
      Retrieve all active employees or those offering a specific service.
      """
     service_id = request.GET.get('service_id')
-    if service_id:
-        employees = Employee.objects.filter(
-            active=True,
-            services__id=service_id
-        ).distinct()
-    else:
-        employees = Employee.objects.filter(active=True)
-    serializer = EmployeeSerializer(employees, many=True)
-    return Response(serializer.data)
+    if service_id and not service_id.isdigit():
+        return Response(
+            {'error': 'Invalid parameters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def build():
+        if service_id:
+            employees = Employee.objects.filter(
+                active=True,
+                services__id=service_id
+            ).distinct()
+        else:
+            employees = Employee.objects.filter(active=True)
+        # One query for the nested services of all employees
+        employees = employees.prefetch_related('services')
+        return EmployeeSerializer(employees, many=True).data
+
+    return catalog_response(request, f'employees:{service_id or "all"}', build)
 
 
 @api_view(['GET'])
@@ -46,8 +83,6 @@ def get_available_slots(request):
     employee_id = request.GET.get('employee_id')
     service_id = request.GET.get('service_id')
 
-    print(f"Received parameters: date={date_str}, employee_id={employee_id}, service_id={service_id}")
-
     if not all([date_str, employee_id, service_id]):
         return Response(
             {'error': 'Missing required parameters'},
@@ -56,78 +91,335 @@ def get_available_slots(request):
 
     try:
         date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        employee = Employee.objects.get(id=employee_id)
-        service = Service.objects.get(id=service_id)
-
-        print(f"Parsed date: {date}")
-        print(f"Employee: {employee}")
-        print(f"Service: {service}")
-    except (ValueError, Employee.DoesNotExist, Service.DoesNotExist) as e:
-        print(f"Error parsing parameters: {e}")
+        employee = Employee.objects.only('id').get(id=employee_id)
+        duration = Service.objects.values_list('duration', flat=True).get(id=service_id)
+    except (ValueError, Employee.DoesNotExist, Service.DoesNotExist):
         return Response(
             {'error': 'Invalid parameters'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Get employee's availability for the date
-    availabilities = Availability.objects.filter(
-        employee=employee,
-        date=date
+    # Free intervals are built from one availability and one appointment query
+    available_slots = compute_available_slots(employee.id, date, duration)
+    if available_slots is None:
+        return Response([], status=status.HTTP_404_NOT_FOUND)
+
+    return Response([slot.strftime('%H:%M') for slot in available_slots])
+
+
+def parse_search_params(params):
+    """
+    Parse the parameters shared by the sync and async slot search views into
+    `(service_id, start_date, end_date, employee_ids)`. Raises ValueError
+    with the message to return when they are missing or invalid.
+    """
+    service_id = params.get('service_id')
+    start_date_str = params.get('start_date')
+    end_date_str = params.get('end_date') or start_date_str
+    employee_ids = params.get('employee_ids')
+
+    if not all([service_id, start_date_str]):
+        raise ValueError('Missing required parameters')
+
+    try:
+        service_id = int(service_id)
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+        if employee_ids:
+            employee_ids = [int(pk) for pk in employee_ids.split(',')]
+    except ValueError:
+        raise ValueError('Invalid parameters')
+
+    if end_date < start_date or (end_date - start_date).days >= MAX_SEARCH_DAYS:
+        raise ValueError(f'Date range must be between 1 and {MAX_SEARCH_DAYS} days')
+    return service_id, start_date, end_date, employee_ids
+
+
+def searched_employees(service, employee_ids):
+    """
+    Only active employees offering the service are searched.
+    """
+    employees = Employee.objects.filter(active=True, services=service)
+    if employee_ids:
+        employees = employees.filter(id__in=employee_ids)
+    return employees.distinct().values_list('id', 'name')
+
+
+def employee_slots(employee_id, employee_name, found, start_date, end_date):
+    """
+    Build the search result of one employee from the slots found by
+    `occupancy.search_slots`.
+    """
+    return {
+        'employee_id': employee_id,
+        'employee_name': employee_name,
+        'slots': {
+            day.isoformat(): [from_minutes(minute).strftime('%H:%M') for minute in found[(employee_id, day)]]
+            for day in date_range(start_date, end_date)
+            if (employee_id, day) in found
+        },
+    }
+
+
+@api_view(['GET'])
+def search_available_slots(request):
+    """
+    Retrieve available time slots for a service across a date range for every
+    qualified employee, or only for the employees listed in `employee_ids`.
+    """
+    try:
+        service_id, start_date, end_date, employee_ids = parse_search_params(request.GET)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        service = Service.objects.get(id=service_id, active=True)
+    except Service.DoesNotExist:
+        return Response(
+            {'error': 'Invalid parameters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    employees = list(searched_employees(service, employee_ids))
+    # Slots of every employee and day are found at once on the occupancy bitmaps
+    found = occupancy.search_slots(
+        [employee_id for employee_id, _ in employees], start_date, end_date, service.duration
     )
-    print(f"Availabilities found: {availabilities.count()}")
+    results = [
+        employee_slots(employee_id, employee_name, found, start_date, end_date)
+        for employee_id, employee_name in employees
+    ]
+    return Response({'service_id': service.id, 'results': results})
 
-    if not availabilities.exists():
-        return Response([], status=status.HTTP_404_NOT_FOUND)
 
-    # Get existing appointments for the day
-    existing_appointments = Appointment.objects.filter(
-        employee=employee,
-        date=date,
-        status='scheduled'
+async def search_available_slots_async(request):
+    """
+    Async variant of `search_available_slots` for the ASGI entry point.
+
+    All employees are searched at once on the occupancy bitmaps like in the
+    sync view, reading the stored bitmaps with the async ORM (see
+    `occupancy.asearch_slots`). Employees whose missing days could not be
+    computed within ASYNC_SEARCH_DEADLINE seconds are left out and listed in
+    `pending_employee_ids`, with `partial` set.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'},
+                            status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    # DRF views are sync only, so the token is checked here. The user is
+    # built from the token claims; only a possibly revoked token is queried.
+    try:
+        authenticated = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if authenticated is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        service_id, start_date, end_date, employee_ids = parse_search_params(request.GET)
+        service = await Service.objects.aget(id=service_id, active=True)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Service.DoesNotExist:
+        return JsonResponse({'error': 'Invalid parameters'}, status=status.HTTP_400_BAD_REQUEST)
+
+    employees = [employee async for employee in searched_employees(service, employee_ids)]
+    found, pending = await occupancy.asearch_slots(
+        [employee_id for employee_id, _ in employees], start_date, end_date, service.duration,
+        deadline=time.monotonic() + getattr(settings, 'ASYNC_SEARCH_DEADLINE', 2.0)
     )
+    results = [
+        employee_slots(employee_id, employee_name, found, start_date, end_date)
+        for employee_id, employee_name in employees
+        if employee_id not in pending
+    ]
+    return JsonResponse({
+        'service_id': service.id,
+        'results': results,
+        'partial': bool(pending),
+        'pending_employee_ids': pending,
+    })
 
-    available_slots = []
-
-    for availability in availabilities:
-        current_time = availability.start_time
-        end_time = availability.end_time
-        print(f"Checking availability: {current_time} to {end_time}")
-
-        while current_time <= end_time:
-            # Check if this slot allows enough time for the service
-            slot_datetime = datetime.combine(date, current_time)
-            slot_end_datetime = slot_datetime + timedelta(minutes=service.duration)
-
-            # Verify the slot is within the availability period
-            if slot_end_datetime.time() > end_time:
-                break
-
-            # Check for conflicts with existing appointments
-            has_conflicts = any(
-                (
-                    # Check if new slot overlaps with existing appointment
-                        current_time < appt.time < slot_end_datetime.time() or
-                        # Check if existing appointment overlaps with new slot
-                        appt.time < slot_end_datetime.time() and
-                        (datetime.combine(date, appt.time) + timedelta(
-                            minutes=appt.service.duration)).time() > current_time
-                )
-                for appt in existing_appointments
-            )
 
-            # If no conflicts, add the slot
-            if not has_conflicts:
-                available_slots.append(current_time.strftime('%H:%M'))
+@api_view(['GET'])
+def next_available_slots(request):
+    """
+    Retrieve the earliest free slots for a service with any qualified
+    employee, or only with the employees listed in `employee_ids`.
+
+    Looks forward from `after` (an ISO datetime, default now) for at most
+    NEXT_AVAILABLE_HORIZON_DAYS days and returns up to `limit` slots.
+    """
+    service_id = request.GET.get('service_id')
+    after = request.GET.get('after')
+    employee_ids = request.GET.get('employee_ids')
+    max_limit = getattr(settings, 'NEXT_AVAILABLE_MAX_LIMIT', 50)
+
+    if not service_id:
+        return Response(
+            {'error': 'Missing required parameters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        limit = int(request.GET.get('limit', 5))
+        if not 0 < limit <= max_limit:
+            raise ValueError
+        now = timezone.localtime()
+        if after:
+            after = datetime.fromisoformat(after)
+            after = timezone.localtime(after) if timezone.is_aware(after) else after
+            # Slots in the past cannot be booked
+            after = max(after.replace(tzinfo=None), now.replace(tzinfo=None))
+        else:
+            after = now.replace(tzinfo=None)
+        if employee_ids:
+            employee_ids = [int(pk) for pk in employee_ids.split(',')]
+        service = Service.objects.get(id=service_id, active=True)
+    except (ValueError, Service.DoesNotExist):
+        return Response(
+            {'error': 'Invalid parameters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    employees = dict(searched_employees(service, employee_ids))
+    if not employees:
+        return Response({'service_id': service.id, 'results': []})
+
+    # Round the start up to the next full minute
+    after_minute = after.hour * 60 + after.minute + (1 if after.second or after.microsecond else 0)
+    slots = occupancy.next_available(
+        list(employees), after.date(), after_minute, service.duration, limit,
+        getattr(settings, 'NEXT_AVAILABLE_HORIZON_DAYS', 90)
+    )
+    return Response({
+        'service_id': service.id,
+        'results': [
+            {
+                'employee_id': employee_id,
+                'employee_name': employees[employee_id],
+                'date': day.isoformat(),
+                'time': from_minutes(minute).strftime('%H:%M'),
+            }
+            for day, minute, employee_id in slots
+        ],
+    })
+
+
+def edit_availability(request, serializer_class, operation):
+    """
+    Validate the request body with `serializer_class` and run the
+    availability operation with the validated data.
+    """
+    serializer = serializer_class(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return Response(operation(**serializer.validated_data))
+
+
+@api_view(['POST'])
+@permission_classes([IsManager])
+def block_out_availability(request):
+    """
+    Block out a span, or whole days without times, for several employees
+    over a date range, e.g. a vacation.
+
+    Responds with the number of rows created and the scheduled appointments
+    that now conflict; with `dry_run` nothing is saved.
+    """
+    return edit_availability(request, BlockOutSerializer, availability.block_out)
+
+
+@api_view(['POST'])
+@permission_classes([IsManager])
+def limit_availability_hours(request):
+    """
+    Limit the working hours of several employees to `start_time`-`end_time`
+    on the given weekdays (Monday is 0) of a date range.
+
+    Responds with the rows created and deleted and the scheduled
+    appointments that now conflict; with `dry_run` nothing is saved.
+    """
+    return edit_availability(request, LimitHoursSerializer, availability.limit_hours)
+
+
+@api_view(['POST'])
+@permission_classes([IsManager])
+def copy_availability_week(request):
+    """
+    Copy the working hours of the week starting at `source_start` to the
+    following `weeks` weeks for several employees.
+
+    Responds with the rows created and deleted and the scheduled
+    appointments that now conflict; with `dry_run` nothing is saved.
+    """
+    return edit_availability(request, CopyWeekSerializer, availability.copy_week)
+
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def get_utilization_report(request):
+    """
+    Report booked versus available minutes and no-show and cancellation
+    rates per employee and day, with totals per employee and overall.
 
-            # Move to next slot (30-minute increments)
-            current_time = (
-                    datetime.combine(date, current_time) +
-                    timedelta(minutes=30)
-            ).time()
+    Reads one summary row per employee and day (see
+    `calendar_app.utilization`), so the cost does not depend on the number
+    of appointments. `start_date` and `end_date` are required,
+    `employee_ids` optionally limits the employees.
+    """
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date') or start_date_str
+    employee_ids = request.GET.get('employee_ids')
+    if not start_date_str:
+        return Response({'error': 'Missing required parameters'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+        if employee_ids:
+            employee_ids = [int(pk) for pk in employee_ids.split(',')]
+    except ValueError:
+        return Response({'error': 'Invalid parameters'}, status=status.HTTP_400_BAD_REQUEST)
+    max_days = getattr(settings, 'UTILIZATION_REPORT_MAX_DAYS', 366)
+    if end_date < start_date or (end_date - start_date).days >= max_days:
+        return Response({'error': f'Date range must be between 1 and {max_days} days'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    employees = Employee.objects.order_by('name', 'id')
+    if employee_ids:
+        employees = employees.filter(id__in=employee_ids)
+    names = dict(employees.values_list('id', 'name'))
+    rows = utilization.get_days(list(names), start_date, end_date) if names else []
+
+    by_employee = defaultdict(list)
+    for row in rows:
+        by_employee[row.employee_id].append(row)
+    return Response({
+        'start_date': start_date,
+        'end_date': end_date,
+        'totals': utilization.totals(rows),
+        'employees': [
+            {
+                'employee_id': employee_id,
+                'employee_name': name,
+                'totals': utilization.totals(by_employee[employee_id]),
+                'days': [
+                    {'date': row.date, **{field: getattr(row, field) for field in utilization.FIELDS}}
+                    for row in by_employee[employee_id]
+                ],
+            }
+            for employee_id, name in names.items()
+        ],
+    })
 
-    print(f"Available slots: {available_slots}")
-    return Response(available_slots)
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_cache_stats(request):
+    """
+    Retrieve free-interval cache hit/miss counters for this process.
+    """
+    return Response(cache.stats())
 
 
 @api_view(['GET'])
@@ -135,10 +427,14 @@ def get_available_slots(request):
 def get_appointments(request):
     """
     Retrieve appointments for the current user or all appointments if the user is a manager.
+
+    Results are paginated with a keyset cursor: the next page is linked in the
+    `Link` header (rel="next"). `page_size` sets the number of appointments per
+    page, and `export=csv` or `export=json` streams every matching appointment
+    instead of returning a page.
     """
-    # Robust manager check
-    is_manager = request.user.groups.filter(name__iexact='Managers').exists()
-    print("All Groups:", list(request.user.groups.values_list('name', flat=True)))
+    # Cached role lookup (see users.roles)
+    is_manager = request.user.is_manager
 
     # Base queryset
     if is_manager:
@@ -146,7 +442,7 @@ def get_appointments(request):
         queryset = Appointment.objects.all()
     else:
         # Regular users see only their own appointments
-        queryset = Appointment.objects.filter(user=request.user)
+        queryset = Appointment.objects.filter(user_id=request.user.id)
 
     # Get query parameters
     date = request.GET.get('date')
@@ -162,27 +458,110 @@ def get_appointments(request):
         else:
             queryset = queryset.filter(date=date)
 
-    # Extensive logging
-    print(f"Current User: {request.user.username}")
-    print(f"Is Manager: {is_manager}")
-    print(f"Total Appointments Found: {queryset.count()}")
-
-    # Detailed appointment logging
-    for appt in queryset:
-        print(
-            f"Appointment - "
-            f"ID: {appt.id}, "
-            f"User: {appt.user.username}, "
-            f"Date: {appt.date}, "
-            f"Time: {appt.time}, "
-            f"Status: {appt.status}"
+    export = request.GET.get('export')
+    if export == 'csv':
+        response = StreamingHttpResponse(stream_csv(queryset), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="appointments.csv"'
+        return response
+    if export == 'json':
+        return StreamingHttpResponse(stream_json(queryset), content_type='application/json')
+    if export:
+        return Response({'error': 'Unsupported export format'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        page_size = min(
+            int(request.GET.get('page_size', settings.APPOINTMENTS_PAGE_SIZE)),
+            settings.APPOINTMENTS_MAX_PAGE_SIZE
         )
+        if page_size < 1:
+            raise ValueError
+        # Use select_related to optimize query and fetch related data
+        appointments, next_cursor = paginate(
+            queryset.select_related('user', 'service', 'employee'),
+            request.GET.get('cursor'),
+            page_size
+        )
+    except (ValueError, ValidationError):
+        return Response({'error': 'Invalid parameters'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Use select_related to optimize query and fetch related data
-    queryset = queryset.select_related('user', 'service', 'employee')
+    serializer = AppointmentSerializer(appointments, many=True)
+    response = Response(serializer.data)
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        response['Link'] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+    return response
 
-    serializer = AppointmentSerializer(queryset, many=True)
-    return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_calendar_feeds(request):
+    """
+    Return the iCalendar feed URLs of the current user, and of every employee
+    for managers. The URLs are signed and work without a token.
+    """
+    def feed_url(kind, object_id):
+        url = reverse(f'{kind}-calendar-feed', args=[object_id])
+        return request.build_absolute_uri(f'{url}?token={ical.feed_signature(kind, object_id)}')
+
+    feeds = {'user': feed_url('user', request.user.id)}
+    if request.user.is_manager:
+        feeds['employees'] = [
+            {'id': employee_id, 'name': name, 'url': feed_url('employee', employee_id)}
+            for employee_id, name in Employee.objects.order_by('name', 'id').values_list('id', 'name')
+        ]
+    return Response(feeds)
+
+
+def calendar_feed(request, kind, object_id, queryset, get_name):
+    """
+    Serve one iCalendar feed: a 304 when it has not changed since the
+    client's copy, the streamed calendar otherwise.
+    """
+    if not ical.valid_signature(kind, object_id, request.GET.get('token')):
+        return JsonResponse({'error': 'Invalid feed token'}, status=status.HTTP_403_FORBIDDEN)
+
+    etag, last_modified = ical.feed_state(queryset, f'{kind}:{object_id}')
+    # Only the ETag is compared: Last-Modified cannot tell that a row was deleted
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        name = get_name()
+        if name is None:
+            return JsonResponse({'error': 'Feed not found'}, status=status.HTTP_404_NOT_FOUND)
+        response = StreamingHttpResponse(
+            ical.stream_feed(queryset, name, request.get_host()),
+            content_type='text/calendar; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'inline; filename="{kind}-{object_id}.ics"'
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@require_safe
+def employee_calendar_feed(request, employee_id):
+    """
+    iCalendar feed of the appointments of one employee.
+    """
+    return calendar_feed(
+        request, 'employee', employee_id,
+        ical.feed_queryset(employee_id=employee_id),
+        lambda: Employee.objects.filter(id=employee_id).values_list('name', flat=True).first()
+    )
+
+
+@require_safe
+def user_calendar_feed(request, user_id):
+    """
+    iCalendar feed of the appointments of one client.
+    """
+    return calendar_feed(
+        request, 'user', user_id,
+        ical.feed_queryset(user_id=user_id),
+        lambda: 'My appointments'
+    )
 
 
 @api_view(['POST'])
@@ -197,9 +576,79 @@ def create_appointment(request):
     serializer = AppointmentSerializer(data=data)
     if serializer.is_valid():
         try:
-            appointment = serializer.save()
-            appointment.full_clean()  # Run model validation
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Validation and insert run in one transaction holding the employee's day
+            appointment = book_appointment(**serializer.validated_data)
         except ValidationError as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': ' '.join(e.messages)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(AppointmentSerializer(appointment).data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_appointments_batch(request):
+    """
+    Create several appointments for the authenticated user at once.
+
+    Expects `{"appointments": [...]}` with the same fields as
+    `create_appointment`. Either every appointment is booked or none is; on
+    failure `items` lists the errors of each rejected appointment by its
+    position in the request.
+    """
+    items = request.data.get('appointments') if hasattr(request.data, 'get') else None
+    max_items = getattr(settings, 'BATCH_BOOKING_MAX_ITEMS', 50)
+    if not isinstance(items, list) or not 0 < len(items) <= max_items:
+        return Response(
+            {'error': f'appointments must be a list of 1 to {max_items} appointments'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    serializer = BatchAppointmentSerializer(data=items, many=True)
+    if not serializer.is_valid():
+        return Response({
+            'error': 'Some appointments could not be booked',
+            'items': [
+                {'index': index, 'errors': errors}
+                for index, errors in enumerate(serializer.errors) if errors
+            ],
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        appointments = book_appointments(get_user_instance(request.user), serializer.validated_data)
+    except BatchValidationError as e:
+        return Response({
+            'error': e.message,
+            'items': [{'index': index, 'errors': errors} for index, errors in e.item_errors.items()],
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return Response(AppointmentSerializer(appointments, many=True).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_slot_hold(request):
+    """
+    Hold a slot for the authenticated user while they check out.
+
+    Expects `service`, `employee`, `date` and `time` like
+    `create_appointment`. The slot disappears from other clients' searches
+    and only this user can book it until `expires_at`.
+    """
+    serializer = SlotHoldSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        hold = holds.place_hold(request.user.id, **serializer.validated_data)
+    except ValidationError as e:
+        return Response({'error': ' '.join(e.messages)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(SlotHoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def release_slot_hold(request, hold_id):
+    """
+    Release one of the authenticated user's holds before it expires.
+    """
+    if not holds.release_hold(request.user.id, hold_id):
+        return Response({'error': 'Hold not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,155 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+`ReplicaRoutingMiddleware` lets the reads of GET and HEAD requests go to one
+of the `DATABASE_REPLICAS`, picked once per request; every other request,
+and all code running outside a request (management commands, signals fired
+by them), uses the primary. After a successful write request the client is
+pinned to the primary for `REPLICA_PIN_SECONDS`, so users see their own
+bookings despite replication lag. Browsers are pinned with a cookie. Token
+clients that do not keep cookies get a signed, timestamped `X-Primary-Pin`
+response header and send it back on their next requests; it needs no state
+on the server, so every worker process honours it. A replica that cannot be connected to is skipped for
+`REPLICA_RETRY_SECONDS` and its reads fall back to the primary. Writes always
+go to the primary, including saves of objects read from a replica.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signing import BadSignature, TimestampSigner
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from . import metrics
+
+PIN_COOKIE = 'primary_pin'
+PIN_HEADER = 'X-Primary-Pin'
+PIN_SALT = 'studio_massage_calendar.db.pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+logger = logging.getLogger(__name__)
+
+# The replica chosen for the current request; None routes reads to the primary
+_routing = ContextVar('db_routing', default=None)
+_down_until = {}
+
+metrics.COUNTERS['db_replica_failovers_total'] = 'Replica connection failures that sent reads to the primary.'
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def choose_replica():
+    """
+    Return a reachable replica alias, or the primary when none is.
+    """
+    now = time.monotonic()
+    candidates = [alias for alias in replicas() if _down_until.get(alias, 0) <= now]
+    random.shuffle(candidates)
+    for alias in candidates:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Replica %s is unreachable, reading from the primary', alias, exc_info=True)
+            _down_until[alias] = now + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+            metrics.inc('db_replica_failovers_total', (('alias', alias),))
+            continue
+        return alias
+    return DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the replica chosen for the current request and
+    everything else to the primary.
+    """
+    def db_for_read(self, model, **hints):
+        # The database cache holds versions that must never lag behind
+        if model._meta.app_label == 'django_cache':
+            return DEFAULT_DB_ALIAS
+        state = _routing.get()
+        if state is None:
+            return DEFAULT_DB_ALIAS
+        if state['alias'] is None:
+            state['alias'] = choose_replica()
+        return state['alias']
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+def is_pinned(request):
+    """
+    Whether the request carries a pin cookie or a valid, unexpired pin header.
+    """
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    value = request.headers.get(PIN_HEADER)
+    if not value:
+        return False
+    try:
+        TimestampSigner(salt=PIN_SALT).unsign(value, max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+    except BadSignature:
+        return False
+    return True
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Enables replica reads for safe requests of clients that have not written
+    recently, and pins clients to the primary after they write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _routing.set(self.routing(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = _routing.set(self.routing(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        self.pin(request, response)
+        return response
+
+    def routing(self, request):
+        if request.method not in SAFE_METHODS or is_pinned(request):
+            return None
+        return {'alias': None}
+
+    def pin(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return
+        seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+        if 'HTTP_AUTHORIZATION' in request.META:
+            response[PIN_HEADER] = TimestampSigner(salt=PIN_SALT).sign('primary')
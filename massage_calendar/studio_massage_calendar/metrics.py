@@ -0,0 +1,379 @@
+"""
+Per-view request metrics exported in the Prometheus text format.
+
+`MetricsMiddleware` records, for every request, the latency, the number of
+database queries and the time spent in them and the response size, labelled
+with the URL name of the view. Queries are counted by an execute wrapper
+installed on every connection, which adds them to the recorder of the
+request in a context variable, so queries that async views run in
+`sync_to_async` threads are counted too. Streaming responses are recorded
+once their body has been sent. Values are kept in process memory; when `METRICS_DIR` is
+set, every process also writes a snapshot of its values to that directory at
+most every `METRICS_FLUSH_INTERVAL` seconds, and the `/metrics` view sums the
+snapshots of all worker processes. Only the addresses in
+`METRICS_ALLOWED_IPS`, or scrapers sending the `METRICS_TOKEN` bearer token,
+may read `/metrics`.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency by view.', LATENCY_BUCKETS),
+    'http_request_db_queries': ('Database queries per request by view.', QUERY_COUNT_BUCKETS),
+    'http_request_db_duration_seconds': ('Time spent in database queries per request by view.',
+                                         LATENCY_BUCKETS),
+    'http_response_size_bytes': ('Response body size by view.', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'http_requests_total': 'Requests by view, method and status code.',
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = []
+_last_flush = 0.0
+# Recorder of the request being handled, seen by every thread working on it
+_recorder = ContextVar('metrics_recorder', default=None)
+
+
+def register_collector(collector, descriptions=None):
+    """
+    Register a callable returning `{(name, labels): value}` counter values
+    that are added to every export (e.g. cache hit/miss counters), with
+    optional `{name: help text}` descriptions.
+    """
+    _collectors.append(collector)
+    COUNTERS.update(descriptions or {})
+
+
+def inc(name, labels, value=1):
+    with _lock:
+        key = (name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    buckets = HISTOGRAMS[name][1]
+    with _lock:
+        key = (name, labels)
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+        histogram['buckets'][bisect_left(buckets, value)] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def reset():
+    """
+    Drop the values recorded by this process.
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def snapshot():
+    """
+    Return the values of this process in a JSON-serializable form.
+    """
+    with _lock:
+        counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [
+            [name, list(labels), {**histogram, 'buckets': list(histogram['buckets'])}]
+            for (name, labels), histogram in _histograms.items()
+        ]
+    for collector in _collectors:
+        counters.extend([name, list(labels), value] for (name, labels), value in collector().items())
+    return {'counters': counters, 'histograms': histograms}
+
+
+def flush(force=False):
+    """
+    Write this process' snapshot to METRICS_DIR, at most once per
+    METRICS_FLUSH_INTERVAL unless forced.
+    """
+    global _last_flush
+    directory = getattr(settings, 'METRICS_DIR', None)
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)):
+        return
+    _last_flush = now
+    os.makedirs(directory, exist_ok=True)
+    # Write to a temporary file first so readers never see a partial snapshot
+    handle, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w') as output:
+        json.dump(snapshot(), output)
+    os.replace(path, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+def collect():
+    """
+    Merge the snapshots of all processes (or just this one when METRICS_DIR
+    is not set).
+    """
+    snapshots = [snapshot()]
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if directory and os.path.isdir(directory):
+        own = f'{os.getpid()}.json'
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                continue
+
+    counters = {}
+    histograms = {}
+    for data in snapshots:
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, histogram in data['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            merged = histograms.setdefault(
+                key, {'buckets': [0] * len(histogram['buckets']), 'sum': 0.0, 'count': 0}
+            )
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], histogram['buckets'])]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render():
+    """
+    Render all metrics in the Prometheus text exposition format.
+    """
+    counters, histograms = collect()
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# HELP {name} {COUNTERS.get(name, name)}')
+        lines.append(f'# TYPE {name} counter')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        entries = sorted((labels, value) for (metric, labels), value in histograms.items() if metric == name)
+        if not entries:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, histogram in entries:
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], histogram['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _may_scrape(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+
+
+def metrics_view(request):
+    """
+    Expose the collected metrics for Prometheus to scrape.
+    """
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting queries and the time spent in them.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def _execute(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection):
+    """
+    Add the query recorder to a connection, once.
+    """
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+def _install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_install_on_connect)
+
+
+class _Measurement:
+    """
+    Queries, start time and body size of one request, recorded by `done`
+    exactly once.
+    """
+    def __init__(self, done):
+        self.recorder = QueryRecorder()
+        self.started = time.perf_counter()
+        self.size = 0
+        self.done = done
+
+    def finish(self):
+        if self.done is not None:
+            done, self.done = self.done, None
+            done(self)
+
+
+def _recorded(chunks, measurement):
+    """
+    Wrap the body of a sync streaming response, counting its size and the
+    queries run while producing it.
+    """
+    chunks = iter(chunks)
+    try:
+        while True:
+            token = _recorder.set(measurement.recorder)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                _recorder.reset(token)
+            measurement.size += len(chunk)
+            yield chunk
+    finally:
+        measurement.finish()
+
+
+async def _arecorded(chunks, measurement):
+    """
+    Async version of `_recorded`.
+    """
+    chunks = aiter(chunks)
+    try:
+        while True:
+            token = _recorder.set(measurement.recorder)
+            try:
+                chunk = await anext(chunks)
+            except StopAsyncIteration:
+                break
+            finally:
+                _recorder.reset(token)
+            measurement.size += len(chunk)
+            yield chunk
+    finally:
+        measurement.finish()
+
+
+class MetricsMiddleware:
+    """
+    Records latency, query count, query time and response size per view.
+    Supports both sync and async requests, so async views are not forced
+    onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was loaded
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        measurement = _Measurement(lambda measurement: self.record(request, response, measurement))
+        token = _recorder.set(measurement.recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(response, measurement)
+
+    async def __acall__(self, request):
+        measurement = _Measurement(lambda measurement: self.record(request, response, measurement))
+        token = _recorder.set(measurement.recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(response, measurement)
+
+    def finish(self, response, measurement):
+        """
+        Record a response now, or a streaming one once its body has been
+        sent, so the time and queries spent producing the body count.
+        """
+        if not response.streaming:
+            measurement.size = len(response.content)
+            measurement.finish()
+        elif response.is_async:
+            response.streaming_content = _arecorded(response.streaming_content, measurement)
+        else:
+            response.streaming_content = _recorded(response.streaming_content, measurement)
+        return response
+
+    def record(self, request, response, measurement):
+        match = request.resolver_match
+        view = (match.view_name if match else None) or 'unmatched'
+        if view == 'metrics':
+            return
+        labels = (('view', view),)
+        inc('http_requests_total', labels + (('method', request.method), ('status', str(response.status_code))))
+        observe('http_request_duration_seconds', labels, time.perf_counter() - measurement.started)
+        observe('http_request_db_queries', labels, measurement.recorder.count)
+        observe('http_request_db_duration_seconds', labels, measurement.recorder.duration)
+        observe('http_response_size_bytes', labels, measurement.size)
+        flush()
@@ -0,0 +1,206 @@
+"""
+Opt-in request profiler.
+
+When `PROFILING_ENABLED` is set, `ProfilingMiddleware` profiles a request
+with cProfile and records the SQL it executed when the request either
+carries a valid signed `X-Profile-Token` header (see the `profile_token`
+management command) or is picked by `PROFILING_SAMPLE_RATE`. Profiles of
+requests slower than `PROFILING_THRESHOLD_MS` (or of every request with a
+token) are written to `PROFILING_DIR`, which keeps only the newest
+`PROFILING_MAX_FILES` profiles. Staff can list and download them through the
+admin-only endpoints below. When disabled the middleware removes itself from
+the stack, so it adds no overhead.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+TOKEN_SALT = 'studio_massage_calendar.profiling'
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+PROFILE_NAME = re.compile(r'^[\w.-]+\.json$')
+STATS_LINES = 60
+
+# Only one cProfile profiler can be active at a time on recent Python
+# versions, so concurrent requests are not profiled while one is running.
+_profiler_lock = threading.Lock()
+
+
+def make_token():
+    """
+    Build a signed token that requests a profile through the X-Profile-Token
+    header until PROFILING_TOKEN_MAX_AGE expires.
+    """
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def _valid_token(value):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _directory():
+    return getattr(settings, 'PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'calendar-profiles'))
+
+
+class SQLRecorder:
+    """
+    Database execute wrapper keeping each query with its duration.
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': repr(params),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests selected by a signed header or by sampling.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.threshold_ms = getattr(settings, 'PROFILING_THRESHOLD_MS', 500)
+
+    def __call__(self, request):
+        token = request.META.get(TOKEN_HEADER)
+        forced = bool(token) and _valid_token(token)
+        sampled = not forced and self.sample_rate and random.random() < self.sample_rate
+        if not (forced or sampled) or not _profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            recorder = SQLRecorder()
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+            duration_ms = (time.perf_counter() - started) * 1000
+        finally:
+            _profiler_lock.release()
+
+        if forced or duration_ms >= self.threshold_ms:
+            save_profile(request, response, profiler, recorder.queries, duration_ms, forced)
+        return response
+
+
+def save_profile(request, response, profiler, queries, duration_ms, forced):
+    """
+    Write one profile to the ring buffer and drop the oldest ones beyond
+    PROFILING_MAX_FILES.
+    """
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(STATS_LINES)
+    match = request.resolver_match
+    view = (match.view_name if match else None) or 'unmatched'
+    created = datetime.now(timezone.utc)
+    profile = {
+        'created': created.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': view,
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 3),
+        'trigger': 'token' if forced else 'sample',
+        'query_count': len(queries),
+        'query_duration_ms': round(sum(query['duration_ms'] for query in queries), 3),
+        'queries': queries,
+        'stats': output.getvalue(),
+    }
+
+    directory = _directory()
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r'[^\w-]', '_', view)
+    name = f"{created.strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}-{slug}.json"
+    handle, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w') as file:
+        json.dump(profile, file, indent=2)
+    os.replace(path, os.path.join(directory, name))
+
+    # Names start with the timestamp, so sorting them orders by age
+    names = sorted(name for name in os.listdir(directory) if PROFILE_NAME.match(name))
+    for name in names[:-getattr(settings, 'PROFILING_MAX_FILES', 100)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def list_profiles(request):
+    """
+    List the stored profiles, newest first.
+    """
+    directory = _directory()
+    if not os.path.isdir(directory):
+        return Response([])
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not PROFILE_NAME.match(name):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                profile = json.load(file)
+        except (OSError, ValueError):
+            continue
+        profiles.append({
+            'name': name,
+            **{key: profile[key] for key in ('created', 'method', 'path', 'view', 'status',
+                                             'duration_ms', 'trigger', 'query_count', 'query_duration_ms')},
+        })
+    return Response(profiles)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def download_profile(request, name):
+    """
+    Download a single profile as a JSON file.
+    """
+    path = os.path.join(_directory(), name)
+    if not PROFILE_NAME.match(name) or not os.path.isfile(path):
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name,
+                        content_type='application/json')
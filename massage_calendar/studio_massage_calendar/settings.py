@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Base directory of the project.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -36,6 +39,9 @@ INSTALLED_APPS = [
 
 # Middleware configuration.
 MIDDLEWARE = [
+    'studio_massage_calendar.metrics.MetricsMiddleware',  # Per-view latency and query metrics.
+    'studio_massage_calendar.profiling.ProfilingMiddleware',  # Opt-in request profiler.
+    'studio_massage_calendar.db.ReplicaRoutingMiddleware',  # Replica reads with read-your-writes pinning.
     'corsheaders.middleware.CorsMiddleware',  # Enable CORS support.
     'django.middleware.common.CommonMiddleware',  # Common HTTP middleware.
     'django.middleware.security.SecurityMiddleware',  # Security-related middleware.
@@ -80,6 +86,101 @@ DATABASES = {
     }
 }
 
+# Local SQLite database instead of PostgreSQL (e.g. for benchmarks): set DJANGO_SQLITE_PATH.
+if os.environ.get('DJANGO_SQLITE_PATH'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',  # Use SQLite database.
+        'NAME': BASE_DIR / os.environ['DJANGO_SQLITE_PATH'],  # Database file, relative to BASE_DIR.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},  # A file, so concurrent tests share it between threads.
+    }
+
+# Read replicas: comma-separated hosts in DJANGO_REPLICA_HOSTS (same credentials as the primary),
+# or a second SQLite file in DJANGO_SQLITE_REPLICA_PATH for local testing.
+DATABASE_REPLICAS = []  # Aliases GET requests may read from (see studio_massage_calendar.db).
+for index, host in enumerate(host for host in os.environ.get('DJANGO_REPLICA_HOSTS', '').split(',') if host.strip()):
+    DATABASES[f'replica_{index + 1}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),  # Replica host.
+        'TEST': {'MIRROR': 'default'},  # Tests read the primary's test database.
+    }
+    DATABASE_REPLICAS.append(f'replica_{index + 1}')
+if os.environ.get('DJANGO_SQLITE_REPLICA_PATH'):
+    DATABASES['replica_1'] = {
+        'ENGINE': 'django.db.backends.sqlite3',  # Use SQLite database.
+        'NAME': BASE_DIR / os.environ['DJANGO_SQLITE_REPLICA_PATH'],  # Replica file, relative to BASE_DIR.
+        'TEST': {'MIRROR': 'default'},  # Tests read the primary's test database.
+    }
+    DATABASE_REPLICAS = ['replica_1']
+DATABASE_ROUTERS = ['studio_massage_calendar.db.ReplicaRouter']  # Reads of GET requests go to replicas.
+REPLICA_PIN_SECONDS = 5  # Seconds a client reads from the primary after writing.
+REPLICA_RETRY_SECONDS = 30  # Seconds an unreachable replica is skipped.
+
+# Cache configuration: computed data per process, versions shared by all processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',  # Local memory cache.
+        'LOCATION': 'studio-massage-calendar',  # Cache instance name.
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',  # Seen by every worker process.
+        'LOCATION': 'shared_cache',  # Table made by the createcachetable command.
+    },
+}
+SHARED_CACHE_ALIAS = 'shared'  # Cache holding the versions all processes must agree on (never local memory).
+SHARED_VERSION_SYNC_INTERVAL = 1  # Seconds a process reuses a version before reading it again.
+
+# Calendar free-interval cache settings.
+CALENDAR_CACHE_ALIAS = 'default'  # Cache used for computed free intervals.
+CALENDAR_FREE_INTERVALS_TIMEOUT = 60 * 60  # Seconds a computed day stays cached.
+CALENDAR_BOOKING_HORIZON_DAYS = 365  # How far ahead weekly availability rules are offered.
+
+# Async slot search.
+ASYNC_SEARCH_BATCH_SIZE = 8  # Employees whose missing days are computed per step before the deadline is checked again.
+ASYNC_SEARCH_DEADLINE = 2.0  # Seconds before the search returns partial results.
+
+# Next available slot search.
+NEXT_AVAILABLE_HORIZON_DAYS = 90  # How far ahead the search looks.
+NEXT_AVAILABLE_MAX_LIMIT = 50  # Upper bound for the limit parameter.
+
+# Service and employee catalog responses.
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60  # Seconds a rendered catalog stays cached.
+CATALOG_MAX_AGE = 0  # Seconds clients may reuse a catalog response without revalidating.
+
+# Set-based availability editing.
+AVAILABILITY_EDIT_MAX_DAYS = 366  # Longest date range one operation may change.
+
+# Utilization reports.
+UTILIZATION_REPORT_MAX_DAYS = 366  # Longest date range of one report.
+
+# iCalendar feeds.
+ICAL_FEED_PAST_DAYS = 30  # Days of past appointments included in a feed.
+
+# Appointment list pagination.
+APPOINTMENTS_PAGE_SIZE = 100  # Default number of appointments per page.
+APPOINTMENTS_MAX_PAGE_SIZE = 1000  # Upper bound for the page_size parameter.
+BATCH_BOOKING_MAX_ITEMS = 50  # Most appointments accepted by one batch booking request.
+
+# Short-lived slot holds during checkout (see the sweep_holds command).
+SLOT_HOLD_SECONDS = 5 * 60  # Seconds a hold keeps its slot for the client.
+SLOT_HOLD_MAX_PER_USER = 3  # Most active holds one client may have at once.
+
+# Request metrics exported at /metrics.
+METRICS_ENABLED = True  # Record per-view latency, query and response size metrics.
+METRICS_DIR = os.environ.get('METRICS_DIR')  # Shared directory for multi-process workers (unset: single process).
+METRICS_FLUSH_INTERVAL = 5  # Seconds between writes of a worker's metrics to METRICS_DIR.
+METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+]  # Client addresses allowed to read /metrics.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token allowing /metrics from any address (unset: none).
+
+# Opt-in request profiler (see the profile_token command).
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'  # Off unless explicitly enabled.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))  # Fraction of requests profiled.
+PROFILING_THRESHOLD_MS = 500  # Sampled requests faster than this are not stored.
+PROFILING_DIR = os.environ.get('PROFILING_DIR', BASE_DIR / 'profiles')  # Directory holding the profiles.
+PROFILING_MAX_FILES = 100  # Number of newest profiles kept.
+PROFILING_TOKEN_MAX_AGE = 60 * 60  # Seconds an X-Profile-Token stays valid.
+
 # Password validation rules.
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},  # Avoid similar passwords.
@@ -97,6 +198,8 @@ USE_TZ = True  # Enable timezone support.
 # CORS configuration.
 CORS_ALLOW_ALL_ORIGINS = True  # Allow all origins (adjust for production).
 CORS_ALLOW_CREDENTIALS = True  # Allow sending credentials.
+CORS_ALLOW_HEADERS = (*default_headers, 'x-primary-pin')  # Token clients echo the replica pin header.
+CORS_EXPOSE_HEADERS = ['X-Primary-Pin']  # Let browser token clients read the pin header.
 
 # Static files configuration.
 STATIC_URL = 'static/'  # URL path for static files.
@@ -107,12 +210,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'  # Use BigAutoField for pri
 # REST framework configuration.
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # Use JWT for authentication.
+        'users.authentication.ClaimsJWTAuthentication',  # Use JWT for authentication, building the user from token claims.
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',  # Default permission: authenticated users only.
     ],
 }
 
+# JWT configuration: tokens carry username, email and role claims (see users.tokens).
+SIMPLE_JWT = {
+    'TOKEN_USER_CLASS': 'users.authentication.ClaimsUser',  # Request user built from the token claims.
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.ClaimsTokenObtainPairSerializer',  # Issue tokens with claims.
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.ClaimsTokenRefreshSerializer',  # Refuse revoked refresh tokens.
+}
+PRINCIPAL_CACHE_TTL = 30  # Seconds an authenticated token is reused without decoding it again.
+PRINCIPAL_CACHE_SIZE = 10000  # Most authenticated tokens kept per process.
+REVOCATION_SYNC_INTERVAL = 1  # Seconds between checks for tokens revoked by other processes.
+REVOCATION_BLOOM_BITS = 1 << 20  # Size of the per-process bloom filter of revoked tokens.
+REVOCATION_BLOOM_HASHES = 7  # Hash functions of the bloom filter.
+ROLES_CACHE_TIMEOUT = 60  # Seconds resolved user roles and permissions stay cached.
+
 # Custom user model.
 AUTH_USER_MODEL = 'users.CustomUser'  # Replace the default user model with the custom one.
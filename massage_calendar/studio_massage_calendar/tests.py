@@ -0,0 +1,260 @@
+import os
+import tempfile
+from datetime import date, time, timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.signing import TimestampSigner
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from calendar_app.models import Appointment, Availability, Employee, Service
+from users.models import CustomUser
+from users.tokens import ClaimsRefreshToken
+from . import db, metrics, profiling, versions
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=60 * 60, SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class MetricsMiddlewareTests(TestCase):
+    """
+    Checks what `MetricsMiddleware` records for sync, async and streaming
+    responses and how `/metrics` exports it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name='Massage', description='', duration=60)
+        cls.employee = Employee.objects.create(name='Anna')
+        cls.employee.services.add(cls.service)
+        cls.date = date.today() + timedelta(days=7)
+        Availability.objects.create(employee=cls.employee, date=cls.date,
+                                    start_time=time(9, 0), end_time=time(17, 0))
+        cls.user = CustomUser.objects.create(username='client', email='client@example.com')
+        for hour in (9, 11, 14):
+            Appointment.objects.create(user=cls.user, service=cls.service, employee=cls.employee,
+                                       date=cls.date, time=time(hour, 0))
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.headers = {'Authorization': f'Bearer {ClaimsRefreshToken.for_user(self.user).access_token}'}
+        self.slots = (reverse('available-slots'), {
+            'date': self.date.isoformat(), 'employee_id': self.employee.id, 'service_id': self.service.id,
+        })
+
+    def histogram(self, name, view):
+        return metrics._histograms.get((name, (('view', view),)))
+
+    def test_queries_are_counted_under_wsgi_and_asgi(self):
+        # Leave out the periodic per-process lookups of the first request
+        self.client.get(*self.slots, headers=self.headers)
+        cache.clear()
+        metrics.reset()
+        self.assertEqual(self.client.get(*self.slots, headers=self.headers).status_code, 200)
+        wsgi = self.histogram('http_request_db_queries', 'available-slots')['sum']
+
+        cache.clear()
+        metrics.reset()
+        response = async_to_sync(self.async_client.get)(*self.slots, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        asgi = self.histogram('http_request_db_queries', 'available-slots')['sum']
+
+        self.assertGreater(wsgi, 0)
+        self.assertEqual(asgi, wsgi)
+
+    def test_streaming_responses_are_recorded_once_sent(self):
+        response = self.client.get(reverse('appointments'), {'export': 'csv'}, headers=self.headers)
+        self.assertIsNone(self.histogram('http_response_size_bytes', 'appointments'))
+
+        body = b''.join(response.streaming_content)
+        self.assertEqual(body.count(b'\n'), 4)
+        self.assertEqual(self.histogram('http_response_size_bytes', 'appointments')['sum'], len(body))
+        self.assertGreater(self.histogram('http_request_db_queries', 'appointments')['sum'], 0)
+
+    def test_metrics_are_exported_in_prometheus_format(self):
+        self.client.get(*self.slots, headers=self.headers)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE http_requests_total counter', lines)
+        self.assertIn('http_requests_total{view="available-slots",method="GET",status="200"} 1', lines)
+        self.assertIn('http_request_db_queries_count{view="available-slots"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="available-slots",le="+Inf"} 1', lines)
+        # Scrapes are not recorded themselves
+        self.assertFalse(any('view="metrics"' in line for line in lines))
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'], METRICS_TOKEN='scrape-secret')
+    def test_metrics_are_only_exported_to_allowed_scrapers(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 200)
+        headers = {'Authorization': 'Bearer scrape-secret'}
+        self.assertEqual(self.client.get(reverse('metrics'), headers=headers).status_code, 200)
+        headers = {'Authorization': 'Bearer wrong'}
+        self.assertEqual(self.client.get(reverse('metrics'), headers=headers).status_code, 403)
+        # An access token of a user is not a scrape token
+        self.assertEqual(self.client.get(reverse('metrics'), headers=self.headers).status_code, 403)
+
+
+class SharedVersionTests(TestCase):
+    """
+    Checks that versions are shared through the shared cache and that a
+    per-process cache is refused for it.
+    """
+
+    def test_versions_of_other_processes_are_read_after_the_interval(self):
+        with override_settings(SHARED_VERSION_SYNC_INTERVAL=60 * 60):
+            versions.replace('test:version')
+            version = versions.get('test:version')
+            # Another process starts a new version
+            versions.shared_cache().set('test:version', 'other', None)
+            self.assertEqual(versions.get('test:version'), version)
+        with override_settings(SHARED_VERSION_SYNC_INTERVAL=0):
+            self.assertEqual(versions.get('test:version'), 'other')
+
+    def test_local_memory_is_refused_as_the_shared_cache(self):
+        self.assertEqual(versions.check_shared_cache(None), [])
+        with override_settings(SHARED_CACHE_ALIAS='default'):
+            self.assertEqual([error.id for error in versions.check_shared_cache(None)],
+                             ['studio_massage_calendar.E001'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+@mock.patch.object(db, 'choose_replica', lambda: 'replica_1')
+class ReplicaRoutingTests(TestCase):
+    """
+    Checks which database the reads of a request are routed to.
+    """
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = db.ReplicaRouter()
+        self.read_from = None
+
+        def view(request):
+            self.read_from = self.router.db_for_read(Appointment)
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        self.middleware = db.ReplicaRoutingMiddleware(view)
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.middleware(self.factory.get('/'))
+        self.assertEqual(self.read_from, 'replica_1')
+        self.middleware(self.factory.post('/'))
+        self.assertEqual(self.read_from, 'default')
+        # Outside a request everything uses the primary
+        self.assertEqual(self.router.db_for_read(Appointment), 'default')
+
+    def test_writes_pin_browsers_with_a_cookie(self):
+        response = self.middleware(self.factory.post('/'))
+        self.assertIn(db.PIN_COOKIE, response.cookies)
+        self.assertNotIn(db.PIN_HEADER, response)
+
+        request = self.factory.get('/')
+        request.COOKIES[db.PIN_COOKIE] = '1'
+        self.middleware(request)
+        self.assertEqual(self.read_from, 'default')
+
+    def test_writes_pin_token_clients_with_an_echoed_header(self):
+        response = self.middleware(self.factory.post('/', HTTP_AUTHORIZATION='Bearer token'))
+        pin = response[db.PIN_HEADER]
+
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Bearer token', HTTP_X_PRIMARY_PIN=pin))
+        self.assertEqual(self.read_from, 'default')
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Bearer token', HTTP_X_PRIMARY_PIN='forged'))
+        self.assertEqual(self.read_from, 'replica_1')
+        with override_settings(REPLICA_PIN_SECONDS=-1):
+            self.middleware(self.factory.get('/', HTTP_X_PRIMARY_PIN=pin))
+        self.assertEqual(self.read_from, 'replica_1')
+
+    def test_pins_signed_for_another_purpose_are_refused(self):
+        pin = TimestampSigner().sign('primary')
+        self.middleware(self.factory.get('/', HTTP_X_PRIMARY_PIN=pin))
+        self.assertEqual(self.read_from, 'replica_1')
+
+    def test_failed_writes_do_not_pin(self):
+        middleware = db.ReplicaRoutingMiddleware(lambda request: HttpResponse(status=400))
+        response = middleware(self.factory.post('/', HTTP_AUTHORIZATION='Bearer token'))
+        self.assertNotIn(db.PIN_COOKIE, response.cookies)
+        self.assertNotIn(db.PIN_HEADER, response)
+
+    def test_shared_cache_reads_use_the_primary(self):
+        def view(request):
+            self.read_from = self.router.db_for_read(caches['shared'].cache_model_class)
+            return HttpResponse()
+
+        db.ReplicaRoutingMiddleware(view)(self.factory.get('/'))
+        self.assertEqual(self.read_from, 'default')
+
+
+class ProfilingTests(TestCase):
+    """
+    Checks which requests the profiler records and how profiles are kept
+    and served.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(PROFILING_ENABLED=True, PROFILING_DIR=self.directory,
+                                      PROFILING_SAMPLE_RATE=0, PROFILING_THRESHOLD_MS=60 * 1000,
+                                      PROFILING_MAX_FILES=2)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.factory = RequestFactory()
+
+    def profile(self, request):
+        def view(request):
+            CustomUser.objects.count()
+            return HttpResponse()
+
+        profiling.ProfilingMiddleware(view)(request)
+
+    def profiles(self):
+        return sorted(name for name in os.listdir(self.directory) if profiling.PROFILE_NAME.match(name))
+
+    def test_disabled_profiler_leaves_the_stack(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.ProfilingMiddleware(HttpResponse)
+
+    def test_requests_with_a_valid_token_are_profiled(self):
+        out = StringIO()
+        call_command('profile_token', stdout=out)
+        self.profile(self.factory.get('/', HTTP_X_PROFILE_TOKEN=out.getvalue().strip()))
+        self.profile(self.factory.get('/', HTTP_X_PROFILE_TOKEN='forged'))
+        with override_settings(PROFILING_TOKEN_MAX_AGE=-1):
+            self.profile(self.factory.get('/', HTTP_X_PROFILE_TOKEN=profiling.make_token()))
+
+        response = APIClient().get(reverse('profiles'))
+        self.assertIn(response.status_code, (401, 403))
+        api = APIClient()
+        api.force_authenticate(CustomUser.objects.create(username='admin', email='admin@example.com',
+                                                         is_staff=True))
+        profiles = api.get(reverse('profiles')).data
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['trigger'], 'token')
+        self.assertEqual(profiles[0]['query_count'], 1)
+
+        response = api.get(reverse('profile-download', args=[profiles[0]['name']]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('COUNT', b''.join(response.streaming_content).decode())
+        self.assertEqual(api.get(reverse('profile-download', args=['missing.json'])).status_code, 404)
+
+    def test_sampled_requests_are_kept_when_slow(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            self.profile(self.factory.get('/'))
+        self.assertEqual(self.profiles(), [])
+
+        with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_THRESHOLD_MS=0):
+            for _ in range(3):
+                self.profile(self.factory.get('/'))
+        # Only the newest PROFILING_MAX_FILES are kept
+        self.assertEqual(len(self.profiles()), 2)
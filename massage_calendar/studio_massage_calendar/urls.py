@@ -1,8 +1,14 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from .metrics import metrics_view
+from .profiling import list_profiles, download_profile
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('users.urls')),
     path('api/calendar/', include('calendar_app.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/profiles/', list_profiles, name='profiles'),
+    path('api/profiles/<str:name>/', download_profile, name='profile-download'),
 ]
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+Version tokens shared by all worker processes.
+
+Data that each process caches for itself, such as resolved roles or rendered
+catalogs, is keyed by a version token, and a change replaces the token. The
+tokens live in the `SHARED_CACHE_ALIAS` cache, which every process must see:
+the database cache by default, and a system check refuses a per-process
+backend. A process reuses a token it has read for
+`SHARED_VERSION_SYNC_INTERVAL` seconds, so hot paths take no query and a
+change made in another process is picked up within that interval.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, Tags, register
+
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+# key -> (version, monotonic time it was read)
+_versions = {}
+
+
+def shared_cache():
+    return caches[getattr(settings, 'SHARED_CACHE_ALIAS', 'default')]
+
+
+def get(key):
+    """
+    Return the current version under `key`, starting one if the shared cache
+    has none (e.g. after it was cleared).
+    """
+    now = time.monotonic()
+    entry = _versions.get(key)
+    if entry is not None and now - entry[1] < getattr(settings, 'SHARED_VERSION_SYNC_INTERVAL', 1):
+        return entry[0]
+    version = shared_cache().get(key)
+    if version is None:
+        shared_cache().add(key, uuid.uuid4().hex, None)
+        version = shared_cache().get(key)
+    _versions[key] = (version, now)
+    return version
+
+
+def replace(key):
+    """
+    Start a new version under `key`. This process sees it at once, the
+    others within `SHARED_VERSION_SYNC_INTERVAL` seconds.
+    """
+    version = uuid.uuid4().hex
+    shared_cache().set(key, version, None)
+    _versions[key] = (version, time.monotonic())
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    alias = getattr(settings, 'SHARED_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in LOCAL_BACKENDS:
+        return [Error(
+            f"The shared cache '{alias}' uses {backend}, which other processes cannot see.",
+            hint='Point SHARED_CACHE_ALIAS at a database, Redis or Memcached cache.',
+            id='studio_massage_calendar.E001',
+        )]
+    return []
@@ -0,0 +1,201 @@
+import csv
+import json
+import os
+import time as timer
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.models import CustomUser
+
+TEXT_FIELDS = ('username', 'email', 'first_name', 'last_name', 'password', 'password_hash')
+
+
+def _init_worker():
+    # Workers started with "spawn" (e.g. on macOS) need their own setup
+    django.setup()
+
+
+def read_records(path, file_format):
+    """
+    Yield the records of a CSV file with a header row or of a JSONL file,
+    one at a time. A JSONL line that is not valid JSON is yielded as its
+    text, so it is rejected like any other invalid record instead of ending
+    the import.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        yield line.rstrip('\r\n')
+
+
+def clean_record(record):
+    """
+    Return an unsaved user built from a record, without its password, and
+    None, or None and the reason the record is invalid. Runs the model field
+    validation (username characters, email format, lengths) but no queries.
+    """
+    if not isinstance(record, dict):
+        return None, 'Not a JSON object'
+    if any(record.get(field) is not None and not isinstance(record[field], str) for field in TEXT_FIELDS):
+        return None, 'Fields must be text'
+    password_hash = record.get('password_hash') or ''
+    if password_hash:
+        try:
+            identify_hasher(password_hash)
+        except ValueError:
+            return None, 'Unknown password hash format'
+    user = CustomUser(
+        username=(record.get('username') or '').strip(),
+        email=(record.get('email') or '').strip(),
+        first_name=(record.get('first_name') or '').strip(),
+        last_name=(record.get('last_name') or '').strip()
+    )
+    try:
+        user.full_clean(exclude=['password'], validate_unique=False, validate_constraints=False)
+    except ValidationError as error:
+        return None, '; '.join(
+            f'{field}: {message}' for field, messages in error.message_dict.items() for message in messages
+        )
+    return user, None
+
+
+class Command(BaseCommand):
+    help = ('Import client accounts from a CSV (with a header row) or JSONL file with '
+            'username, email, optional first_name/last_name and either a plain password '
+            'or a pre-hashed password_hash. Invalid rows and rows whose username or email '
+            'is taken are skipped. Progress is saved after every chunk, so an interrupted '
+            'import continues where it stopped when run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Records checked, hashed and inserted together')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes hashing passwords')
+        parser.add_argument('--state-file',
+                            help='Progress file for resuming (default: <path>.progress)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore saved progress and start from the first record')
+        parser.add_argument('--rejects', help='Write skipped records with the reason to this JSONL file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'File not found: {path}')
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('Chunk size and workers must be positive')
+        state_file = options['state_file'] or f'{path}.progress'
+
+        state = {'processed': 0, 'created': 0, 'skipped': 0}
+        if not options['restart'] and os.path.isfile(state_file):
+            with open(state_file) as file:
+                state.update(json.load(file))
+            self.stdout.write(f"Resuming after {state['processed']} records")
+
+        records = islice(read_records(path, file_format), state['processed'], None)
+        rejects = open(options['rejects'], 'a', encoding='utf-8') if options['rejects'] else None
+        started = timer.monotonic()
+        processed = 0
+        try:
+            with ProcessPoolExecutor(options['workers'], initializer=_init_worker) as pool:
+                while True:
+                    chunk = list(islice(records, options['chunk_size']))
+                    if not chunk:
+                        break
+                    users, skipped = self._prepare(chunk, pool, options['workers'])
+                    with transaction.atomic():
+                        CustomUser.objects.bulk_create(users)
+                    if rejects:
+                        for record, reason in skipped:
+                            rejects.write(json.dumps({'reason': reason, 'record': record}) + '\n')
+                        rejects.flush()
+
+                    processed += len(chunk)
+                    state['processed'] += len(chunk)
+                    state['created'] += len(users)
+                    state['skipped'] += len(skipped)
+                    self._save_state(state_file, state)
+                    elapsed = timer.monotonic() - started
+                    self.stdout.write(
+                        f"{state['processed']} records: {state['created']} created, "
+                        f"{state['skipped']} skipped ({processed / elapsed:.0f} records/s)"
+                    )
+        finally:
+            if rejects:
+                rejects.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Import finished: {state['created']} users created, {state['skipped']} records skipped "
+            f"in {timer.monotonic() - started:.1f}s"
+        ))
+
+    def _prepare(self, chunk, pool, workers):
+        """
+        Validate a chunk of records, check uniqueness against the database
+        with two queries and hash the plain passwords across the pool.
+        Returns the users to insert and the `(record, reason)` pairs skipped.
+        """
+        skipped = []
+        valid = []
+        for record in chunk:
+            user, reason = clean_record(record)
+            if user is None:
+                skipped.append((record, reason))
+            else:
+                valid.append((record, user))
+
+        taken_usernames = set(CustomUser.objects.filter(
+            username__in=[user.username for _, user in valid]
+        ).values_list('username', flat=True))
+        taken_emails = set(CustomUser.objects.filter(
+            email__in=[user.email for _, user in valid]
+        ).values_list('email', flat=True))
+
+        accepted = []
+        for record, user in valid:
+            if user.username in taken_usernames:
+                skipped.append((record, 'Username already taken'))
+            elif user.email in taken_emails:
+                skipped.append((record, 'Email already registered'))
+            else:
+                # Also rejects duplicates later in the same file
+                taken_usernames.add(user.username)
+                taken_emails.add(user.email)
+                accepted.append((record, user))
+
+        passwords = [record.get('password') for record, _ in accepted
+                     if not record.get('password_hash') and record.get('password')]
+        chunksize = max(1, len(passwords) // (4 * workers))
+        hashes = iter(pool.map(make_password, passwords, chunksize=chunksize))
+
+        users = []
+        for record, user in accepted:
+            if record.get('password_hash'):
+                user.password = record['password_hash']
+            elif record.get('password'):
+                user.password = next(hashes)
+            else:
+                user.password = make_password(None)
+            users.append(user)
+        return users, skipped
+
+    def _save_state(self, state_file, state):
+        temporary = f'{state_file}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(state, file)
+        os.replace(temporary, state_file)
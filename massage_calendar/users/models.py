@@ -1,9 +1,34 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from . import roles
+
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
 
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
+
+    @property
+    def roles(self):
+        return roles.get_roles(self.pk)
+
+    @property
+    def is_manager(self):
+        return roles.MANAGERS in self.roles
+
+
+class RevokedToken(models.Model):
+    """
+    A JWT revoked before its expiry (e.g. on logout). Rows are only needed
+    until the token would have expired anyway.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,38 @@
+"""
+DRF permission classes backed by the cached roles of `users.roles`.
+"""
+from rest_framework.permissions import BasePermission
+
+from . import roles
+
+
+class HasRole(BasePermission):
+    """
+    Allows access to authenticated users with any of `allowed_roles`.
+    """
+    allowed_roles = ()
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and roles.get_roles(user.pk) & set(self.allowed_roles))
+
+
+class IsManager(HasRole):
+    """
+    Allows access to managers only.
+    """
+    allowed_roles = (roles.MANAGERS,)
+
+
+class IsStaff(HasRole):
+    """
+    Allows access to staff users only.
+    """
+    allowed_roles = (roles.STAFF,)
+
+
+class IsManagerOrStaff(HasRole):
+    """
+    Allows access to managers and staff users.
+    """
+    allowed_roles = (roles.MANAGERS, roles.STAFF)
@@ -0,0 +1,146 @@
+"""
+Revocation list for JWTs.
+
+Revoked tokens are stored in `RevokedToken` until they would have expired.
+Every process keeps a bloom filter of the revoked ids, so the check for a
+token that was never revoked (nearly every request) costs no query; only a
+bloom filter hit is confirmed against the table. The generation of the list
+is the number of rows and the highest id in the table, which every
+revocation changes, so every process sees revocations made by the others without any shared cache. Each
+process reads it at most every REVOCATION_SYNC_INTERVAL seconds and rebuilds
+its filter when it has changed.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Fixed-size bloom filter over strings.
+    """
+    def __init__(self, bits, hashes):
+        self.size = bits
+        self.hashes = hashes
+        self.bits = bytearray((bits + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=8 * self.hashes).digest()
+        for index in range(self.hashes):
+            yield int.from_bytes(digest[8 * index:8 * index + 8], 'big') % self.size
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, value):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(value))
+
+
+_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_state = {'generation': None, 'checked_at': None, 'bloom': None}
+_listeners = []
+
+
+def _new_bloom():
+    return BloomFilter(getattr(settings, 'REVOCATION_BLOOM_BITS', 1 << 20),
+                       getattr(settings, 'REVOCATION_BLOOM_HASHES', 7))
+
+
+def on_change(listener):
+    """
+    Register a callable run whenever the revocation list may have changed,
+    e.g. to drop cached principals.
+    """
+    _listeners.append(listener)
+
+
+def _notify():
+    for listener in _listeners:
+        listener()
+
+
+def _is_fresh():
+    checked_at = _state['checked_at']
+    return (
+        _state['bloom'] is not None
+        and checked_at is not None
+        and time.monotonic() - checked_at < getattr(settings, 'REVOCATION_SYNC_INTERVAL', 1)
+    )
+
+
+def sync():
+    """
+    Rebuild the bloom filter from the table when another process revoked a
+    token since the last check. Cheap to call on every request.
+
+    One thread syncs at a time. While it does, threads of a process that
+    already has a filter keep using it, and the first requests of a new
+    process wait for the first filter.
+    """
+    if _is_fresh():
+        return
+    if not _sync_lock.acquire(blocking=_state['bloom'] is None):
+        return
+    try:
+        # Another thread may have synced while this one waited
+        if _is_fresh():
+            return
+        # Revoking inserts a row. The count also catches rows committed
+        # after one with a higher id
+        generation = tuple(RevokedToken.objects.aggregate(count=Count('id'), last=Max('id')).values())
+        changed = generation != _state['generation'] or _state['bloom'] is None
+        if changed:
+            bloom = _new_bloom()
+            for jti in RevokedToken.objects.filter(
+                expires_at__gt=timezone.now()
+            ).values_list('jti', flat=True).iterator():
+                bloom.add(jti)
+            with _lock:
+                _state['bloom'] = bloom
+                _state['generation'] = generation
+        _state['checked_at'] = time.monotonic()
+    finally:
+        _sync_lock.release()
+    if changed:
+        _notify()
+
+
+def is_revoked(jti):
+    """
+    Whether the token with the given id has been revoked.
+    """
+    sync()
+    bloom = _state['bloom']
+    # Without a filter (the first sync failed) every check goes to the table
+    if bloom is not None and jti not in bloom:
+        return False
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+
+def revoke(token):
+    """
+    Revoke a validated token until its expiry and purge entries of tokens
+    that have expired in the meantime.
+    """
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    RevokedToken.objects.get_or_create(
+        jti=token['jti'],
+        defaults={'user_id': token.get(settings.SIMPLE_JWT.get('USER_ID_CLAIM', 'user_id')),
+                  'expires_at': expires_at}
+    )
+    RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    with _lock:
+        if _state['bloom'] is None:
+            _state['bloom'] = _new_bloom()
+        _state['bloom'].add(token['jti'])
+    # Other processes rebuild their filters when they see the new row
+    _notify()
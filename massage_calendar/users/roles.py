@@ -0,0 +1,99 @@
+"""
+Cached role and permission resolution.
+
+A user's roles are the lowercased names of their groups, plus `staff` and
+`superuser` for the matching flags and `active` while the account is active.
+Inactive users have no roles at all. They are resolved with one query and
+kept in the process cache for ROLES_CACHE_TIMEOUT seconds, so permission
+checks on hot endpoints take no query. Permissions (the `app_label.codename`
+strings Django uses) are resolved and cached separately, only when asked
+for. Entries are keyed by a generation shared by all processes (see
+`studio_massage_calendar.versions`), and the signal handlers in
+`users.signals` start a new one after every change, so a demoted user loses
+their roles in every process within SHARED_VERSION_SYNC_INTERVAL seconds.
+"""
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+
+from studio_massage_calendar import versions
+
+MANAGERS = 'managers'
+STAFF = 'staff'
+SUPERUSER = 'superuser'
+ACTIVE = 'active'
+
+GENERATION_KEY = 'users:roles:generation'
+KEY_PREFIX = 'users:roles'
+
+
+def _cache():
+    return caches[getattr(settings, 'ROLES_CACHE_ALIAS', 'default')]
+
+
+def _keys(user_id):
+    generation = versions.get(GENERATION_KEY)
+    return f'{KEY_PREFIX}:{generation}:{user_id}', f'{KEY_PREFIX}:{generation}:{user_id}:permissions'
+
+
+def get_roles(user_id):
+    """
+    Return the frozenset of role names of a user.
+    """
+    from .models import CustomUser
+
+    key, _ = _keys(user_id)
+    roles = _cache().get(key)
+    if roles is None:
+        roles = set()
+        for is_staff, is_superuser, group in CustomUser.objects.filter(
+            pk=user_id, is_active=True
+        ).values_list('is_staff', 'is_superuser', 'groups__name'):
+            roles.add(ACTIVE)
+            if is_staff:
+                roles.add(STAFF)
+            if is_superuser:
+                roles.add(SUPERUSER)
+            if group:
+                roles.add(group.lower())
+        roles = frozenset(roles)
+        _cache().set(key, roles, getattr(settings, 'ROLES_CACHE_TIMEOUT', 60))
+    return roles
+
+
+def is_active(user_id):
+    """
+    Whether the user exists and their account is active.
+    """
+    return ACTIVE in get_roles(user_id)
+
+
+def get_permissions(user_id):
+    """
+    Return the frozenset of `app_label.codename` permissions of a user,
+    granted directly or through groups. Superusers get every permission.
+    """
+    _, key = _keys(user_id)
+    permissions = _cache().get(key)
+    if permissions is None:
+        queryset = Permission.objects.all()
+        if SUPERUSER not in get_roles(user_id):
+            queryset = queryset.filter(Q(user__pk=user_id) | Q(group__user__pk=user_id))
+        permissions = frozenset(
+            f'{app_label}.{codename}'
+            for app_label, codename in queryset.values_list('content_type__app_label', 'codename').distinct()
+        )
+        _cache().set(key, permissions, getattr(settings, 'ROLES_CACHE_TIMEOUT', 60))
+    return permissions
+
+
+def invalidate():
+    """
+    Start a new generation once the current transaction commits, dropping
+    the cached roles and permissions of every user in every process. Role
+    changes are rare, so one shared generation is cheaper to check than a
+    version per user.
+    """
+    transaction.on_commit(lambda: versions.replace(GENERATION_KEY))
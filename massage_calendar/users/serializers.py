@@ -1,5 +1,12 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import revocation, roles
 from .models import CustomUser
+from .tokens import ClaimsRefreshToken
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -70,4 +77,26 @@ class UserSerializer(serializers.ModelSerializer):
         """
         model = CustomUser
         fields = ('id', 'username', 'email')
-        read_only_fields = ('id',)
\ No newline at end of file
+        read_only_fields = ('id',)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Serializer for obtaining tokens carrying the user claims (see `users.tokens`).
+    """
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Serializer for refreshing tokens.
+    - Rejects refresh tokens revoked on logout.
+    - Rejects refresh tokens of deactivated users.
+    """
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if revocation.is_revoked(refresh['jti']):
+            raise TokenError('Token has been revoked')
+        if not roles.is_active(refresh.get(settings.SIMPLE_JWT.get('USER_ID_CLAIM', 'user_id'))):
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return super().validate(attrs)
@@ -0,0 +1,36 @@
+"""
+Signal handlers dropping cached roles and permissions (see `users.roles`)
+when group memberships, permissions or the user flags change.
+"""
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import roles
+from .models import CustomUser
+
+ROLE_FIELDS = {'is_active', 'is_staff', 'is_superuser'}
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_memberships(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        roles.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, created=False, **kwargs):
+    if not created:
+        roles.invalidate()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user(sender, created=False, update_fields=None, **kwargs):
+    # Saves of other fields only, such as last_login on every login, keep the roles
+    if created or (update_fields is not None and not ROLE_FIELDS.intersection(update_fields)):
+        return
+    roles.invalidate()
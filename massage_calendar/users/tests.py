@@ -1,3 +1,248 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from studio_massage_calendar import versions
+from . import revocation, roles
+from .models import CustomUser, RevokedToken
+from .permissions import IsManager
+from .tokens import ClaimsRefreshToken
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=0)
+class RevocationTests(TestCase):
+    """
+    Revoked tokens are refused in every process, not only in the one that
+    revoked them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='client', email='client@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.token = ClaimsRefreshToken.for_user(self.user).access_token
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_logout_revokes_the_token(self):
+        self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 200)
+        self.assertEqual(self.api.post(reverse('user-logout')).status_code, 200)
+        self.assertTrue(RevokedToken.objects.filter(jti=self.token['jti']).exists())
+        self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 401)
+
+    def test_revocation_by_another_process_is_noticed(self):
+        self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 200)
+        # Another process only leaves the row behind
+        RevokedToken.objects.create(jti=self.token['jti'], user=self.user,
+                                    expires_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 401)
+
+
+class RevocationSyncTests(TransactionTestCase):
+    """
+    The first sync of a process must not let other threads check tokens
+    against a filter that does not exist yet.
+    """
+
+    def test_concurrent_first_checks_wait_for_the_filter(self):
+        new_bloom = revocation._new_bloom
+
+        def slow_bloom():
+            time.sleep(0.05)
+            return new_bloom()
+
+        errors = []
+        barrier = threading.Barrier(4)
+
+        def check():
+            try:
+                barrier.wait()
+                self.assertFalse(revocation.is_revoked('never-revoked'))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        state = {'generation': None, 'checked_at': None, 'bloom': None}
+        with mock.patch.dict(revocation._state, state), mock.patch.object(revocation, '_new_bloom', slow_bloom):
+            threads = [threading.Thread(target=check) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+
+
+class DeactivationTests(TestCase):
+    """
+    A deactivated user is refused at once, with any access or refresh token.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='client', email='client@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.refresh = ClaimsRefreshToken.for_user(self.user)
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def test_deactivated_users_are_refused(self):
+        self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 200)
+        self.assertEqual(
+            self.client.post(reverse('token_refresh'), {'refresh': str(self.refresh)}).status_code, 200
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        # The principal of the token is cached, the account state is not
+        self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 401)
+        self.assertEqual(
+            self.client.post(reverse('token_refresh'), {'refresh': str(self.refresh)}).status_code, 401
+        )
+
+    def test_deactivation_in_another_process_is_seen_after_the_sync_interval(self):
+        with override_settings(SHARED_VERSION_SYNC_INTERVAL=60 * 60):
+            self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 200)
+            # Another process deactivates the user and starts a new generation
+            CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+            versions.shared_cache().set(roles.GENERATION_KEY, 'deactivated', None)
+            self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 200)
+        with override_settings(SHARED_VERSION_SYNC_INTERVAL=0):
+            self.assertEqual(self.api.get(reverse('user-current-user')).status_code, 401)
+
+
+@override_settings(SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+class RolesTests(TestCase):
+    """
+    Cached roles are dropped in every process when they change.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create(username='manager', email='manager@example.com')
+        cls.manager.groups.add(Group.objects.create(name='Managers'))
+
+    def setUp(self):
+        cache.clear()
+        self.request = SimpleNamespace(user=self.manager)
+
+    @override_settings(SHARED_VERSION_SYNC_INTERVAL=60 * 60)
+    def test_roles_are_cached_until_groups_change(self):
+        versions.get(roles.GENERATION_KEY)
+        with self.assertNumQueries(1):
+            self.assertTrue(IsManager().has_permission(self.request, None))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.manager.is_manager)
+            self.assertTrue(IsManager().has_permission(self.request, None))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager.groups.clear()
+        self.assertFalse(IsManager().has_permission(self.request, None))
+
+    def test_demotion_in_another_process_is_seen_after_the_sync_interval(self):
+        self.assertTrue(IsManager().has_permission(self.request, None))
+        # Another process removes the group and starts a new generation
+        CustomUser.groups.through.objects.filter(customuser=self.manager).delete()
+        versions.shared_cache().set(roles.GENERATION_KEY, 'other', None)
+        self.assertTrue(IsManager().has_permission(self.request, None))
+        with override_settings(SHARED_VERSION_SYNC_INTERVAL=0):
+            self.assertFalse(IsManager().has_permission(self.request, None))
+
+    def test_logins_keep_the_cached_roles(self):
+        generation = versions.get(roles.GENERATION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager.save(update_fields=['last_login'])
+        self.assertEqual(versions.get(roles.GENERATION_KEY), generation)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager.is_staff = True
+            self.manager.save()
+        self.assertNotEqual(versions.get(roles.GENERATION_KEY), generation)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportUsersTests(TestCase):
+    """
+    Checks that `import_users` imports the valid records and sends every
+    other one, malformed lines included, to the rejects file.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'clients.jsonl')
+        self.rejects = os.path.join(directory.name, 'rejects.jsonl')
+        CustomUser.objects.create(username='taken', email='taken@example.com')
+
+    def run_import(self, lines, *args):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        call_command('import_users', self.path, '--workers', '1', '--rejects', self.rejects, *args,
+                     stdout=StringIO())
+
+    def rejected(self):
+        with open(self.rejects, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_invalid_records_are_rejected_without_stopping_the_import(self):
+        self.run_import([
+            json.dumps({'username': 'anna', 'email': 'anna@example.com', 'password': 'secret-password'}),
+            '{"username": "broken", ',
+            json.dumps(['not', 'an', 'object']),
+            json.dumps({'username': 'nomail'}),
+            json.dumps({'username': 'bad mail', 'email': 'not-an-email'}),
+            json.dumps({'username': 'has spaces', 'email': 'spaces@example.com'}),
+            json.dumps({'username': 'number', 'email': 'number@example.com', 'first_name': 7}),
+            json.dumps({'username': 'taken', 'email': 'new@example.com'}),
+            json.dumps({'username': 'hashed', 'email': 'hashed@example.com',
+                        'password_hash': make_password('secret-password'), 'last_name': 'Nowak'}),
+            json.dumps({'username': 'again', 'email': 'anna@example.com'}),
+        ], '--chunk-size', '4')
+
+        self.assertEqual(
+            set(CustomUser.objects.values_list('username', flat=True)), {'taken', 'anna', 'hashed'}
+        )
+        self.assertTrue(CustomUser.objects.get(username='anna').check_password('secret-password'))
+        self.assertEqual(CustomUser.objects.get(username='hashed').last_name, 'Nowak')
+
+        rejected = self.rejected()
+        self.assertEqual(len(rejected), 8)
+        self.assertEqual(rejected[0], {'reason': 'Not a JSON object', 'record': '{"username": "broken", '})
+        reasons = [reject['reason'] for reject in rejected]
+        self.assertIn('Fields must be text', reasons)
+        self.assertIn('Username already taken', reasons)
+        self.assertIn('Email already registered', reasons)
+        self.assertTrue(any(reason.startswith('email:') for reason in reasons))
+        self.assertTrue(any(reason.startswith('username:') for reason in reasons))
+
+        with open(f'{self.path}.progress') as file:
+            self.assertEqual(json.load(file), {'processed': 10, 'created': 2, 'skipped': 8})
+
+    def test_a_second_run_resumes_after_the_saved_progress(self):
+        lines = [json.dumps({'username': f'client{i}', 'email': f'client{i}@example.com'}) for i in range(3)]
+        self.run_import(lines)
+        self.run_import(lines + [json.dumps({'username': 'late', 'email': 'late@example.com'})])
+        self.assertEqual(CustomUser.objects.count(), 5)
+        self.assertEqual(self.rejected(), [])
@@ -0,0 +1,28 @@
+"""
+JWTs carrying the claims the API needs to build the request user without a
+database lookup (see `users.authentication`).
+"""
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+def user_role(user):
+    """
+    Return the role of a user as stored in the "role" claim.
+    """
+    return 'manager' if user.is_manager else 'client'
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token with username, email, role and staff claims. Access tokens
+    created from it copy the claims.
+    """
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['username'] = user.username
+        token['email'] = user.email
+        token['role'] = user_role(user)
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
@@ -2,10 +2,13 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from . import revocation
 from .models import CustomUser
 from .serializers import UserSerializer, UserRegistrationSerializer
+from .tokens import ClaimsRefreshToken
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -48,7 +51,7 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'user': UserSerializer(user).data,
                 'message': 'User registered successfully',
@@ -78,7 +81,7 @@ class UserViewSet(viewsets.ModelViewSet):
         user = authenticate(username=username, password=password)
 
         if user:
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'user': UserSerializer(user).data,
                 'tokens': {
@@ -109,8 +112,18 @@ class UserViewSet(viewsets.ModelViewSet):
     def logout(self, request):
         """
         Handle logout for authenticated users.
-        - Currently, this only returns a success message.
-        - Additional functionality (e.g., token blacklisting) can be added for JWT-based logout.
+        - Revokes the access token used for the request until it expires.
+        - Also revokes the refresh token passed as `refresh`, if any.
         """
-        # Additional token blacklisting can be added here if using JWT.
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                refresh = RefreshToken(refresh)
+            except TokenError:
+                return Response({'error': 'Invalid refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+            if str(refresh.get('user_id')) != str(request.user.id):
+                return Response({'error': 'Invalid refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+            revocation.revoke(refresh)
+        if request.auth is not None:
+            revocation.revoke(request.auth)
         return Response({'detail': 'Successfully logged out.'}, status=status.HTTP_200_OK)